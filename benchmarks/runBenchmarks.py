@@ -0,0 +1,207 @@
+###############################################################################
+# Imagery Cataloguing Benchmarks
+# Purpose: time the stages of deliveredImageryFolder, zipFileExtents, the
+#   archive indexing used by imageryZip and the image statistics behind
+#   ImageryGDB.applyStretch on synthetic deliveries (see
+#   syntheticDeliveries), and keep the results as JSON baselines that later
+#   runs are compared against
+#
+# Usage: python benchmarks/runBenchmarks.py --sizes 10,100,1000 --label before_change
+#        python benchmarks/runBenchmarks.py --sizes 10,100,1000 --compare benchmarks/baselines/before_change.json
+#   Deliveries are generated once in the workspace and reused by later runs; 50000 tile deliveries
+#   take a few GB of disk and are best run with --repeat 1
+###############################################################################
+
+import os, sys, json, time, shutil, logging, argparse, platform, datetime, subprocess, tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import syntheticDeliveries
+from ImageryObjects import imageryExtents, archiveIndex, boundaryIndex, vendorMetadata, imageStatistics
+
+baselineFolder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+def timeRuns(func, repeat, setup=None):
+    ''' RETURNS [list of floats] - seconds taken by func in each of repeat runs; setup is run, untimed, before each '''
+    runs = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return(runs)
+
+def clearCaches():
+    ''' Forget parsed sidecars so every run reads them again '''
+    vendorMetadata._readCached.cache_clear()
+    vendorMetadata.folderSidecars.cache_clear()
+
+def removeFile(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+def forget(obj, *attributes):
+    ''' Drop the results deliveredImageryFolder and zipFileExtents keep between calls '''
+    for a in attributes:
+        if hasattr(obj, a):
+            delattr(obj, a)
+
+def benchmarkFolder(paths, outFolder, boundaries, repeat, zipWorkers, batchSize=256):
+    ''' Time every stage of deliveredImageryFolder on one delivery; the metadata summary is also timed
+        streamed in batches of batchSize tiles, and the (uncached) statistics of its tiles are read
+
+    RETURNS
+    [dictionary] - benchmark name: list of seconds
+    '''
+    results = {}
+    newFolder = lambda: imageryExtents.deliveredImageryFolder(paths['folder'], outFolder, boundaries)
+    results['deliveredImageryFolder.__init__'] = timeRuns(newFolder, repeat, clearCaches)
+    imgFolder = newFolder()
+    results['deliveredImageryFolder.findImages'] = timeRuns(imgFolder.findImages, repeat)
+    results['deliveredImageryFolder.getMetadata'] = timeRuns(imgFolder.getMetadata, repeat,
+        lambda: (clearCaches(), forget(imgFolder, 'headers', 'footprints', 'allMetadata')))
+    results['deliveredImageryFolder.summarizeMetadata'] = timeRuns(imgFolder.summarizeMetadata, repeat,
+        lambda: forget(imgFolder, 'metadataSummary'))
+    streamed = imageryExtents.deliveredImageryFolder(paths['folder'], outFolder, boundaries, batchSize=batchSize)
+    results['deliveredImageryFolder.summarizeMetadata.streamed'] = timeRuns(streamed.summarizeMetadata, repeat,
+        lambda: (clearCaches(), forget(streamed, 'metadataSummary', 'metadataSpool')))
+    results['imageStatistics.scanStatistics'] = timeRuns(lambda: imageStatistics.scanStatistics(imgFolder.allImages), repeat)
+    results['deliveredImageryFolder.identifyCountries'] = timeRuns(imgFolder.identifyCountries, repeat)
+    results['deliveredImageryFolder.generateFilename'] = timeRuns(imgFolder.generateFilename, repeat,
+        lambda: forget(imgFolder, 'fileName'))
+    results['deliveredImageryFolder.zipData'] = timeRuns(lambda: imgFolder.zipData(zipWorkers), repeat,
+        lambda: removeFile(imgFolder.zipFile))
+    results['deliveredImageryFolder.createJSON'] = timeRuns(lambda: imgFolder.createJSON(pNumber="P000000"), repeat,
+        lambda: removeFile(imgFolder.jsonFile))
+    results['deliveredImageryFolder.getImageryExtents'] = timeRuns(lambda: imgFolder.getImageryExtents(paths['folder']), repeat,
+        lambda: forget(imgFolder, 'imageryExtents'))
+    removeFile(imgFolder.zipFile)
+    removeFile(imgFolder.jsonFile)
+    return(results)
+
+def benchmarkArchives(paths, repeat):
+    ''' Time zipFileExtents (extracted and in archive) and the archive indexing and verification behind
+        imageryZip.checkForSource on one delivery
+
+    RETURNS
+    [dictionary] - benchmark name: list of seconds
+    '''
+    results = {}
+    extracted = lambda: imageryExtents.zipFileExtents(paths['zip'], "BENCH", paths['folder']).getImageryExtents(paths['folder'])
+    results['zipFileExtents.getImageryExtents.extracted'] = timeRuns(extracted, repeat)
+    for kind in ['zip', 'tar']:
+        inArchive = lambda: imageryExtents.zipFileExtents(paths[kind], "BENCH", "", inArchive=True).getImageryExtents(None)
+        results['zipFileExtents.getImageryExtents.%s' % kind] = timeRuns(inArchive, repeat)
+        results['archiveIndex.readArchiveIndex.%s' % kind] = timeRuns(lambda: archiveIndex.readArchiveIndex(paths[kind]), repeat)
+    members = archiveIndex.readArchiveIndex(paths['zip'])
+    results['archiveIndex.verifyExtraction'] = timeRuns(
+        lambda: archiveIndex.verifyExtraction(members, paths['folder'], ['.tif', '.tiff']), repeat)
+    return(results)
+
+def environment():
+    ''' Versions and machine details stored with every baseline '''
+    import geopandas, rasterio, shapely
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        commit = None
+    return({'python':platform.python_version(), 'platform':platform.platform(), 'processor':platform.processor(),
+            'cpus':os.cpu_count(), 'gdal':rasterio.__gdal_version__, 'rasterio':rasterio.__version__,
+            'shapely':shapely.__version__, 'geopandas':geopandas.__version__, 'commit':commit})
+
+def runBenchmarks(sizes, vendors, workspace, repeat=3, tileSize=64, zipWorkers=4):
+    ''' Generate (or reuse) the synthetic deliveries and time every benchmark on each of them
+
+    RETURNS
+    [list of dictionaries] - benchmark, vendor, tiles, min, median and runs (seconds) of every benchmark
+    '''
+    outFolder = os.path.join(workspace, "output")
+    os.makedirs(outFolder, exist_ok=True)
+    start = time.perf_counter()
+    boundaries = boundaryIndex.adminBoundaryIndex(syntheticDeliveries.makeBoundaries())
+    records = [{'benchmark':'boundaryIndex.adminBoundaryIndex', 'vendor':None, 'tiles':None,
+                'runs':[time.perf_counter() - start]}]
+    for nTiles in sizes:
+        for vendor in vendors:
+            start = time.perf_counter()
+            paths = syntheticDeliveries.makeDelivery(workspace, vendor, nTiles, tileSize=tileSize)
+            logging.info("Delivery %s ready in %.1fs" % (paths['folder'], time.perf_counter() - start))
+            results = benchmarkFolder(paths, outFolder, boundaries, repeat, zipWorkers)
+            results.update(benchmarkArchives(paths, repeat))
+            for name, runs in results.items():
+                records.append({'benchmark':name, 'vendor':vendor, 'tiles':nTiles, 'runs':runs})
+                logging.info("%s %s %s: %.3fs" % (vendor, nTiles, name, min(runs)))
+    for r in records:
+        r['min'] = float(np.min(r['runs']))
+        r['median'] = float(np.median(r['runs']))
+    return(records)
+
+def compareBaseline(records, baselineFile, tolerance=0.2):
+    ''' Compare a run with a baseline on the fastest run of every benchmark
+
+    RETURNS
+    [list of lists] - [benchmark, vendor, tiles, baseline seconds, current seconds, ratio] for every benchmark
+        more than tolerance slower than the baseline
+    '''
+    with open(baselineFile) as inJ:
+        baseline = json.load(inJ)
+    previous = dict(((r['benchmark'], r['vendor'], r['tiles']), r['min']) for r in baseline['results'])
+    regressions = []
+    print("%-50s %-7s %6s %10s %10s %7s" % ("benchmark", "vendor", "tiles", "baseline", "current", "ratio"))
+    for r in records:
+        key = (r['benchmark'], r['vendor'], r['tiles'])
+        if not key in previous:
+            continue
+        ratio = r['min'] / max(previous[key], 1e-9)
+        flag = " <" if ratio > 1 + tolerance else ""
+        print("%-50s %-7s %6s %10.4f %10.4f %7.2f%s" % (r['benchmark'], r['vendor'], r['tiles'], previous[key], r['min'], ratio, flag))
+        if ratio > 1 + tolerance:
+            regressions.append(list(key) + [previous[key], r['min'], ratio])
+    return(regressions)
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark imagery cataloguing on synthetic deliveries")
+    parser.add_argument("--sizes", default="10,100,1000", help="comma separated numbers of tiles per delivery (10 to 50000)")
+    parser.add_argument("--vendors", default=",".join(syntheticDeliveries.vendorStyles), help="comma separated delivery styles")
+    parser.add_argument("--workspace", default=os.path.join(tempfile.gettempdir(), "imageryBenchmarks"),
+                        help="folder for the synthetic deliveries and outputs; deliveries are reused between runs")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every benchmark; the fastest is compared")
+    parser.add_argument("--tileSize", type=int, default=64, help="rows and columns of every synthetic tile")
+    parser.add_argument("--zipWorkers", type=int, default=4, help="parallel compression threads in zipData")
+    parser.add_argument("--label", default=None, help="name of the baseline written to benchmarks/baselines")
+    parser.add_argument("--output", default=None, help="results file, overrides --label")
+    parser.add_argument("--compare", default=None, help="baseline results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown, as a fraction, reported as a regression")
+    parser.add_argument("--failOnRegression", action="store_true", help="exit with status 1 if any benchmark regressed")
+    parser.add_argument("--clean", action="store_true", help="delete the workspace when done")
+    args = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s\t%(message)s")
+
+    sizes = [int(x) for x in args.sizes.split(",")]
+    vendors = args.vendors.split(",")
+    records = runBenchmarks(sizes, vendors, args.workspace, args.repeat, args.tileSize, args.zipWorkers)
+    env = environment()
+    label = args.label or "%s_%s" % (datetime.date.today().strftime("%Y%m%d"), env['commit'] or "local")
+    outFile = args.output or os.path.join(baselineFolder, "%s.json" % label)
+    with open(outFile, 'w') as out:
+        json.dump({'label':label, 'created':datetime.datetime.now().isoformat(), 'environment':env,
+                   'settings':{'sizes':sizes, 'vendors':vendors, 'repeat':args.repeat, 'tileSize':args.tileSize,
+                               'zipWorkers':args.zipWorkers},
+                   'results':records}, out, indent=1)
+    logging.info("Results written to %s" % outFile)
+    regressions = []
+    if args.compare:
+        regressions = compareBaseline(records, args.compare, args.tolerance)
+        logging.info("%s benchmarks more than %.0f%% slower than %s" % (len(regressions), args.tolerance * 100, args.compare))
+    if args.clean:
+        shutil.rmtree(args.workspace, ignore_errors=True)
+    if args.failOnRegression and len(regressions) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
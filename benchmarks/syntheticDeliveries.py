@@ -0,0 +1,206 @@
+###############################################################################
+# Synthetic Imagery Deliveries
+# Purpose: generate small, reproducible imagery deliveries for benchmarking:
+#   GeoTIFF and JP2 tiles in a mix of UTM zones and EPSG:4326, with Maxar,
+#   Airbus and gbdx_clip style file names and XML sidecars, packaged as zip
+#   and tar.gz archives, plus a synthetic admin0 boundary layer
+###############################################################################
+
+import os, math, json, shutil, tarfile, zipfile
+
+import geopandas as gpd
+import numpy as np
+import pyproj, rasterio
+
+from rasterio.transform import from_origin
+from shapely.geometry import Polygon
+
+# Deliveries are placed in this WGS84 box, which spans UTM zones 36 and 37, north and south
+STUDY_AREA = [30.0, -4.0, 42.0, 4.0]
+vendorStyles = ['maxar', 'airbus', 'gbdx']
+# Pixel size of the tiles, in meters
+TILE_RES = 5.0
+
+def utmCRS(lon, lat):
+    ''' RETURNS [string] - UTM zone of a point, i.e. - epsg:32636 '''
+    zone = int((lon + 180) // 6) + 1
+    return("epsg:%s" % ((32600 if lat >= 0 else 32700) + zone))
+
+def deliveryName(vendor, nTiles, index=0):
+    return("%s_%05d_%03d" % (vendor, nTiles, index))
+
+def tileData(tileSize, bands):
+    ''' Smooth pixel values with a nodata (0) corner, so tiles compress well and have a valid data outline '''
+    rows, cols = np.mgrid[0:tileSize, 0:tileSize]
+    data = np.stack([((rows + cols + 20 * b) % 250 + 1) for b in range(bands)]).astype('uint8')
+    data[:, (rows + cols) < tileSize // 4] = 0
+    return(data)
+
+def tileGrid(nTiles, center, crs, tileSize):
+    ''' Bounds of nTiles tiles in a square grid around a WGS84 center, in crs
+
+    RETURNS
+    [list of lists] - [row, column, [left, bottom, right, top]] for every tile
+    '''
+    toCRS = pyproj.Transformer.from_crs('epsg:4326', crs, always_xy=True)
+    x0, y0 = toCRS.transform(center[0], center[1])
+    res = TILE_RES if not crs.endswith("4326") else TILE_RES / 111320.0
+    width = tileSize * res
+    nCols = int(math.ceil(math.sqrt(nTiles)))
+    tiles = []
+    for idx in range(nTiles):
+        r, c = divmod(idx, nCols)
+        left = x0 + (c - nCols / 2.0) * width
+        top = y0 - (r - nCols / 2.0) * width
+        tiles.append([r + 1, c + 1, [left, top - width, left + width, top]])
+    return(tiles)
+
+def writeTile(outFile, bounds, crs, data, driver="GTiff"):
+    bands, rows, cols = data.shape
+    transform = from_origin(bounds[0], bounds[3], (bounds[2] - bounds[0]) / cols, (bounds[3] - bounds[1]) / rows)
+    options = {'compress':'deflate', 'tiled':False} if driver == "GTiff" else {'quality':100, 'reversible':True}
+    with rasterio.open(outFile, 'w', driver=driver, width=cols, height=rows, count=bands, dtype='uint8',
+                       crs=crs, transform=transform, nodata=0, **options) as dst:
+        dst.write(data)
+
+def wgs84Corners(bounds, crs):
+    ''' RETURNS [list of floats] - UL, UR, LR, LL longitude and latitude of a tile, in vendorMetadata.cornerFields order '''
+    toWGS84 = pyproj.Transformer.from_crs(crs, 'epsg:4326', always_xy=True)
+    xs = [bounds[0], bounds[2], bounds[2], bounds[0]]
+    ys = [bounds[3], bounds[3], bounds[1], bounds[1]]
+    lon, lat = toWGS84.transform(xs, ys)
+    return([v for pair in zip(lon, lat) for v in pair])
+
+def cornerElements(corners):
+    names = ['ULLON', 'ULLAT', 'URLON', 'URLAT', 'LRLON', 'LRLAT', 'LLLON', 'LLLAT']
+    return("".join("<%s>%.8f</%s>" % (n, v, n) for n, v in zip(names, corners)))
+
+def writeBrowse(outFile):
+    with rasterio.open(outFile, 'w', driver='JPEG', width=32, height=32, count=3, dtype='uint8') as dst:
+        dst.write(tileData(32, 3))
+
+def makeMaxar(folder, nTiles, center, tileSize):
+    ''' Tiled Maxar product: R{row}C{col} GeoTIFFs in one UTM zone, a product XML with IMD and TIL sections and a browse JPG '''
+    crs = utmCRS(*center)
+    data = tileData(tileSize, 4)
+    product = "16JUN11081936-M2AS-056234557010_01_P001"
+    tiles = []
+    for r, c, bounds in tileGrid(nTiles, center, crs, tileSize):
+        tileFile = "16JUN11081936-M2AS_R%sC%s-056234557010_01_P001.TIF" % (r, c)
+        writeTile(os.path.join(folder, tileFile), bounds, crs, data)
+        tiles.append("<TILE><FILENAME>%s</FILENAME>%s</TILE>" % (tileFile, cornerElements(wgs84Corners(bounds, crs))))
+    corners = wgs84Corners(tileGrid(1, center, crs, tileSize * int(math.ceil(math.sqrt(nTiles))))[0][2], crs)
+    bandsXML = "".join("<BAND_%s>%s</BAND_%s>" % (b, cornerElements(corners), b) for b in "BGRN")
+    xml = ("<isd><IMD><NUMROWS>%s</NUMROWS><NUMCOLUMNS>%s</NUMCOLUMNS>%s<MAP_PROJECTED_PRODUCT><PRODUCTGSD>%s</PRODUCTGSD>"
+           "</MAP_PROJECTED_PRODUCT><IMAGE><CATID>1030010057A8C200</CATID><FIRSTLINETIME>2016-06-11T08:19:36.000000Z</FIRSTLINETIME>"
+           "<CLOUDCOVER>0.010</CLOUDCOVER><MEANSUNAZ>45.1</MEANSUNAZ><MEANSUNEL>60.2</MEANSUNEL>"
+           "<MEANOFFNADIRVIEWANGLE>12.5</MEANOFFNADIRVIEWANGLE></IMAGE></IMD><TIL>%s</TIL></isd>") % (
+           tileSize, tileSize, bandsXML, TILE_RES, "".join(tiles))
+    with open(os.path.join(folder, "%s.XML" % product), 'w') as out:
+        out.write(xml)
+    writeBrowse(os.path.join(folder, "%s-BROWSE.JPG" % product))
+
+def makeAirbus(folder, nTiles, center, tileSize):
+    ''' Pleiades product: R{row}C{col} JP2 tiles in EPSG:4326, a DIMAP XML for the whole dataset and a preview JPG '''
+    crs = "epsg:4326"
+    data = tileData(tileSize, 4)
+    product = "PHR1A_PMS_201303280801025_ORT_1"
+    grid = tileGrid(nTiles, center, crs, tileSize)
+    for r, c, bounds in grid:
+        writeTile(os.path.join(folder, "IMG_%s_R%sC%s.JP2" % (product, r, c)), bounds, crs, data, driver="JP2OpenJPEG")
+    allBounds = np.array([x[2] for x in grid])
+    left, bottom = allBounds[:, :2].min(axis=0)
+    right, top = allBounds[:, 2:].max(axis=0)
+    vertices = "".join("<Vertex><LON>%.8f</LON><LAT>%.8f</LAT></Vertex>" % v for v in [(left, top), (right, top), (right, bottom), (left, bottom)])
+    xml = ('<?xml version="1.0"?><Dimap_Document><Dataset_Identification><DATASET_NAME>DS_%s</DATASET_NAME></Dataset_Identification>'
+           '<Dataset_Content><CLOUD_COVERAGE unit="percent">3.5</CLOUD_COVERAGE><Dataset_Extent>%s</Dataset_Extent></Dataset_Content>'
+           '<Raster_Data><Raster_Dimensions><NROWS>%s</NROWS><NCOLS>%s</NCOLS><NBANDS>4</NBANDS></Raster_Dimensions></Raster_Data>'
+           '<Processing_Information><Product_Resampling><RESAMPLING_SPACING unit="m">%s</RESAMPLING_SPACING></Product_Resampling></Processing_Information>'
+           '<Source_Identification><Strip_Source><IMAGING_DATE>2013-03-28</IMAGING_DATE><IMAGING_TIME>08:01:02.5Z</IMAGING_TIME>'
+           '</Strip_Source></Source_Identification></Dimap_Document>') % (product, vertices, tileSize, tileSize, TILE_RES)
+    with open(os.path.join(folder, "DIM_%s.XML" % product), 'w') as out:
+        out.write(xml)
+    writeBrowse(os.path.join(folder, "PREVIEW_%s.JPG" % product))
+
+def makeGbdx(folder, nTiles, center, tileSize):
+    ''' gbdx clip: GeoTIFF clips alternating between the local UTM zone and EPSG:4326, a clip log and a strip XML '''
+    data = tileData(tileSize, 3)
+    for idx, crs in enumerate([utmCRS(*center), "epsg:4326"]):
+        for r, c, bounds in tileGrid(nTiles, center, crs, tileSize)[idx::2]:
+            writeTile(os.path.join(folder, "clip_R%sC%s.tif" % (r, c)), bounds, crs, data)
+    with open(os.path.join(folder, "gbdx_clip_log.txt"), 'w') as out:
+        out.write("synthetic clip\n")
+    with open(os.path.join(folder, "1030010057A8C200.XML"), 'w') as out:
+        out.write("<isd><IMD><IMAGE><CATID>1030010057A8C200</CATID><TLCTIME>2017-02-03T10:11:12.000000Z</TLCTIME></IMAGE></IMD></isd>")
+
+vendorMakers = {'maxar':makeMaxar, 'airbus':makeAirbus, 'gbdx':makeGbdx}
+
+def deliveryCenter(index):
+    ''' Spread deliveries over STUDY_AREA, on both sides of the equator and of the UTM zone 36/37 line '''
+    rng = np.random.RandomState(index)
+    return([float(rng.uniform(STUDY_AREA[0] + 1, STUDY_AREA[2] - 1)), float(rng.uniform(STUDY_AREA[1] + 1, STUDY_AREA[3] - 1))])
+
+def makeDelivery(rootFolder, vendor, nTiles, index=0, tileSize=64):
+    ''' Create (or reuse) a synthetic delivery folder with a zip and a tar.gz of it
+
+    Parameters:
+        rootFolder (string): folder holding all synthetic deliveries
+        vendor (string): one of vendorStyles
+        nTiles (int): number of image tiles
+        index (int): delivery number, sets its location
+        tileSize (int): rows and columns of every tile
+
+    RETURNS
+    [dictionary] - folder, zip and tar paths of the delivery
+    '''
+    name = deliveryName(vendor, nTiles, index)
+    folder = os.path.join(rootFolder, name)
+    paths = {'folder':folder, 'zip':os.path.join(rootFolder, "%s.zip" % name),
+             'tar':os.path.join(rootFolder, "%s.tar.gz" % name)}
+    #The description is written last, so a delivery is only reused once it is complete
+    description = os.path.join(rootFolder, "%s.json" % name)
+    settings = {'vendor':vendor, 'tiles':nTiles, 'index':index, 'tileSize':tileSize}
+    if os.path.exists(description):
+        with open(description) as inJ:
+            if json.load(inJ) == settings:
+                return(paths)
+    for path in [folder, paths['zip'], paths['tar']]:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    os.makedirs(folder)
+    vendorMakers[vendor](folder, nTiles, deliveryCenter(index), tileSize)
+    with zipfile.ZipFile(paths['zip'], 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for f in sorted(os.listdir(folder)):
+            zf.write(os.path.join(folder, f), f)
+    with tarfile.open(paths['tar'], 'w:gz') as tf:
+        for f in sorted(os.listdir(folder)):
+            tf.add(os.path.join(folder, f), f)
+    with open(description, 'w') as out:
+        json.dump(settings, out)
+    return(paths)
+
+def makeBoundaries(nX=12, nY=8, vertices=2000, seed=0):
+    ''' Synthetic admin0 layer: a grid of countries over STUDY_AREA with wavy, densely sampled borders
+
+    RETURNS
+    [geopandas dataframe] - WB_ADM0_NA, ISO3 and geometry (EPSG:4326) of every country
+    '''
+    rng = np.random.RandomState(seed)
+    xs = np.linspace(STUDY_AREA[0] - 1, STUDY_AREA[2] + 1, nX + 1)
+    ys = np.linspace(STUDY_AREA[1] - 1, STUDY_AREA[3] + 1, nY + 1)
+    rows = []
+    for i in range(nX):
+        for j in range(nY):
+            t = np.linspace(0, 1, vertices // 4, endpoint=False)
+            left, right, bottom, top = xs[i], xs[i + 1], ys[j], ys[j + 1]
+            ring = np.concatenate([np.column_stack([left + t * (right - left), np.full(t.shape, bottom)]),
+                                   np.column_stack([np.full(t.shape, right), bottom + t * (top - bottom)]),
+                                   np.column_stack([right - t * (right - left), np.full(t.shape, top)]),
+                                   np.column_stack([np.full(t.shape, left), top - t * (top - bottom)])])
+            wobble = 0.02 * np.sin(np.linspace(0, 40 * np.pi, len(ring)) + rng.uniform(0, np.pi))
+            center = np.array([(left + right) / 2.0, (bottom + top) / 2.0])
+            ring = center + (ring - center) * (1 + wobble)[:, None]
+            rows.append(["Country %s-%s" % (i, j), "C%s%s" % (chr(65 + i), chr(65 + j)), Polygon(ring)])
+    return(gpd.GeoDataFrame(rows, columns=['WB_ADM0_NA', 'ISO3', 'geometry'], crs='epsg:4326'))
@@ -0,0 +1,160 @@
+###############################################################################
+# Archive Index
+# Purpose: index the members of a delivered zip (or tar.gz) from its central
+#   directory, verify an extracted copy of it against the index in a single
+#   pass over the extracted folder, and address its rasters in place
+# NOTE: imported by imageryObject, keep compatible with Python 2.7 (ArcGIS)
+###############################################################################
+
+import os, posixpath, zipfile, tarfile, zlib
+
+try:
+    from . import runMetrics
+except (ImportError, ValueError):
+    import runMetrics
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# Members opened in place as rasters by archiveRasters
+rasterExtensions = ['.tif', '.tiff', '.jp2', '.ntf']
+
+def readArchiveIndex(archiveFile):
+    ''' Read the name, size and CRC of every file in an archive. For zipfiles only the
+        central directory is read; tar archives have to be listed by reading the stream
+
+    RETURNS
+    [dictionary] - {member path: [size, CRC]}; CRC is None for tar members
+    '''
+    members = {}
+    with runMetrics.measure("readArchiveIndex", archiveFile):
+        if zipfile.is_zipfile(archiveFile):
+            with zipfile.ZipFile(archiveFile) as curZip:
+                for info in curZip.infolist():
+                    if not info.filename.endswith("/"):
+                        members[info.filename] = [info.file_size, info.CRC]
+            runMetrics.countIO(opened=1)
+        else:
+            curTar = tarfile.open(archiveFile, 'r:*')
+            try:
+                for info in curTar.getmembers():
+                    if info.isfile():
+                        members[info.name] = [info.size, None]
+            finally:
+                curTar.close()
+            runMetrics.countIO(read=os.path.getsize(archiveFile) if runMetrics.enabled else 0, opened=1)
+    return(members)
+
+def archiveRasters(archiveFile, members=None, extensions=rasterExtensions):
+    ''' GDAL virtual paths of the rasters inside a zip or tar archive, so they can be opened without
+        extracting them, i.e. - /vsizip/C:/Vendor/delivery.zip/folder/tile.tif
+
+    Parameters:
+        archiveFile (string): zip, tar or tar.gz archive
+        members (dictionary) (optional): result of readArchiveIndex, read here if not given
+        extensions (list of strings): extensions of the members to return
+
+    RETURNS
+    [list of lists] - [member path, virtual path] for every raster member, sorted by member path
+    '''
+    if members is None:
+        members = readArchiveIndex(archiveFile)
+    prefix = "/vsizip/" if zipfile.is_zipfile(archiveFile) else "/vsitar/"
+    archivePath = archiveFile.replace("\\", "/")
+    rasters = []
+    for member in sorted(members.keys()):
+        if os.path.splitext(member)[1].lower() in extensions:
+            #Tar members are often stored as ./folder/tile.tif
+            memberPath = posixpath.normpath(member.replace("\\", "/")).lstrip("/")
+            rasters.append([member, "%s%s/%s" % (prefix, archivePath, memberPath)])
+    return(rasters)
+
+def scanTree(folder):
+    ''' List every file below a folder with its size, using a single scandir pass
+
+    RETURNS
+    [dictionary] - {path relative to folder, with / separators: size in bytes}
+    '''
+    files = {}
+    if not os.path.isdir(folder):
+        return(files)
+    toScan = [("", folder)]
+    while toScan:
+        relDir, curDir = toScan.pop()
+        if scandir is None:
+            entries = [(f, os.path.join(curDir, f)) for f in os.listdir(curDir)]
+            for name, path in entries:
+                if os.path.isdir(path):
+                    toScan.append((relDir + name + "/", path))
+                else:
+                    files[relDir + name] = os.path.getsize(path)
+        else:
+            for entry in scandir(curDir):
+                if entry.is_dir():
+                    toScan.append((relDir + entry.name + "/", entry.path))
+                else:
+                    files[relDir + entry.name] = entry.stat().st_size
+    return(files)
+
+def fileCRC(inFile):
+    crc = 0
+    size = 0
+    with open(inFile, 'rb') as src:
+        while True:
+            data = src.read(1024 * 1024)
+            if not data:
+                break
+            size += len(data)
+            crc = zlib.crc32(data, crc)
+    runMetrics.countIO(read=size, opened=1)
+    return(crc & 0xffffffff)
+
+def verifyExtraction(members, targetFolder, transformedExtensions=[], checkCRC=False):
+    ''' Compare the archive index with the files extracted to targetFolder. Members are matched
+        on their path within the archive, falling back to the file name anywhere in the folder
+
+    Parameters:
+        members (dictionary): result of readArchiveIndex
+        targetFolder (string): folder the archive was extracted to
+        transformedExtensions (list of strings): extensions (i.e. - '.tif') of members that are rewritten
+            on extraction; these only need to exist and not be empty
+        checkCRC (boolean): also compare the CRC of untransformed zip members (reads every file)
+
+    RETURNS
+    [dictionary] - 'found', 'missing' and 'truncated' lists of member paths
+    '''
+    with runMetrics.measure("verifyExtraction", targetFolder):
+        return(_verify(members, targetFolder, transformedExtensions, checkCRC))
+
+def _verify(members, targetFolder, transformedExtensions, checkCRC):
+    extracted = scanTree(targetFolder)
+    byName = {}
+    for relPath, size in extracted.items():
+        byName.setdefault(os.path.basename(relPath), []).append(relPath)
+    report = {'found':[], 'missing':[], 'truncated':[]}
+    for member, details in sorted(members.items()):
+        size, crc = details
+        relPath = member.replace("\\", "/").lstrip("/")
+        if not relPath in extracted:
+            candidates = byName.get(os.path.basename(relPath), [])
+            if len(candidates) == 0:
+                report['missing'].append(member)
+                continue
+            relPath = candidates[0]
+        transformed = os.path.splitext(relPath)[1].lower() in transformedExtensions
+        if transformed:
+            complete = extracted[relPath] > 0 or size == 0
+        else:
+            complete = extracted[relPath] == size
+            if complete and checkCRC and crc is not None:
+                complete = fileCRC(os.path.join(targetFolder, relPath)) == crc
+        if complete:
+            report['found'].append(member)
+        else:
+            report['truncated'].append(member)
+    return(report)
@@ -0,0 +1,206 @@
+###############################################################################
+# Batch Processing of Delivered Imagery
+# Purpose: run deliveredImageryFolder over every imagery folder in a source
+#   folder, recording the outcome of each stage in an indexed manifest so an
+#   interrupted run resumes where it stopped
+#
+# Usage: python -m ImageryObjects.batchProcess R:\IMAGERY I:\...\Ingest Admin0_Polys.shp --logFolder I:\...\GOST_Ingest_Log
+###############################################################################
+
+import os, sqlite3, logging, argparse, datetime
+
+import geopandas as gpd
+import pandas as pd
+
+try:
+    from . import imageryExtents, boundaryIndex, headerCache, catalogQuery, runMetrics
+except ImportError:
+    import imageryExtents, boundaryIndex, headerCache, catalogQuery, runMetrics
+
+imageExtensions = [".tif", ".TIF", ".JP2"]
+excludeFolders = ['spfeas', 'MappyFeatures', 'Spatial_features', 'LandScan_2012']
+# Folders with these statuses are not revisited when a run is resumed
+finalStatuses = ['done', 'processed', 'bad_metadata']
+
+class processingManifest(object):
+    def __init__(self, manifestFile):
+        ''' Indexed record of the processing status of every imagery folder
+
+        Parameters:
+            manifestFile (string): path to SQLite database, i.e. - os.path.join(log_Folder, "manifest.sqlite")
+        '''
+        self.manifestFile = manifestFile
+        self.connection = sqlite3.connect(manifestFile)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS folders (
+            folder TEXT PRIMARY KEY, jsonFile TEXT, stage TEXT, status TEXT, message TEXT, updated TEXT)''')
+        self.connection.commit()
+
+    def lookup(self, folder):
+        ''' RETURNS [dictionary] - manifest entry for the folder, None if it has never been processed
+        '''
+        row = self.connection.execute("SELECT folder, jsonFile, stage, status, message, updated FROM folders WHERE folder = ?",
+                                      (folder,)).fetchone()
+        if row is None:
+            return(None)
+        return(dict(zip(['folder', 'jsonFile', 'stage', 'status', 'message', 'updated'], row)))
+
+    def record(self, folder, stage, status, jsonFile=None, message=''):
+        ''' Record the outcome of a processing stage; committed immediately so it survives a crash
+        '''
+        with self.connection:
+            self.connection.execute('''INSERT INTO folders VALUES (?,?,?,?,?,?) ON CONFLICT(folder) DO UPDATE SET
+                jsonFile=COALESCE(excluded.jsonFile, jsonFile), stage=excluded.stage, status=excluded.status,
+                message=excluded.message, updated=excluded.updated''',
+                (folder, jsonFile, stage, status, message, datetime.datetime.now().isoformat()))
+
+    def isComplete(self, folder, retryErrors=False):
+        entry = self.lookup(folder)
+        if entry is None:
+            return(False)
+        if entry['status'] == 'error':
+            return(not retryErrors)
+        return(entry['status'] in finalStatuses)
+
+    def summary(self):
+        ''' RETURNS [dictionary] - number of folders per status
+        '''
+        return(dict(self.connection.execute("SELECT status, COUNT(*) FROM folders GROUP BY status").fetchall()))
+
+    def close(self):
+        self.connection.close()
+
+def findImageFolders(sourceFolder, excludeFolders=excludeFolders):
+    ''' List the folders under sourceFolder that contain imagery
+
+    RETURNS
+    [list of strings] - folders, in walk order
+    '''
+    imgFolders = []
+    for root, dirs, files in os.walk(sourceFolder):
+        if any(x in root for x in excludeFolders):
+            continue
+        for f in files:
+            if f[-4:] in imageExtensions:
+                imgFolders.append(root)
+                break
+    return(imgFolders)
+
+def processFolder(inFolder, outFolder, adminBoundaries, manifest, processedFiles=None, badMetaFile='',
+                  pNumber="NA", securityClassification="Official Use Only", zipWorkers=4, **folderArgs):
+    ''' Run all stages for a single folder, recording each stage in the manifest as it finishes
+
+    Parameters:
+        inFolder (string): imagery folder
+        outFolder (string): folder for output zip, json and thumbnail
+        adminBoundaries (geodataframe or boundaryIndex.adminBoundaryIndex): global boundaries
+        manifest (processingManifest): manifest of processed folders
+        processedFiles (set of strings) (optional): json files already processed by earlier, non manifest runs
+        badMetaFile (string) (optional): csv to which metadata that is not valid is appended
+        folderArgs: passed on to deliveredImageryFolder
+
+    RETURNS
+    [string] - final status of the folder
+    '''
+    stage = 'metadata'
+    jsonFile = None
+    try:
+        imgObj = imageryExtents.deliveredImageryFolder(inFolder, outFolder, adminBoundaries, "", **folderArgs)
+        jsonFile = imgObj.jsonFile
+        if os.path.exists(jsonFile) or (processedFiles and jsonFile in processedFiles):
+            manifest.record(inFolder, stage, 'processed', jsonFile)
+            return('processed')
+        if imgObj.batchSize:
+            #Streamed folders are checked from their summary; the tiles are only listed when they have to be written
+            validMetadata = imgObj.summarizeMetadata()['undated'] == 0
+            metaData = (b.toFrame() for b in imgObj.iterMetadata())
+        else:
+            metaData = imgObj.getMetadata()
+            validMetadata = imgObj.valid_metadata(metaData)
+            metaData = [metaData]
+        if not validMetadata:
+            if badMetaFile != '':
+                for frame in metaData:
+                    frame.to_csv(badMetaFile, mode='a', header=not os.path.exists(badMetaFile))
+            manifest.record(inFolder, stage, 'bad_metadata', jsonFile)
+            return('bad_metadata')
+        manifest.record(inFolder, stage, 'ok', jsonFile)
+        stage = 'thumbnail'
+        imgObj.generateThumbnails()
+        manifest.record(inFolder, stage, 'ok')
+        stage = 'zip'
+        imgObj.zipData(zipWorkers)
+        manifest.record(inFolder, stage, 'ok')
+        stage = 'json'
+        #Tile metadata next to the json, read by catalogQuery for tile level queries; written first, as the
+        #json marks the folder as processed
+        imgObj.writeMetadata(catalogQuery.tilesFile(jsonFile))
+        imgObj.createJSON(pNumber=pNumber, securityClassification=securityClassification)
+        manifest.record(inFolder, stage, 'done')
+        return('done')
+    except Exception as e:
+        logging.warning("Error processing %s at stage %s: %s" % (inFolder, stage, e))
+        manifest.record(inFolder, stage, 'error', jsonFile, str(e))
+        return('error')
+
+def runBatch(imgFolders, outFolder, adminBoundaries, manifest, retryErrors=False, **kwargs):
+    ''' Process a list of folders, skipping those the manifest already marks as complete
+
+    RETURNS
+    [dictionary] - number of folders per outcome in this run, including 'skipped'
+    '''
+    results = {'skipped':0}
+    for inFolder in imgFolders:
+        if manifest.isComplete(inFolder, retryErrors):
+            results['skipped'] += 1
+            continue
+        with runMetrics.measure("folder", inFolder):
+            status = processFolder(inFolder, outFolder, adminBoundaries, manifest, **kwargs)
+        results[status] = results.get(status, 0) + 1
+        logging.info("%s: %s" % (inFolder, status))
+    return(results)
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Catalogue delivered imagery folders into zip and json files")
+    parser.add_argument("sourceFolder", help="folder of imagery to process")
+    parser.add_argument("outFolder", help="folder for output zip, json and thumbnail files")
+    parser.add_argument("adminBoundaries", help="admin0 boundaries shapefile")
+    parser.add_argument("--logFolder", default=".", help="folder for the manifest, header cache, catalog index and bad metadata")
+    parser.add_argument("--processedLog", default="", help="csv of already processed json files (Footprint_ID column)")
+    parser.add_argument("--scanWorkers", type=int, default=8, help="parallel raster header reads")
+    parser.add_argument("--zipWorkers", type=int, default=4, help="parallel compression threads when zipping")
+    parser.add_argument("--batchSize", type=int, default=0, help="stream the tile metadata of every folder in batches of this many tiles, for very large folders; 0 reads all tiles at once")
+    parser.add_argument("--validFootprints", action="store_true", help="outline the valid data of every tile from its overviews, rather than its bounding box")
+    parser.add_argument("--decimateWithoutOverviews", action="store_true", help="with --validFootprints, outline tiles without overviews (i.e. - raw vendor strips) from a decimated read of the full resolution data")
+    parser.add_argument("--retryErrors", action="store_true", help="re-run folders that failed in earlier runs")
+    parser.add_argument("--metricsFile", default="", help="JSON lines file for the timing and I/O of every stage of every folder, see runMetrics")
+    args = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s\t%(message)s")
+    if args.metricsFile != '':
+        runMetrics.start(args.metricsFile)
+
+    globalBoundaries = gpd.read_file(args.adminBoundaries).to_crs('epsg:4326')
+    processedFiles = set()
+    if args.processedLog != '':
+        processedFiles = set(pd.read_csv(args.processedLog)['Footprint_ID'].values)
+    manifest = processingManifest(os.path.join(args.logFolder, "manifest.sqlite"))
+    cache = headerCache.rasterHeaderCache(os.path.join(args.logFolder, "raster_headers.sqlite"))
+    imgFolders = findImageFolders(args.sourceFolder)
+    logging.info("Found %s imagery folders" % len(imgFolders))
+    results = runBatch(imgFolders, args.outFolder, boundaryIndex.adminBoundaryIndex(globalBoundaries), manifest,
+                       retryErrors=args.retryErrors, processedFiles=processedFiles,
+                       badMetaFile=os.path.join(args.logFolder, "bad_meta_folders.csv"), zipWorkers=args.zipWorkers,
+                       scanWorkers=args.scanWorkers, headerCache=cache,
+                       footprintMode='valid' if args.validFootprints else 'bounds', batchSize=args.batchSize or None,
+                       decimateWithoutOverviews=args.decimateWithoutOverviews)
+    logging.info("Run results: %s" % results)
+    logging.info("Manifest: %s" % manifest.summary())
+    catalog = catalogQuery.imageryCatalog(os.path.join(args.logFolder, "catalog_index.sqlite"))
+    catalog.update(args.outFolder)
+    catalog.close()
+    cache.close()
+    manifest.close()
+    for line in runMetrics.stop():
+        logging.info(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+###############################################################################
+# Admin Boundary Index
+# Purpose: spatial index over the global admin0 boundaries, used to identify
+#   the country of imagery footprints without intersecting every full
+#   resolution country polygon
+###############################################################################
+
+import shapely
+
+import numpy as np
+import pandas as pd
+
+from shapely.strtree import STRtree
+
+class adminBoundaryIndex(object):
+    def __init__(self, adminBoundaries, tolerance=0.01, nameField='WB_ADM0_NA', isoField='ISO3'):
+        ''' Build a reusable index over the admin boundaries; create once per session and pass to
+            deliveredImageryFolder in place of the boundaries geodataframe
+
+        Countries are simplified with half the tolerance, so the simplified and the full resolution
+        borders are never more than the tolerance apart. Footprints further than the tolerance from
+        every simplified border are resolved against the simplified shapes only; footprints near a
+        border fall back to the exact, full resolution overlap used by identifyCountries
+
+        Parameters:
+            adminBoundaries (geopandas geodataframe): global boundaries, in the same CRS as the footprints (WGS84)
+            tolerance (float): distance, in CRS units, that defines being near a border
+            nameField (string): column with the country name
+            isoField (string): column with the ISO3 code
+        '''
+        self.adminBoundaries = adminBoundaries
+        self.tolerance = tolerance
+        self.names = np.array(adminBoundaries[nameField], dtype=object)
+        self.iso3 = np.array(adminBoundaries[isoField], dtype=object)
+        self.geometries = np.array(adminBoundaries.geometry, dtype=object)
+        self.simplified = shapely.simplify(self.geometries, tolerance / 2.0)
+        #Keep the original shape where simplification breaks the geometry
+        broken = shapely.is_empty(self.simplified) | ~shapely.is_valid(self.simplified)
+        self.simplified[broken] = self.geometries[broken]
+        self.borders = shapely.boundary(self.simplified)
+        shapely.prepare(self.simplified)
+        shapely.prepare(self.borders)
+        self.tree = STRtree(self.simplified)
+        self.exactLookups = 0
+        self.fastLookups = 0
+
+    def identifyCountry(self, inputExtent):
+        ''' Identify the country of a footprint, following the same rules as deliveredImageryFolder.identifyCountries
+
+        Parameters:
+            inputExtent (shapely geometry): footprint of the imagery
+
+        RETURNS
+        [tuple] - (country name, ISO3); multiple intersected countries are joined with ';'
+            only if they cannot be separated by overlap
+        '''
+        minx, miny, maxx, maxy = inputExtent.bounds
+        t = self.tolerance
+        candidates = np.sort(self.tree.query(shapely.box(minx - t, miny - t, maxx + t, maxy + t)))
+        nearBorder = (shapely.distance(self.borders[candidates], inputExtent) <= t).any()
+        if not nearBorder:
+            hits = candidates[shapely.intersects(self.simplified[candidates], inputExtent)]
+            if len(hits) <= 1:
+                self.fastLookups += 1
+                return((";".join(self.names[hits]), ";".join(self.iso3[hits])))
+        return(self.exactCountry(inputExtent, candidates))
+
+    def exactCountry(self, inputExtent, candidates):
+        ''' Full resolution country identification for the candidate boundaries
+        '''
+        self.exactLookups += 1
+        full = self.geometries[candidates]
+        shapely.prepare(full)
+        hits = candidates[shapely.intersects(full, inputExtent)]
+        if len(hits) > 1:
+            # If more than one country is intersected, select the shape with the highest overlap
+            overlap = pd.Series(shapely.area(shapely.intersection(self.geometries[hits], inputExtent)) / inputExtent.area)
+            best = hits[overlap.sort_values(ascending=False).index[0]]
+            return((self.names[best], self.iso3[best]))
+        return((";".join(self.names[hits]), ";".join(self.iso3[hits])))
@@ -0,0 +1,150 @@
+###############################################################################
+# Catalog Index
+# Purpose: load the exported path catalogs of the imagery services once per
+#   run into a single basename lookup that is shared by every imageryZip
+#   Catalogs are read through a backend: arcpy for the production geodatabase,
+#   or a local backend that reads catalogs already exported to DBF or CSV
+# NOTE: imported by imageryObject, keep compatible with Python 2.7 (ArcGIS)
+###############################################################################
+
+import os, csv, struct, threading
+
+try:
+    from . import runMetrics
+except (ImportError, ValueError):
+    import runMetrics
+
+catalogFields = ["SourceOID", "Path"]
+
+def readDBF(inFile, fields=catalogFields):
+    ''' Read selected fields from a dBase (DBF) table, such as those written by
+        ExportRasterCatalogPaths_management; deleted records are skipped
+
+    RETURNS
+    [list of lists] - values of fields for every record; numeric fields are returned as int or float
+    '''
+    rows = []
+    with open(inFile, 'rb') as src:
+        numRecords, headerLength, recordLength = struct.unpack('<xxxxIHH20x', src.read(32))
+        fieldDefs = []
+        offset = 1
+        while True:
+            descriptor = src.read(32)
+            if len(descriptor) < 32 or descriptor[0:1] == b'\r':
+                break
+            name = descriptor[:11].split(b'\x00')[0].decode('ascii')
+            fieldType = descriptor[11:12].decode('ascii')
+            fieldLength = struct.unpack('<B', descriptor[16:17])[0]
+            fieldDefs.append([name, fieldType, offset, fieldLength])
+            offset += fieldLength
+        byName = dict((f[0].upper(), f) for f in fieldDefs)
+        selected = [byName[f.upper()] for f in fields]
+        src.seek(headerLength)
+        for idx in range(numRecords):
+            record = src.read(recordLength)
+            if len(record) < recordLength:
+                break
+            if record[0:1] == b'*':
+                continue
+            row = []
+            for name, fieldType, start, length in selected:
+                value = record[start:start + length].decode('latin-1').strip()
+                if fieldType in 'NF' and value != '':
+                    value = float(value) if '.' in value else int(value)
+                row.append(value)
+            rows.append(row)
+    return(rows)
+
+def readCSV(inFile, fields=catalogFields):
+    ''' RETURNS [list of lists] - values of fields for every row of a csv with a header; whole numbers are returned as int '''
+    with open(inFile, 'r') as src:
+        return([[int(row[f]) if row[f].isdigit() else row[f] for f in fields] for row in csv.DictReader(src)])
+
+class arcpyCatalogBackend(object):
+    ''' Export and read service catalogs with arcpy '''
+    def __init__(self):
+        import arcpy
+        self.arcpy = arcpy
+
+    def exists(self, dataset):
+        if not self.arcpy.Exists(dataset):
+            return(False)
+        return(int(self.arcpy.GetCount_management(dataset).getOutput(0)) > 0)
+
+    def exportCatalog(self, dataset, catalogTable, mosaic=False):
+        if mosaic:
+            self.arcpy.ExportMosaicDatasetPaths_management(dataset, catalogTable, export_mode="ALL", types_of_paths="RASTER;ITEM_CACHE")
+        else:
+            self.arcpy.ExportRasterCatalogPaths_management(dataset, "ALL", catalogTable)
+
+    def readCatalog(self, catalogTable):
+        with self.arcpy.da.SearchCursor(catalogTable, catalogFields) as searchCur:
+            return([[row[0], row[1]] for row in searchCur])
+
+class localCatalogBackend(object):
+    ''' Read catalogs that have already been exported to DBF or CSV, without ArcGIS. A service
+        exists when its exported catalog exists; nothing is ever exported
+    '''
+    def exists(self, dataset):
+        return(False)
+
+    def exportCatalog(self, dataset, catalogTable, mosaic=False):
+        raise(IOError("Cannot export %s without arcpy" % dataset))
+
+    def readCatalog(self, catalogTable):
+        if os.path.splitext(catalogTable)[1].lower() == ".csv":
+            return(readCSV(catalogTable))
+        return(readDBF(catalogTable))
+
+class catalogIndex(object):
+    def __init__(self, backend=None):
+        ''' Basename lookup of the files in each imagery service, loaded once per service
+
+        Parameters:
+            backend (arcpyCatalogBackend or localCatalogBackend) (optional): defaults to arcpy
+        '''
+        self.backend = backend if backend is not None else arcpyCatalogBackend()
+        self.catalogs = {}
+        self.lock = threading.Lock()
+
+    def loadCatalog(self, service, dataset, catalogTable, mosaic=False):
+        ''' Read the catalog of a service into the index, exporting it first if today's export
+            does not exist. Services that are already loaded are not read again
+
+        Parameters:
+            service (string): name of the service in lookups, i.e. - S_WV02
+            dataset (string): path to the raster catalog or mosaic dataset
+            catalogTable (string): path to the exported catalog (DBF or CSV)
+            mosaic (boolean): dataset is a mosaic dataset rather than a raster catalog
+
+        RETURNS
+        [boolean] - True if the service has a catalog
+        '''
+        with self.lock:
+            if not service in self.catalogs:
+                with runMetrics.measure("loadCatalog", service):
+                    entries = None
+                    if not os.path.isfile(catalogTable) and self.backend.exists(dataset):
+                        self.backend.exportCatalog(dataset, catalogTable, mosaic)
+                    if os.path.isfile(catalogTable):
+                        runMetrics.countIO(read=os.path.getsize(catalogTable), opened=1)
+                        entries = {}
+                        for oid, path in self.backend.readCatalog(catalogTable):
+                            entries[os.path.basename(path)] = [oid, service]
+                    self.catalogs[service] = entries
+            return(self.catalogs[service] is not None)
+
+    def findFiles(self, fileNames, services):
+        ''' Look up a set of file names in the loaded catalogs of services; where a file is in
+            more than one service, the later service in the list is returned
+
+        RETURNS
+        [dictionary] - {file name: [OID, service]} for the file names that are catalogued
+        '''
+        names = set(fileNames)
+        found = {}
+        for service in services:
+            entries = self.catalogs.get(service) or {}
+            for fileName in names.intersection(entries):
+                found[fileName] = entries[fileName]
+        return(found)
@@ -0,0 +1,234 @@
+###############################################################################
+# Imagery Catalog Query
+# Purpose: answer which deliveries and tiles cover an area, date range,
+#   resolution and band count without opening every delivery JSON. The JSON
+#   files (and their tile metadata) are indexed once into a SQLite database and
+#   updated incrementally; queries run against an in-memory STRtree, geohash
+#   prefix buckets and sorted date columns built from that database
+###############################################################################
+
+import os, json, sqlite3, logging, time
+
+import geopandas as gpd
+import pandas as pd
+import numpy as np
+import pyarrow.parquet as pq
+import shapely
+
+try:
+    from . import geoParquet
+except ImportError:
+    import geoParquet
+
+# Unknown dates (i.e. - YYYYMMDD) are stored as 0 and never match a date range
+UNKNOWN_DATE = 0
+# Length of the geohash prefix used to bucket tiles
+BUCKET_LENGTH = 4
+
+def tilesFile(jsonFile):
+    ''' Tile metadata written next to a delivery JSON (see deliveredImageryFolder.writeMetadata) '''
+    return("%s_tiles.parquet" % os.path.splitext(jsonFile)[0])
+
+def fileKey(path):
+    ''' RETURNS [tuple] - (size in bytes, modification time in nanoseconds) of a file, (None, None) if it does not exist '''
+    try:
+        fileStat = os.stat(path)
+    except OSError:
+        return((None, None))
+    return((fileStat.st_size, fileStat.st_mtime_ns))
+
+def parseDate(curDate):
+    ''' RETURNS [int] - YYYYMMDD as an integer, UNKNOWN_DATE if it cannot be read '''
+    try:
+        return(int(str(curDate).strip()[:8]))
+    except ValueError:
+        return(UNKNOWN_DATE)
+
+def parseRange(values, convert):
+    ''' Minimum and maximum of a comma separated JSON field, i.e. - resolution "0.5,2.0" '''
+    parsed = []
+    for x in str(values).split(","):
+        try:
+            parsed.append(convert(x))
+        except ValueError:
+            pass
+    if len(parsed) == 0:
+        return([None, None])
+    return([min(parsed), max(parsed)])
+
+class catalogTable(object):
+    ''' In memory, query ready copy of the deliveries or tiles table '''
+    def __init__(self, data):
+        self.data = data.reset_index(drop=True)
+        self.geometry = shapely.from_wkb(self.data['geometry'].values)
+        self.tree = shapely.STRtree(self.geometry)
+        self.dateOrder = np.argsort(self.data['dateMin'].values, kind='stable')
+        self.sortedDates = self.data['dateMin'].values[self.dateOrder]
+        self.buckets = {}
+        if 'geohash' in self.data.columns:
+            self.geohashes = np.asarray(self.data['geohash'].fillna(""), dtype=str)
+            for prefix, idx in pd.Series(np.arange(len(self.geohashes))).groupby(self.geohashes.astype('U%s' % BUCKET_LENGTH)).indices.items():
+                self.buckets[prefix] = idx
+
+    def inGeohash(self, prefix):
+        ''' RETURNS [numpy array] - rows whose geohash starts with prefix '''
+        if len(prefix) >= BUCKET_LENGTH:
+            idx = self.buckets.get(prefix[:BUCKET_LENGTH], np.array([], dtype=int))
+            return(idx[np.char.startswith(self.geohashes[idx], prefix)])
+        found = [idx for key, idx in self.buckets.items() if key.startswith(prefix)]
+        return(np.sort(np.concatenate(found)) if len(found) > 0 else np.array([], dtype=int))
+
+    def select(self, aoi=None, startDate=None, endDate=None, resolution=None, minBands=None, geohashPrefix=None):
+        ''' RETURNS [numpy array] - sorted rows matching every criteria that is not None '''
+        keep = np.ones(len(self.data), dtype=bool)
+        if startDate is not None or endDate is not None:
+            #Rows starting after endDate are cut off the sorted dates, the rest are checked on dateMax
+            last = len(self.sortedDates) if endDate is None else np.searchsorted(self.sortedDates, parseDate(endDate), side='right')
+            inRange = np.zeros(len(self.data), dtype=bool)
+            inRange[self.dateOrder[:last]] = True
+            inRange &= self.data['dateMin'].values != UNKNOWN_DATE
+            if startDate is not None:
+                inRange &= self.data['dateMax'].values >= parseDate(startDate)
+            keep &= inRange
+        if resolution is not None:
+            keep &= self.data['resMin'].values <= resolution
+        if minBands is not None:
+            keep &= self.data['bandsMax'].values >= minBands
+        if geohashPrefix is not None:
+            inCell = np.zeros(len(self.data), dtype=bool)
+            inCell[self.inGeohash(geohashPrefix)] = True
+            keep &= inCell
+        if aoi is not None:
+            hits = np.zeros(len(self.data), dtype=bool)
+            hits[self.tree.query(aoi, predicate='intersects')] = True
+            keep &= hits
+        return(np.flatnonzero(keep))
+
+class imageryCatalog(object):
+    def __init__(self, indexFile):
+        ''' Persistent index of delivery JSON files and their tiles
+
+        Parameters:
+            indexFile (string): path to SQLite database, i.e. - os.path.join(log_Folder, "catalog_index.sqlite")
+        '''
+        self.indexFile = indexFile
+        self.connection = sqlite3.connect(indexFile)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS sources (
+            jsonFile TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, tilesSize INTEGER, tilesMtime INTEGER)''')
+        #Indexes built before the tiles file was part of the key are re-read once
+        columns = [x[1] for x in self.connection.execute("PRAGMA table_info(sources)")]
+        for column in ['tilesSize', 'tilesMtime']:
+            if not column in columns:
+                self.connection.execute("ALTER TABLE sources ADD COLUMN %s INTEGER" % column)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS deliveries (
+            jsonFile TEXT PRIMARY KEY, iso3 TEXT, location TEXT, vendor TEXT, resMin REAL, resMax REAL,
+            bandsMin INTEGER, bandsMax INTEGER, dateMin INTEGER, dateMax INTEGER, geometry BLOB)''')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS tiles (
+            jsonFile TEXT, file TEXT, resMin REAL, bandsMax INTEGER, dateMin INTEGER, dateMax INTEGER,
+            geohash TEXT, geometry BLOB)''')
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tiles_json ON tiles (jsonFile)")
+        self.connection.commit()
+        self.tables = {}
+
+    def readDelivery(self, jsonFile):
+        ''' Read a delivery JSON, and its tile metadata if it exists, into index rows '''
+        with open(jsonFile) as inJ:
+            meta = json.load(inJ)
+        resMin, resMax = parseRange(meta.get('resolution', ''), float)
+        bandsMin, bandsMax = parseRange(meta.get('nBands', ''), int)
+        dateMin, dateMax = parseRange(meta.get('capture_date', ''), parseDate)
+        extent = shapely.from_wkt(meta['ImageExtent'])
+        delivery = (jsonFile, meta.get('iso3'), meta.get('location'), meta.get('vendor'), resMin, resMax,
+                    bandsMin, bandsMax, dateMin, dateMax, shapely.to_wkb(extent))
+        tiles = []
+        if os.path.exists(tilesFile(jsonFile)):
+            #Geometries are copied to the index as WKB, without being parsed
+            geomField = geoParquet.geometryColumn(tilesFile(jsonFile))
+            t = pq.read_table(tilesFile(jsonFile), columns=['file', 'Res', 'Bands', 'Date', 'geohash', geomField]).to_pydict()
+            dates = [parseDate(x) for x in t['Date']]
+            tiles = list(zip([jsonFile] * len(dates), t['file'], t['Res'], t['Bands'], dates, dates, t['geohash'], t[geomField]))
+        return([delivery, tiles])
+
+    def update(self, jsonFolders):
+        ''' Bring the index up to date with the JSON files in a set of folders; only new or changed
+            files are read, and files that no longer exist are removed. A JSON file is read again when
+            it or its tiles file (see tilesFile) is written, rewritten or removed
+
+        RETURNS
+        [dictionary] - number of JSON files added, updated, removed and unchanged
+        '''
+        if isinstance(jsonFolders, str):
+            jsonFolders = [jsonFolders]
+        current = {}
+        for folder in jsonFolders:
+            for entry in os.scandir(folder):
+                if entry.name.endswith(".json") and entry.is_file():
+                    fileStat = entry.stat()
+                    current[entry.path] = (fileStat.st_size, fileStat.st_mtime_ns) + fileKey(tilesFile(entry.path))
+        known = dict((r[0], tuple(r[1:])) for r in self.connection.execute("SELECT jsonFile, size, mtime, tilesSize, tilesMtime FROM sources"))
+        results = {'added':0, 'updated':0, 'removed':0, 'unchanged':0}
+        with self.connection:
+            for jsonFile in set(known).difference(current):
+                self.remove(jsonFile)
+                results['removed'] += 1
+            for jsonFile, curKey in current.items():
+                if known.get(jsonFile) == curKey:
+                    results['unchanged'] += 1
+                    continue
+                try:
+                    delivery, tiles = self.readDelivery(jsonFile)
+                except Exception as e:
+                    logging.warning("Could not index %s: %s" % (jsonFile, e))
+                    continue
+                self.remove(jsonFile)
+                self.connection.execute("INSERT INTO deliveries VALUES (?,?,?,?,?,?,?,?,?,?,?)", delivery)
+                self.connection.executemany("INSERT INTO tiles VALUES (?,?,?,?,?,?,?,?)", tiles)
+                self.connection.execute("INSERT INTO sources VALUES (?,?,?,?,?)", (jsonFile,) + curKey)
+                results['updated' if jsonFile in known else 'added'] += 1
+        if results['added'] + results['updated'] + results['removed'] > 0:
+            self.tables = {}
+        logging.info("Catalog index %s: %s" % (self.indexFile, results))
+        return(results)
+
+    def remove(self, jsonFile):
+        for table in ['sources', 'deliveries', 'tiles']:
+            self.connection.execute("DELETE FROM %s WHERE jsonFile = ?" % table, (jsonFile,))
+
+    def getTable(self, level):
+        ''' Query ready deliveries or tiles, loaded from the index once after each update '''
+        if not level in self.tables:
+            if level == 'deliveries':
+                query = "SELECT jsonFile, iso3, location, vendor, resMin, resMax, bandsMin, bandsMax, dateMin, dateMax, geometry FROM deliveries"
+            else:
+                query = "SELECT jsonFile, file, resMin, bandsMax, dateMin, dateMax, geohash, geometry FROM tiles"
+            data = pd.read_sql_query(query, self.connection)
+            data['dateMin'] = data['dateMin'].fillna(UNKNOWN_DATE).astype('int64')
+            data['dateMax'] = data['dateMax'].fillna(UNKNOWN_DATE).astype('int64')
+            self.tables[level] = catalogTable(data)
+        return(self.tables[level])
+
+    def query(self, aoi=None, startDate=None, endDate=None, resolution=None, minBands=None, geohashPrefix=None, level='deliveries'):
+        ''' Find the deliveries or tiles matching every criteria that is given
+
+        Parameters:
+            aoi (shapely geometry) (optional): WGS84 area of interest; footprints must intersect it
+            startDate, endDate (string or int) (optional): YYYYMMDD; capture dates must overlap the range
+            resolution (float) (optional): coarsest resolution accepted; the finest imagery must be at least this fine
+            minBands (int) (optional): fewest bands accepted
+            geohashPrefix (string) (optional): tiles whose geohash starts with this prefix (tile level only)
+            level (string) (optional): 'deliveries' or 'tiles'
+
+        RETURNS
+        [geopandas dataframe] - matching rows, with the footprint as geometry
+        '''
+        if geohashPrefix is not None and level != 'tiles':
+            raise(ValueError("geohashPrefix queries are only available for tiles"))
+        start = time.time()
+        table = self.getTable(level)
+        idx = table.select(aoi, startDate, endDate, resolution, minBands, geohashPrefix)
+        res = gpd.GeoDataFrame(table.data.iloc[idx].drop(columns=['geometry']), geometry=table.geometry[idx], crs='epsg:4326')
+        logging.info("Catalog query on %s %s: %s found in %.1f ms" % (len(table.data), level, len(idx), (time.time() - start) * 1000))
+        return(res)
+
+    def close(self):
+        self.connection.close()
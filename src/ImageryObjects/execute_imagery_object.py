@@ -6,58 +6,64 @@ cmd_folder = os.path.dirname(os.path.realpath(os.path.abspath(os.path.split(insp
 if cmd_folder not in sys.path:
     sys.path.insert(0, cmd_folder)
 
-import imageryObject
+import imageryObject, catalogIndex, statusStore, imageryPipeline, runMetrics
 
 baseFolder = r"\\ddhprdcifs\DDH-PRD\ddhfiles\internal"
 inputFolder = r"\\ddhprdcifs\DDH-PRD\ddhfiles\internal\imagerysource\Vendor_Distributions"
 outLogFile = r"\\ddhprdcifs\DDH-PRD\ddhfiles\internal\imagerysource\Logs\Imagery_Log_%s.csv" % datetime.date.today().strftime("%Y_%m_%d")
 finalLogFile = r"\\ddhprdcifs\DDH-PRD\ddhfiles\internal\imagerysource\Logs\CURRENT_Imagery_Log.csv"
+statusFile = r"\\ddhprdcifs\DDH-PRD\ddhfiles\internal\imagerysource\Logs\Imagery_Status.sqlite"
+#Per stage timing and I/O of every zipfile, as JSON lines; set to None to run without recording
+metricsFile = r"\\ddhprdcifs\DDH-PRD\ddhfiles\internal\imagerysource\Logs\Imagery_Metrics_%s.jsonl" % datetime.date.today().strftime("%Y_%m_%d")
 performUpload = False
-
-log = open(outLogFile, 'wb')
-log.write("Sensor,ZipFile,SourceExists,SourceLocation,ServiceExists,ServiceSource,ServiceSourceOID,SourceService\n")
-
+#Size of the pool of each stage; tiling runs in separate processes, uploads are always one at a time
+statusWorkers = 4
+extractWorkers = 2
+tileWorkers = 4
 
 '''prints the time along with the message'''
 def tPrint(s):
     print"%s\t%s" % (time.strftime("%H:%M:%S"), s)
 
-allFiles = []
-
-for dirName, subdirList, fileList in os.walk(inputFolder):
-    #Run through and copy all the files in the fileList
-    sensor = os.path.basename(dirName)
-    for f in fileList:        
-        if f[-4:] == ".zip" and not sensor in ['SPOT5','DRONE','DEM','AERIAL']:
-            allFiles.append([f, sensor])
-
-#allFiles = [['055997346020_01.zip', 'WV02']]
-
-for s in allFiles:
-    inputZip = "%s/%s/%s" % (inputFolder, s[1], s[0])    
-    xx = imageryObject.imageryZip(inputZip, s[1])       
-    print xx.statusUpdate
-    if xx.sourceExists == False:
-        print "*****Extracting and Tiling*****"
-        xx.extractandTile()
-    #Get outlines of source imagery and create output GEOJSON
-    if xx.sourceExists:
-        xx.createImageOutlines()
-    if xx.serviceExists == False and performUpload:
-        print "*****Uploading Source*****"
-        xx.uploadSourceData()
+if __name__ == "__main__":
+    #Status of every zipfile, indexed on sensor and zipfile; seeded from the current log on first use
+    runStart = datetime.datetime.now().isoformat()
+    if metricsFile:
+        runMetrics.start(metricsFile)
+    imageryStatus = statusStore.imageryStatusStore(statusFile)
+    if imageryStatus.count() == 0 and os.path.exists(finalLogFile):
+        imageryStatus.loadCSV(finalLogFile)
+
+    allFiles = []
+    for dirName, subdirList, fileList in os.walk(inputFolder):
+        #Run through and copy all the files in the fileList
+        sensor = os.path.basename(dirName)
+        for f in fileList:        
+            if f[-4:] == ".zip" and not sensor in ['SPOT5','DRONE','DEM','AERIAL']:
+                allFiles.append(["%s/%s/%s" % (inputFolder, sensor, f), sensor])
+
+    #allFiles = [['%s/WV02/055997346020_01.zip' % inputFolder, 'WV02']]
+
+    #Service catalogs are exported and read once, then shared by all zipfiles
+    serviceCatalog = catalogIndex.catalogIndex(catalogIndex.arcpyCatalogBackend())
+    pipeline = imageryPipeline.imageryPipeline(statusWorkers=statusWorkers, extractWorkers=extractWorkers,
+                                               tileWorkers=tileWorkers, performUpload=performUpload,
+                                               catalog=serviceCatalog, statusStore=imageryStatus)
+    with runMetrics.measure("run", inputFolder):
+        pipeline.run(allFiles)
     
-    #xx.finalProcessing()
-    log.write(xx.statusUpdate)
-    log.write("\n")
-log.close()
-shutil.copyfile(outLogFile, finalLogFile)
-
-print ("Finsihed Log")
-stop = timeit.default_timer()
-print stop - start
-
-#synchronize the derived RGB
-#fileGDB = imageryObject.ImageryGDB()
-#fileGDB.updateFields()
-#fileGDB.applyStretch()
+    imageryStatus.exportCSV(outLogFile, since=runStart)
+    imageryStatus.close()
+    shutil.copyfile(outLogFile, finalLogFile)
+
+    print ("Finsihed Log")
+    for line in runMetrics.stop():
+        tPrint(line)
+    stop = timeit.default_timer()
+    print stop - start
+
+    #synchronize the derived RGB; field and stretch updates are queued and applied in bulk by finalProcessing
+    #fileGDB = imageryObject.ImageryGDB()
+    #fileGDB.updateFields()
+    #fileGDB.applyStretch()
+    #fileGDB.finalProcessing()
@@ -0,0 +1,103 @@
+###############################################################################
+# Folder Inventory
+# Purpose: list a delivered imagery folder once, with os.scandir, and keep the
+#   name, size, modification time and kind of every file. Vendor detection,
+#   image discovery, sidecar lookup, header caching and zipping all read this
+#   snapshot instead of walking the (often network) folder again
+###############################################################################
+
+import os, time, fnmatch, logging, collections
+
+# File endings treated as imagery, the same test findImages has always used
+imageFileTypes = ["TIF", "tif", 'JP2']
+metadataExtensions = ['.xml', '.imd', '.til', '.rpb', '.json', '.dim']
+logExtensions = ['.txt', '.log']
+
+inventoryEntry = collections.namedtuple('inventoryEntry', ['path', 'name', 'folder', 'size', 'mtime', 'kind'])
+
+def classifyFile(name):
+    ''' RETURNS [string] - kind of file: 'image', 'browse', 'metadata', 'log' or 'other' '''
+    for fileType in imageFileTypes:
+        if name[-len(fileType):] == fileType:
+            return('image')
+    upper = name.upper()
+    if upper.endswith("BROWSE.JPG") or upper.startswith("PREVIEW"):
+        return('browse')
+    ext = os.path.splitext(name)[1].lower()
+    if ext in metadataExtensions:
+        return('metadata')
+    if ext in logExtensions:
+        return('log')
+    return('other')
+
+class folderInventory(object):
+    def __init__(self, inputFolder):
+        ''' Snapshot of every file under inputFolder, read in a single pass
+
+        Parameters:
+            inputFolder (string): folder to list; files are listed in os.walk order
+        '''
+        self.inputFolder = inputFolder
+        self.entries = []
+        self.topNames = []
+        self.byPath = {}
+        self.byFolder = {}
+        self.scan()
+
+    def scan(self):
+        ''' List the folder tree; every directory is read exactly once with os.scandir '''
+        start = time.time()
+        folders = [self.inputFolder]
+        while folders:
+            folder = folders.pop()
+            subFolders = []
+            names = []
+            with os.scandir(folder) as it:
+                for entry in it:
+                    names.append(entry.name)
+                    if entry.is_dir():
+                        #Linked folders are listed but not followed, as os.walk does
+                        if not entry.is_symlink():
+                            subFolders.append(entry.path)
+                        continue
+                    fileStat = entry.stat()
+                    curEntry = inventoryEntry(entry.path, entry.name, folder, fileStat.st_size,
+                                              fileStat.st_mtime_ns, classifyFile(entry.name))
+                    self.entries.append(curEntry)
+                    self.byPath[entry.path] = curEntry
+                    self.byFolder.setdefault(os.path.dirname(entry.path), []).append(entry.name)
+            if folder == self.inputFolder:
+                self.topNames = names
+            #Depth first, in listing order, as os.walk does
+            folders.extend(reversed(subFolders))
+        self.seconds = time.time() - start
+        logging.info("Inventory of %s: %s files (%s images) in %.2fs" % (self.inputFolder, len(self.entries),
+                     len(self.files('image')), self.seconds))
+
+    def names(self):
+        ''' RETURNS [list of strings] - names of the files and folders directly in inputFolder, as os.listdir '''
+        return(list(self.topNames))
+
+    def files(self, kind=None):
+        ''' RETURNS [list of strings] - paths of every file, or of every file of one kind (see classifyFile) '''
+        return([x.path for x in self.entries if kind is None or x.kind == kind])
+
+    def images(self):
+        return(self.files('image'))
+
+    def contains(self, path):
+        return(path in self.byPath)
+
+    def match(self, folder, pattern):
+        ''' RETURNS [list of strings] - sorted paths of the files in folder whose name matches a glob pattern '''
+        return(sorted(os.path.join(folder, x) for x in fnmatch.filter(self.byFolder.get(folder, []), pattern)))
+
+    def fileKey(self, path):
+        ''' RETURNS [tuple] - (size in bytes, modification time in nanoseconds) recorded for a file, the same
+            form as headerCache.rasterHeaderCache.fileKey
+        '''
+        curEntry = self.byPath[path]
+        return((curEntry.size, curEntry.mtime))
+
+    def totalSize(self):
+        return(sum(x.size for x in self.entries))
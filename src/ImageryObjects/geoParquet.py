@@ -0,0 +1,147 @@
+###############################################################################
+# GeoParquet Footprints
+# Purpose: store tile metadata and imagery extents as GeoParquet instead of
+#   CSV with WKT. Rows are ordered by geohash so every row group covers a
+#   compact area, and a bbox column lets bounding box reads skip row groups;
+#   only the requested columns are read and geometries are never parsed as text
+###############################################################################
+
+import os, json, shutil, tempfile, geohash, shapely
+
+import geopandas as gpd
+import pandas as pd
+import numpy as np
+import pyarrow.parquet as pq
+
+# Rows per row group; the unit that a bounding box read can skip
+ROW_GROUP_SIZE = 5000
+parquetExtensions = ['.parquet', '.geoparquet']
+
+def isParquet(inFile):
+    return(os.path.splitext(inFile)[1].lower() in parquetExtensions)
+
+def addGeohash(footprints, geohashField='geohash'):
+    ''' Add the geohash of the centroid of every footprint, if the column does not already exist '''
+    if not geohashField in footprints.columns:
+        centroids = shapely.centroid(footprints.to_crs('epsg:4326').geometry.values)
+        footprints[geohashField] = [geohash.encode(y, x) if np.isfinite(x) else "" for x, y in
+                                    zip(shapely.get_x(centroids), shapely.get_y(centroids))]
+    return(footprints)
+
+def writeGeoParquet(footprints, outFile, rowGroupSize=ROW_GROUP_SIZE, geohashField='geohash'):
+    ''' Write footprints to GeoParquet, sorted by geohash, with a bbox covering column
+
+    Parameters:
+        footprints (geopandas dataframe): i.e. - deliveredImageryFolder.getMetadata() or consolidated extents
+        outFile (string): output .parquet file
+        rowGroupSize (int): rows per row group
+
+    RETURNS
+    [string] - outFile
+    '''
+    #A default index is not worth storing, a named one (i.e. - zipFile) is
+    keepIndex = not isinstance(footprints.index, pd.RangeIndex)
+    footprints = addGeohash(footprints.copy(), geohashField)
+    footprints = footprints.sort_values(geohashField, kind='stable')
+    footprints.to_parquet(outFile, index=keepIndex, row_group_size=rowGroupSize, write_covering_bbox=True)
+    return(outFile)
+
+def writeGeoParquetBatches(batches, outFile, rowGroupSize=ROW_GROUP_SIZE, geohashField='geohash'):
+    ''' Write footprints that arrive in batches to a single GeoParquet file, holding one batch in memory at a
+        time. Every batch is sorted by geohash on its own and written as its own row groups; the bbox and
+        geometry types of the geo metadata cover all batches
+
+    Parameters:
+        batches (iterable of geopandas dataframes): footprints with the same columns, i.e. -
+            metadataBatches.metadataBatch.toFrame() of every batch of a folder
+
+    RETURNS
+    [string] - outFile
+    '''
+    tempFolder = tempfile.mkdtemp(prefix="batches_", dir=os.path.dirname(os.path.abspath(outFile)))
+    try:
+        batchFiles = []
+        for idx, batch in enumerate(batches):
+            batchFiles.append(writeGeoParquet(batch, os.path.join(tempFolder, "%06d.parquet" % idx), rowGroupSize, geohashField))
+        if len(batchFiles) == 0:
+            raise(ValueError("No footprints to write to %s" % outFile))
+        schema = pq.read_schema(batchFiles[0])
+        geo = json.loads(schema.metadata[b'geo'])
+        geomField = geo['primary_column']
+        bounds = []
+        geometryTypes = set()
+        for batchFile in batchFiles:
+            column = json.loads(pq.read_schema(batchFile).metadata[b'geo'])['columns'][geomField]
+            bounds.append(column['bbox'])
+            geometryTypes.update(column['geometry_types'])
+        bounds = np.array(bounds)
+        geo['columns'][geomField]['bbox'] = [bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()]
+        geo['columns'][geomField]['geometry_types'] = sorted(geometryTypes)
+        metadata = dict(schema.metadata)
+        metadata[b'geo'] = json.dumps(geo).encode()
+        schema = schema.with_metadata(metadata)
+        with pq.ParquetWriter(outFile, schema) as writer:
+            for batchFile in batchFiles:
+                writer.write_table(pq.read_table(batchFile).cast(schema), row_group_size=rowGroupSize)
+    finally:
+        shutil.rmtree(tempFolder, ignore_errors=True)
+    return(outFile)
+
+def geometryColumn(inFile):
+    ''' RETURNS [string] - name of the primary geometry column of a GeoParquet file; stored as WKB '''
+    return(json.loads(pq.read_schema(inFile).metadata[b'geo'])['primary_column'])
+
+def readGeoParquet(inFile, columns=None, bbox=None):
+    ''' Read footprints from GeoParquet
+
+    Parameters:
+        inFile (string): GeoParquet file
+        columns (list of strings) (optional): columns to read; without the geometry column a plain dataframe is returned
+        bbox (list of floats) (optional): [xmin, ymin, xmax, ymax]; only footprints intersecting this box are read
+
+    RETURNS
+    [geopandas dataframe]
+    '''
+    geomField = geometryColumn(inFile)
+    if columns is not None and not geomField in columns:
+        if bbox is not None:
+            footprints = gpd.read_parquet(inFile, columns=list(columns) + [geomField], bbox=bbox)
+            return(pd.DataFrame(footprints[list(columns)]))
+        return(pd.read_parquet(inFile, columns=list(columns)))
+    return(gpd.read_parquet(inFile, columns=columns, bbox=bbox))
+
+def writeFootprints(footprints, outFile, **kwargs):
+    ''' Write footprints as GeoParquet (.parquet) or as csv with WKT geometry (any other extension) '''
+    if isParquet(outFile):
+        return(writeGeoParquet(footprints, outFile, **kwargs))
+    footprints.to_csv(outFile)
+    return(outFile)
+
+def writeFootprintBatches(batches, outFile, **kwargs):
+    ''' writeFootprints for footprints that arrive in batches (see writeGeoParquetBatches); csv files are appended to '''
+    if isParquet(outFile):
+        return(writeGeoParquetBatches(batches, outFile, **kwargs))
+    rows = 0
+    for batch in batches:
+        batch.index = pd.RangeIndex(rows, rows + len(batch))
+        batch.to_csv(outFile, mode='w' if rows == 0 else 'a', header=rows == 0)
+        rows += len(batch)
+    return(outFile)
+
+def readFootprints(inFile, columns=None, bbox=None, crs='epsg:4326', geometryField='geometry'):
+    ''' Read footprints written by writeFootprints; geometries in csv files are parsed in bulk
+        from the WKT in geometryField
+
+    RETURNS
+    [geopandas dataframe]
+    '''
+    if isParquet(inFile):
+        return(readGeoParquet(inFile, columns, bbox))
+    footprints = pd.read_csv(inFile, index_col=0)
+    footprints[geometryField] = gpd.GeoSeries.from_wkt(footprints[geometryField].values, index=footprints.index)
+    footprints = gpd.GeoDataFrame(footprints, geometry=geometryField, crs=crs)
+    if bbox is not None:
+        footprints = footprints.iloc[np.sort(footprints.sindex.query(shapely.box(*bbox)))]
+    if columns is not None:
+        footprints = footprints[list(columns)]
+    return(footprints)
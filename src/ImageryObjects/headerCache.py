@@ -0,0 +1,85 @@
+###############################################################################
+# Raster Header Cache
+# Purpose: persist the per-tile header information read by rasterHeaders in a
+#   SQLite database so that re-running over unchanged folders only needs to
+#   stat files rather than open every raster
+###############################################################################
+
+import os, sqlite3, logging
+
+from shapely import wkb
+
+class rasterHeaderCache(object):
+    def __init__(self, cacheFile):
+        ''' Open (or create) an on-disk cache of raster headers
+
+        Entries are keyed by file path and are only valid while the size and modification time
+        of the file match the values recorded when the header was read
+
+        Parameters:
+            cacheFile (string): path to SQLite database, i.e. - os.path.join(log_Folder, "raster_headers.sqlite")
+        '''
+        self.cacheFile = cacheFile
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(cacheFile)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS headers (
+            path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hasCRS INTEGER,
+            bands INTEGER, res REAL, geometry BLOB, geohash TEXT, columns INTEGER, rows INTEGER,
+            nativeRes REAL, crs TEXT)''')
+        self.connection.commit()
+
+    def fileKey(self, inFile):
+        ''' Identity of a file on disk; the cached header is discarded when this changes
+
+        RETURNS
+        [tuple] - (size in bytes, modification time in nanoseconds)
+        '''
+        fileStat = os.stat(inFile)
+        return((fileStat.st_size, fileStat.st_mtime_ns))
+
+    def lookup(self, allImages, fileKeys=None):
+        ''' Find the cached headers for a list of rasters; fileKeys of every raster can be passed in when already
+            known (i.e. - from folderInventory.fileKey) to avoid a stat per raster
+
+        RETURNS
+        [tuple] - (headers, fileKeys, missing) where headers holds the cached header for each input
+            (None if not cached), fileKeys the current identity of each file and missing the indices
+            of the inputs that need to be read
+        '''
+        headers = [None] * len(allImages)
+        if fileKeys is None:
+            fileKeys = [self.fileKey(inFile) for inFile in allImages]
+        missing = []
+        for idx, inFile in enumerate(allImages):
+            curKey = fileKeys[idx]
+            row = self.connection.execute("SELECT * FROM headers WHERE path = ?", (inFile,)).fetchone()
+            if row is None or (row[1], row[2]) != curKey:
+                missing.append(idx)
+                continue
+            if row[3]:
+                headers[idx] = {'Bands':row[4], 'Res':row[5], 'geometry':wkb.loads(row[6]), 'geohash':row[7],
+                                'columns':row[8], 'rows':row[9], 'nativeRes':row[10], 'crs':row[11]}
+        self.hits += len(allImages) - len(missing)
+        self.misses += len(missing)
+        return((headers, fileKeys, missing))
+
+    def store(self, entries):
+        ''' Write freshly read headers to the cache
+
+        Parameters:
+            entries (list of tuples): (file path, fileKey at the time of reading, header or None)
+        '''
+        rows = []
+        for inFile, curKey, h in entries:
+            if h is None:
+                rows.append((inFile, curKey[0], curKey[1], 0) + (None,) * 8)
+            else:
+                rows.append((inFile, curKey[0], curKey[1], 1, h['Bands'], h['Res'], wkb.dumps(h['geometry']),
+                             h['geohash'], h['columns'], h['rows'], h['nativeRes'], h['crs']))
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO headers VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+        logging.info("Raster header cache: %s hits, %s misses" % (self.hits, self.misses))
+
+    def close(self):
+        self.connection.close()
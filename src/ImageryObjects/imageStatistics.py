@@ -0,0 +1,295 @@
+###############################################################################
+# Image Statistics
+# Purpose: per band minimum, maximum, mean, standard deviation, percentiles and
+#   histogram of every source raster, read from its internal overviews rather
+#   than the full resolution pixels. Rasters are read in parallel and the
+#   results are kept in a SQLite cache keyed by file identity, so unchanged
+#   rasters are never read twice. The statistics are rendered into a stretch
+#   raster function template per mosaic item; items whose stretch renders the
+#   same share a template, so a whole mosaic is stretched with one edit per
+#   template rather than a raster layer per row
+# NOTE: imported by imageryObject, keep compatible with Python 2.7 (ArcGIS)
+###############################################################################
+
+import os, csv, json, time, sqlite3, logging
+import xml.etree.ElementTree as ET
+import rasterio
+
+import numpy as np
+
+from multiprocessing.pool import ThreadPool
+from rasterio.enums import Resampling
+
+try:
+    from . import overviewReading, runMetrics
+except (ImportError, ValueError):
+    import overviewReading, runMetrics
+
+# Longest side, in pixels, of the sample every raster's statistics are computed from
+MAX_SAMPLE_SIZE = 1024
+DEFAULT_PERCENTILES = [2, 98]
+HISTOGRAM_BINS = 256
+
+# StretchType values of the Stretch raster function
+STRETCH_MINIMUM_MAXIMUM = 5
+
+def readStatistics(inFile, maxSize=MAX_SAMPLE_SIZE, percentiles=DEFAULT_PERCENTILES, bins=HISTOGRAM_BINS):
+    ''' Statistics of every band of a raster from the smallest overview at least maxSize pixels on its
+        longest side; rasters without overviews are read decimated from full resolution. Nodata and
+        masked pixels are ignored
+
+    RETURNS
+    [dictionary] - overview (level read, None without overviews), sample (columns, rows read), dtype and
+        bands: for every band min, max, mean, std, pixels (valid pixels sampled), percentiles (list of
+        [percentile, value]) and histogram (counts of bins equal bins from histogramRange [low, high]);
+        a band without valid pixels only has pixels (0)
+    '''
+    with rasterio.open(inFile) as curRaster:
+        level = overviewReading.chooseOverview(curRaster, maxSize)
+    openArgs = {} if level is None else {'overview_level':level}
+    with rasterio.open(inFile, **openArgs) as curRaster:
+        outRows, outCols = overviewReading.sampleShape(curRaster, maxSize)
+        dtype = curRaster.dtypes[0]
+        data = curRaster.read(out_shape=(curRaster.count, outRows, outCols), masked=True, resampling=Resampling.nearest)
+    bands = []
+    for band in data:
+        values = band.compressed()
+        if values.size == 0:
+            bands.append({'pixels':0})
+            continue
+        low, high = values.min().item(), values.max().item()
+        #8 bit bands get one bin per value, every other type bins its own range
+        histogramRange = [0, 256] if dtype == 'uint8' else [low, high]
+        counts = np.histogram(values, bins=bins, range=histogramRange)[0]
+        bands.append({'min':low, 'max':high, 'mean':float(values.mean()), 'std':float(values.std()),
+                      'pixels':int(values.size),
+                      'percentiles':[[p, float(v)] for p, v in zip(percentiles, np.percentile(values, percentiles))],
+                      'histogram':counts.tolist(), 'histogramRange':histogramRange})
+    return({'overview':level, 'sample':[outCols, outRows], 'dtype':dtype, 'bands':bands})
+
+class statisticsCache(object):
+    def __init__(self, cacheFile):
+        ''' Open (or create) an on-disk cache of raster statistics, in the manner of headerCache.rasterHeaderCache
+
+        Entries are keyed by file path and are only valid while the size and modification time of the
+        file, and the settings the statistics were computed with, match the values recorded
+
+        Parameters:
+            cacheFile (string): path to SQLite database, i.e. - os.path.join(log_Folder, "raster_statistics.sqlite")
+        '''
+        self.cacheFile = cacheFile
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(cacheFile, check_same_thread=False)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS statistics (
+            path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, settings TEXT, statistics TEXT)''')
+        self.connection.commit()
+
+    def fileKey(self, inFile):
+        ''' RETURNS [tuple] - (size in bytes, modification time in nanoseconds), as rasterHeaderCache.fileKey '''
+        fileStat = os.stat(inFile)
+        #st_mtime_ns is not available in Python 2
+        return((fileStat.st_size, getattr(fileStat, 'st_mtime_ns', int(fileStat.st_mtime * 1e9))))
+
+    def lookup(self, allImages, settings):
+        ''' Find the cached statistics of a list of rasters
+
+        RETURNS
+        [tuple] - (statistics, fileKeys, missing) where statistics holds the cached statistics of each input
+            (None if not cached), fileKeys the current identity of each file and missing the indices of the
+            inputs that need to be read
+        '''
+        statistics = [None] * len(allImages)
+        fileKeys = [None] * len(allImages)
+        missing = []
+        for idx, inFile in enumerate(allImages):
+            try:
+                fileKeys[idx] = self.fileKey(inFile)
+            except OSError:
+                #Left for scanStatistics to report as unreadable
+                missing.append(idx)
+                continue
+            row =self.connection.execute("SELECT size, mtime, settings, statistics FROM statistics WHERE path = ?",
+                                          (inFile,)).fetchone()
+            if row is None or (row[0], row[1]) != fileKeys[idx] or row[2] != settings:
+                missing.append(idx)
+                continue
+            statistics[idx] = json.loads(row[3])
+        self.hits += len(allImages) - len(missing)
+        self.misses += len(missing)
+        return((statistics, fileKeys, missing))
+
+    def store(self, entries, settings):
+        ''' Write freshly read statistics to the cache
+
+        Parameters:
+            entries (list of tuples): (file path, fileKey at the time of reading, statistics)
+        '''
+        rows = [(inFile, curKey[0], curKey[1], settings, json.dumps(stats)) for inFile, curKey, stats in entries]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO statistics VALUES (?,?,?,?,?)", rows)
+        logging.info("Raster statistics cache: %s hits, %s misses" % (self.hits, self.misses))
+
+    def close(self):
+        self.connection.close()
+
+def scanStatistics(allImages, workers=4, cache=None, maxSize=MAX_SAMPLE_SIZE, percentiles=DEFAULT_PERCENTILES,
+                   bins=HISTOGRAM_BINS):
+    ''' Statistics of a list of rasters, read in parallel; see readStatistics
+
+    Parameters:
+        allImages (list of strings): rasters to read
+        workers (int): number of rasters read at once
+        cache (statisticsCache) (optional): rasters already in the cache are not read again
+
+    RETURNS
+    [list] - statistics of every input, in the same order as allImages; None where the raster could not be read
+    '''
+    settings = json.dumps([maxSize, list(percentiles), bins])
+    if cache is not None:
+        statistics, fileKeys, missing = cache.lookup(allImages, settings)
+    else:
+        statistics, fileKeys, missing = [None] * len(allImages), None, list(range(len(allImages)))
+    def readOne(inFile):
+        start = time.time()
+        try:
+            return([readStatistics(inFile, maxSize, percentiles, bins), time.time() - start])
+        except Exception as e:
+            logging.warning("Could not read statistics of %s: %s" % (inFile, e))
+            return([None, time.time() - start])
+    toRead = [allImages[idx] for idx in missing]
+    #Every raster is opened twice, for its overviews and for its pixels
+    runMetrics.countIO(opened=2 * len(toRead))
+    workers = max(1, min(int(workers), len(toRead)))
+    if workers == 1:
+        results = [readOne(x) for x in toRead]
+    else:
+        pool = ThreadPool(workers)
+        try:
+            results = pool.map(readOne, toRead)
+        finally:
+            pool.close()
+            pool.join()
+    for idx, (stats, seconds) in zip(missing, results):
+        statistics[idx] = stats
+        logging.info("Statistics %s: %.2fs, overview %s" % (allImages[idx], seconds,
+                     None if stats is None else stats['overview']))
+    if cache is not None:
+        cache.store([(allImages[idx], fileKeys[idx], statistics[idx]) for idx in missing if statistics[idx] is not None],
+                    settings)
+    return(statistics)
+
+def stretchStatistics(stats, percentiles=DEFAULT_PERCENTILES, decimals=0):
+    ''' Input range of the stretch of one raster: the low and high percentiles of every band, or the band
+        minimum and maximum if percentiles is None, with the band mean and standard deviation, rounded to decimals
+
+    RETURNS
+    [list of lists] - [min, max, mean, standard deviation] of every band, None if a band has no valid pixels
+    '''
+    bandStats = []
+    for band in stats['bands']:
+        if band['pixels'] == 0:
+            return(None)
+        if percentiles is None:
+            low, high = band['min'], band['max']
+        else:
+            values = dict((p, v) for p, v in band['percentiles'])
+            low, high = values[percentiles[0]], values[percentiles[1]]
+        bandStats.append([round(float(x), decimals) for x in [low, high, band['mean'], band['std']]])
+    return(bandStats)
+
+def _declaredNamespaces(templateFile):
+    ''' RETURNS [list of tuples] - (prefix, uri) of every namespace declared in templateFile '''
+    return([ns for event, ns in ET.iterparse(templateFile, events=['start-ns'])])
+
+def renderStretch(templateFile, bandStats, stretchType=STRETCH_MINIMUM_MAXIMUM):
+    ''' Fill the Stretch function of a raster function template (i.e. - Templates/mini_max_stretch_255Max.rft.xml)
+        with the statistics of one raster. Dynamic range adjustment and statistics estimation are switched
+        off, so the stretch maps bandStats to the output Min and Max of the template for every view
+
+    Parameters:
+        templateFile (string): raster function template holding a StretchFunction
+        bandStats (list of lists): [min, max, mean, standard deviation] of every band; see stretchStatistics
+        stretchType (int): StretchType of the rendered function; the default stretches between min and max
+
+    RETURNS
+    [string] - the rendered template
+    '''
+    namespaces = _declaredNamespaces(templateFile)
+    for prefix, uri in namespaces:
+        ET.register_namespace(prefix, uri)
+    xsiType = '{http://www.w3.org/2001/XMLSchema-instance}type'
+    root = ET.parse(templateFile).getroot()
+    for arguments in root.iter('Arguments'):
+        if arguments.get(xsiType) != 'typens:StretchFunctionArguments':
+            continue
+        for variable in arguments.find('Values'):
+            #Variables are named after their argument, with a timestamp suffix (i.e. - Min_2017919_163931_194)
+            name = variable.findtext('Name').split("_")[0]
+            value = variable.find('Value')
+            if name == 'StretchType':
+                value.text = str(stretchType)
+            elif name in ['DRA', 'EstimateStatsHistogram']:
+                value.text = 'false'
+            elif name == 'Statistics':
+                value.clear()
+                value.set(xsiType, 'typens:ArrayOfArrayOfDouble')
+                for band in bandStats:
+                    bandValues = ET.SubElement(value, 'ArrayOfDouble', {xsiType:'typens:ArrayOfDouble'})
+                    for x in band:
+                        ET.SubElement(bandValues, 'Double').text = repr(float(x))
+    #Prefixes only used inside attribute values (i.e. - xs:double) are not declared by ElementTree
+    used = set()
+    for element in root.iter():
+        for key in [element.tag] + list(element.keys()):
+            if key.startswith("{"):
+                used.add(key[1:].split("}")[0])
+    for prefix, uri in namespaces:
+        if not uri in used:
+            root.set("xmlns:%s" % prefix, uri)
+    return(ET.tostring(root).decode('utf-8'))
+
+def renderItemStretches(items, templateFile, outFolder, workers=4, cache=None, percentiles=DEFAULT_PERCENTILES,
+                        decimals=0, maxSize=MAX_SAMPLE_SIZE):
+    ''' Render the stretch of every item of a mosaic from the statistics of its raster; items whose
+        stretch renders the same share one template file. A manifest (stretches.csv) of the template of
+        every item is written to outFolder
+
+    Parameters:
+        items (list of lists): [item id (i.e. - OBJECTID), raster path] of every item
+        templateFile (string): raster function template holding a StretchFunction; see renderStretch
+        outFolder (string): folder the rendered templates and manifest are written to
+        workers, cache, maxSize: see scanStatistics
+        percentiles, decimals: see stretchStatistics
+
+    RETURNS
+    [list of lists] - [template file, list of item ids] for every rendered template; items whose
+        raster could not be read are left out
+    '''
+    if not os.path.exists(outFolder):
+        os.makedirs(outFolder)
+    statistics = scanStatistics([x[1] for x in items], workers, cache, maxSize,
+                                DEFAULT_PERCENTILES if percentiles is None else percentiles)
+    groups = {}
+    rendered = []
+    manifest = []
+    for (itemId, inFile), stats in zip(items, statistics):
+        bandStats = None if stats is None else stretchStatistics(stats, percentiles, decimals)
+        if bandStats is None:
+            logging.warning("No stretch for item %s, %s has no statistics" % (itemId, inFile))
+            continue
+        key = json.dumps(bandStats)
+        if not key in groups:
+            stretchFile = os.path.join(outFolder, "stretch_%s.rft.xml" % len(groups))
+            with open(stretchFile, 'w') as out:
+                out.write(renderStretch(templateFile, bandStats))
+            groups[key] = [stretchFile, []]
+            rendered.append(groups[key])
+        groups[key][1].append(itemId)
+        manifest.append([itemId, inFile, groups[key][0]])
+    with open(os.path.join(outFolder, "stretches.csv"), 'w') as out:
+        writer = csv.writer(out)
+        writer.writerow(["ItemID", "Path", "Template"])
+        writer.writerows(manifest)
+    logging.info("Stretch of %s items rendered into %s templates in %s" % (len(manifest), len(groups), outFolder))
+    return(rendered)
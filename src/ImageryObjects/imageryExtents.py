@@ -4,21 +4,21 @@
 # Purpose: extract a zipfile of delivered imagery and extract imagery extents
 ###############################################################################
 
-import os, sys, zipfile, json, shutil, logging
-import rasterio, pyproj, geohash
+import os, zipfile, json, shutil, logging
+import rasterio, pyproj, geohash, shapely
 
-import xml.etree.ElementTree as ET 
 import geopandas as gpd
 import pandas as pd
 import numpy as np
 
-from datetime import datetime
-from functools import partial
-from shapely.geometry import Polygon, LineString, Point, box
+from concurrent.futures import ThreadPoolExecutor
+from shapely.geometry import Polygon
 from PIL import Image
-from shapely.ops import transform
-from zipfile import ZipFile
 
+try:
+    from . import rasterHeaders, boundaryIndex, imageryPackaging, thumbnails, archiveIndex, geoParquet, validFootprints, vendorMetadata, folderInventory, runMetrics, metadataBatches
+except ImportError:
+    import rasterHeaders, boundaryIndex, imageryPackaging, thumbnails, archiveIndex, geoParquet, validFootprints, vendorMetadata, folderInventory, runMetrics, metadataBatches
 
 Image.MAX_IMAGE_PIXELS = 89478485000000
 vendorInformation = {
@@ -28,20 +28,53 @@ vendorInformation = {
     'gbdx_clip':{'browseTag':''},
     'Airbus':{'browseTag':'PREVIEW_*.JPG'}
 }
-allFileTypes = ["TIF", "tif", 'JP2']
+allFileTypes = folderInventory.imageFileTypes
+# 'bounds' uses the bounding box of every tile, 'valid' outlines the pixels holding data (see validFootprints)
+footprintModes = ['bounds', 'valid']
 
 class deliveredImageryFolder(object):
 
-    def __init__(self, inputFolder, outputFolder, adminBoundaries, vendor = '', metadata=''):
+    def __init__(self, inputFolder, outputFolder, adminBoundaries, vendor = '', metadata='', scanWorkers=1, scanExecutor="thread", headerCache=None,
+                 footprintMode='bounds', inventory=None, batchSize=None, unionGridSize=None, decimateWithoutOverviews=False):
         ''' Generate metadata for input images in folder
         
         Parameters:
             inputFolder (string): folder to process
             sensor (string): sensor to process - used to define where to find important metadata        
             adminBoundaries (geopandas geodataframe): file path to shapefile of global bouncaries for finding country of interest
+                can also be a boundaryIndex.adminBoundaryIndex built once and shared between folders
+            metadata (geopandas geodataframe or string) (optional): metadata to use instead of reading the images,
+                or the path to metadata written by writeMetadata (GeoParquet or csv)
+            scanWorkers (int) (optional): number of parallel workers used to read raster headers in getMetadata
+            scanExecutor (string) (optional): 'thread' or 'process' pool used when scanWorkers > 1
+            headerCache (headerCache.rasterHeaderCache) (optional): persistent cache of raster headers, shared between folders
+            footprintMode (string) (optional): one of footprintModes; 'valid' outlines the valid data of every tile,
+                read from its overviews, for the geometries of getMetadata and getImageryExtents
+            inventory (folderInventory.folderInventory) (optional): listing of inputFolder; built here, in a single
+                pass, if not provided. Every method reads the folder from this listing
+            batchSize (int) (optional): stream tile metadata in batches of this many tiles (see iterMetadata) for very
+                large folders; headers and footprints are then read once, one batch at a time, and spooled to disk
+                rather than kept, and getMetadata is never built unless it is called directly
+            unionGridSize (float) (optional): precision grid, in degrees, of the footprint union; see metadataBatches.footprintUnion
+            decimateWithoutOverviews (boolean) (optional): with footprintMode 'valid', outline tiles without internal
+                overviews (i.e. - raw vendor strips) from a decimated read of the full resolution data, rather than
+                keeping their bounding box; see validFootprints.readMask
         '''
+        if not footprintMode in footprintModes:
+            raise(ValueError("footprintMode must be one of %s" % ", ".join(footprintModes)))
         self.inputFolder = inputFolder
+        self.footprintMode = footprintMode
+        self.decimateWithoutOverviews = decimateWithoutOverviews
+        if inventory is None:
+            with runMetrics.measure("folderInventory", inputFolder):
+                inventory = folderInventory.folderInventory(inputFolder)
+        self.inventory = inventory
         self.outputFolder = outputFolder
+        self.scanWorkers = scanWorkers
+        self.scanExecutor = scanExecutor
+        self.headerCache = headerCache
+        self.batchSize = batchSize
+        self.unionGridSize = unionGridSize
         if vendor == '':
             self.vendor = self.determineVendor()
         else:
@@ -50,6 +83,8 @@ class deliveredImageryFolder(object):
             self.process_gbdx_xml()                    
         if metadata.__class__ == gpd.geodataframe.GeoDataFrame:
             self.allMetadata = metadata
+        elif isinstance(metadata, str) and metadata != '':
+            self.allMetadata = geoParquet.readFootprints(metadata)
             
         self.adminBoundaries = adminBoundaries
         self.findImages()
@@ -58,47 +93,33 @@ class deliveredImageryFolder(object):
         self.thumbnail = os.path.join(outputFolder, "%s.jpg" % self.generateFilename())
     
     def process_gbdx_xml(self):
-        ''' Images downloaded through gbdx task clipping come with an XML that should have the information we need
+        ''' Images downloaded through gbdx task clipping come with an XML that should have the information we need;
+            see vendorMetadata.readMaxar
         
         RETURNS
         NULL - sets a number of object variables, such as date
         '''
-        inFiles = os.listdir(self.inputFolder)
+        inFiles = self.inventory.names()
         if "gbdx_clip_log.txt" in inFiles:
             for f in inFiles:
                 if f[-4:] == ".XML":
-                    xml = ET.parse(os.path.join(self.inputFolder, f))
-                    root_element = xml.getroot()
-                    self.official_id = root_element.findall('IMD')[0].findall('IMAGE')[0].findall('CATID')[0].text
-                    date = root_element.findall('IMD')[0].findall('IMAGE')[0].findall('TLCTIME')[0].text
-                    dTime = datetime.strptime(date[:10], "%Y-%m-%d")
-                    cDate = dTime.strftime("%Y%m%d")
-                    self.Date = cDate
+                    xmlFile = os.path.join(self.inputFolder, f)
+                    record = vendorMetadata.readVendorMetadata("gbdx_clip", xmlFile, self.inventory.fileKey(xmlFile))
+                    self.official_id = record['id']
+                    if record['Date'] is not None:
+                        self.Date = record['Date']
     
     def determineVendor(self):
-        ''' Based on folder and file structure, determine the vendor for other calculations
+        ''' Based on folder and file structure, determine the vendor for other calculations; see vendorMetadata.identifyVendor
         
         RETURNS
         [string] - vendor name matching imageryExtents.vendorInformation
         '''
-        inFiles = os.listdir(self.inputFolder)
-        if "gbdx_clip_log.txt" in inFiles:
-            return("gbdx_clip")
-        for f in inFiles:
-            if f[-10:] == "BROWSE.JPG":
-                return("MAXAR")
-            if ("PHR1A" in f) or ("PHR1B" in f):
-                return("Airbus")            
-            if f[:2] == "K5":
-                return("SIIS")
-            if "SPOT" in f:
-                return("SPOT")
-            if f[:3] == "BSG":
-                return("Blacksky")
+        return(vendorMetadata.identifyVendor(self.inventory.names()))
     
     def createJSON(self, pNumber, securityClassification="Official Use Only"):
         if not os.path.exists(self.jsonFile):
-            m = self.allMetadata
+            m = self.summarizeMetadata()
             try:
                 zippedSize = os.path.getsize(self.zipFile)
             except:
@@ -108,123 +129,213 @@ class deliveredImageryFolder(object):
                 "iso3":self.countryISO3,
                 "location":self.zipFile,
                 "zippedSize":zippedSize,
-                "resolution":",".join([str(round(x, 3)) for x in np.unique([m['Res'].min(), m['Res'].max()])]),
-                "nBands":",".join([str(x) for x in np.unique([m['Bands'].min(), m['Bands'].max()])]),
+                "resolution":",".join([str(round(x, 3)) for x in np.unique(m['Res'])]),
+                "nBands":",".join([str(x) for x in np.unique(m['Bands'])]),
                 "vendor":self.vendor,
-                "capture_date":",".join([str(x) for x in np.unique([m['Date'].min(), m['Date'].max()])]),
+                "capture_date":",".join([str(x) for x in np.unique(m['Date'])]),
                 "pNumber":pNumber,
                 "securityClassification":securityClassification,
-                "ImageExtent":self.allMetadata.unary_union.wkt,
+                "ImageExtent":m['union'].wkt,
                 "originalLocation":self.inputFolder
                 #"imageTileDetails":self.allMetadata
             }
-            with open(self.jsonFile, 'w') as j:
-                json.dump(self.metadataDictionary, j)
+            with runMetrics.measure("createJSON", self.inputFolder):
+                with open(self.jsonFile, 'w') as j:
+                    json.dump(self.metadataDictionary, j)
+                    runMetrics.countIO(written=j.tell(), opened=1)
     
-    def zipData(self):    
+    def zipData(self, workers=4):    
+        ''' Zip all files in the input folder; see imageryPackaging.packageFiles
+        
+        Parameters:
+            workers (int) (optional): number of threads preparing members ahead of the writer
+        '''
         #Get a list of all files
         if not os.path.exists(self.zipFile):
-            allFiles = []            
-            for root, dirs, files in os.walk(self.inputFolder):
-                for f in files:
-                    allFiles.append(os.path.join(root, f))
-            
-            with ZipFile(self.zipFile, 'w') as zip:
-                for f in allFiles:
-                    zip.write(f)
+            allFiles = self.inventory.files()
+            with runMetrics.measure("zipData", self.inputFolder):
+                self.zipMetrics = imageryPackaging.packageFiles(allFiles, self.zipFile, workers)
         return(self.zipFile)
     
     def getDate(self, file):
-        ''' Get date of image, depending on Vendor
+        ''' Get date of image, from the vendor metadata or else the file name; see vendorMetadata.imageDate
         '''        
         try:
             return(self.Date)
         except:
-            file = os.path.basename(file)
-            cDate = "YYYYMMDD"
-            if self.vendor == "MAXAR":
-                try:
-                    date = "20%s" % os.path.basename(file)[:7]
-                    dTime = datetime.strptime(date, "%Y%b%d")
-                    cDate = dTime.strftime("%Y%m%d")                    
-                except:
-                    logging.warning("Could not determine date for %s" % file)                    
-            if self.vendor == "SIIS":
-                cDate = file.split("_")[1][:8]       
-            if self.vendor == "Airbus":
-                cDate = file.split("_")[3][:8]
-            if self.vendor == "SPOT":
-                cDate = file.split("_")[3][:8]                 
-            if self.vendor == "Blacksky":
-                cDate = file.split("-")[2][:8]            
-            self.Date = cDate
+            self.Date = vendorMetadata.imageDate(file, self.vendor, self.inventory)
             return(self.Date)
     
     def identifyCountries(self):
+        inputExtent = self.getFootprintUnion()
+        with runMetrics.measure("identifyCountries", self.inputFolder):
+            if isinstance(self.adminBoundaries, boundaryIndex.adminBoundaryIndex):
+                self.countryName, self.countryISO3 = self.adminBoundaries.identifyCountry(inputExtent)
+                return
+        
+            country = self.adminBoundaries[self.adminBoundaries.intersects(inputExtent)]
+            if country.shape[0] > 1:
+                # If more than one country is intersected, select the shape with the highest overlap
+                country['OVERLAP'] = country['geometry'].apply(lambda x: x.intersection(inputExtent).area/inputExtent.area)           
+                country = country.sort_values('OVERLAP', ascending=False).iloc[0]
+                self.countryName = country['WB_ADM0_NA']
+                self.countryISO3 = country['ISO3']
+
+            else:
+                self.countryName = ";".join(country['WB_ADM0_NA'])
+                self.countryISO3 = ";".join(country['ISO3'])    
+        
+    def getHeaders(self):
+        ''' Read the header of every image from its vendor metadata, or from the raster through the header cache
+            if one was provided
+        
+        RETURNS
+        [list] - rasterHeaders.readRasterHeader result for every image in self.allImages
+        '''
         try:
-            allM = self.allMetadata
+            return(self.headers)
         except:
-            allM = self.getMetadata()
-        inputExtent = allM.unary_union
-        
-        country = self.adminBoundaries[self.adminBoundaries.intersects(inputExtent)]
-        if country.shape[0] > 1:
-            # If more than one country is intersected, select the shape with the highest overlap
-            country['OVERLAP'] = country['geometry'].apply(lambda x: x.intersection(inputExtent).area/inputExtent.area)           
-            country = country.sort_values('OVERLAP', ascending=False).iloc[0]
-            self.countryName = country['WB_ADM0_NA']
-            self.countryISO3 = country['ISO3']
+            self.headers = self.readHeaders(self.allImages)
+            return(self.headers)
 
-        else:
-            self.countryName = ";".join(country['WB_ADM0_NA'])
-            self.countryISO3 = ";".join(country['ISO3'])    
+    def readHeaders(self, images):
+        ''' Headers of a list of images, without keeping them; see getHeaders '''
+        with runMetrics.measure("getHeaders", self.inputFolder):
+            #Rasters whose vendor metadata gives their footprint, resolution and bands are not opened
+            headers = vendorMetadata.sidecarHeaders(images, self.vendor, self.inventory)
+            missing = [idx for idx, h in enumerate(headers) if h is None]
+            scanned = rasterHeaders.scanRasterHeaders([images[idx] for idx in missing], self.scanWorkers, 
+                                                      self.scanExecutor, self.headerCache,
+                                                      [self.inventory.fileKey(images[idx]) for idx in missing])
+            for idx, h in zip(missing, scanned):
+                headers[idx] = h
+            logging.info("%s: %s of %s headers from vendor metadata" % (self.inputFolder, len(headers) - len(missing), len(headers)))
+        return(headers)
+
+    def iterHeaders(self):
+        ''' RETURNS generator of [images, headers] - every image with its header, in batches of batchSize images
+            when streaming, otherwise all images at once from getHeaders
+        '''
+        if not self.batchSize or hasattr(self, 'headers'):
+            yield([self.allImages, self.getHeaders()])
+            return
+        for start in range(0, len(self.allImages), self.batchSize):
+            images = self.allImages[start:start + self.batchSize]
+            yield([images, self.readHeaders(images)])
+    
+    def getFootprints(self):
+        ''' Footprint of every image: the header extent, or the valid data outline when footprintMode is 'valid'
+            (tiles that cannot be outlined keep their header extent)
         
+        RETURNS
+        [list] - WGS84 geometry for every image in self.allImages, None for images without a header
+        '''
+        try:
+            return(self.footprints)
+        except:
+            self.footprints = self.readFootprints(self.allImages, self.getHeaders())
+            return(self.footprints)
+
+    def readFootprints(self, images, headers):
+        ''' Footprints of a list of images from their headers, without keeping them; see getFootprints '''
+        footprints = [h['geometry'] if h else None for h in headers]
+        if self.footprintMode == 'valid':
+            with runMetrics.measure("validFootprints", self.inputFolder):
+                valid = validFootprints.scanValidFootprints(images, max(self.scanWorkers, 1),
+                                                            decimateWithoutOverviews=self.decimateWithoutOverviews)
+            footprints = [v if (v is not None and h is not None) else h for v, h in zip(valid, footprints)]
+        return(footprints)
+    
     def getMetadata(self):
         ''' Generate metadata dataframe for every image
         '''
         try:
             return(self.allMetadata)
         except:        
-            allRes = []
-            for x in self.allImages:
-                curRaster = rasterio.open(x)          
-                #Extract imagery extent
-                if curRaster.crs:
-                    crs = curRaster.crs
-                    b = curRaster.bounds
-                    bbox = box(*b)
-                    project = pyproj.Transformer.from_crs(
-                        pyproj.CRS(str(crs)), 
-                        pyproj.CRS('epsg:4326'), 
-                        always_xy=True).transform
-                    res = curRaster.res[0]
-                    bbox2 = transform(project, bbox) 
-                    #Need to transform resolution to a meters measure
-                    if curRaster.crs.to_epsg() == 4326:                        
-                        project = partial(
-                            pyproj.transform,
-                            pyproj.Proj('epsg:4326'), # source coordinate system
-                            pyproj.Proj('epsg:3857')) # destination coordinate system
-                        l = LineString([Point(0,0), Point(0,res)])
-                        l = transform(project, l)
-                        res = l.length
-                    allRes.append([curRaster.count, round(res, 3), 
-                                    bbox2, geohash.encode(bbox2.centroid.y, bbox2.centroid.x), 
-                                    curRaster.shape[0], curRaster.shape[1], self.getDate(x), x])
+            with runMetrics.measure("getMetadata", self.inputFolder):
+                allRes = []
+                for x, h, footprint in zip(self.allImages, self.getHeaders(), self.getFootprints()):
+                    #Rasters without a CRS are skipped
+                    if h:
+                        allRes.append([h['Bands'], h['Res'], footprint, h['geohash'],
+                                       h['columns'], h['rows'], self.getDate(x), x])
             
-            #create output metadata dataFrame
-            if len(allRes) > 0:
-                allMetadata = pd.DataFrame(allRes, columns=["Bands", "Res", "geometry", "geohash", "columns", "rows", "Date","file"])
-                allMetadata = gpd.GeoDataFrame(allMetadata, geometry="geometry", crs=pyproj.CRS('epsg:4326'))
-                if allMetadata.iloc[0]['Date'] == "YYYYMMDD":
-                    try:
-                        allMetadata['Date'] = self.Date
-                    except:
-                        pass
-                self.allMetadata = allMetadata
-                return(self.allMetadata)
-            else:
+                #create output metadata dataFrame
+                if len(allRes) > 0:
+                    allMetadata = pd.DataFrame(allRes, columns=["Bands", "Res", "geometry", "geohash", "columns", "rows", "Date","file"])
+                    allMetadata = gpd.GeoDataFrame(allMetadata, geometry="geometry", crs=pyproj.CRS('epsg:4326'))
+                    if allMetadata.iloc[0]['Date'] == "YYYYMMDD":
+                        try:
+                            allMetadata['Date'] = self.Date
+                        except:
+                            pass
+                    self.allMetadata = allMetadata
+                    return(self.allMetadata)
+                else:
+                    raise(ValueError("Folder does not have any valid raster datasets"))
+    
+    def writeMetadata(self, outFile):
+        ''' Write the metadata of every image to GeoParquet (.parquet) or csv; see geoParquet.writeFootprints
+        '''
+        if self.batchSize and not hasattr(self, 'allMetadata'):
+            with runMetrics.measure("writeMetadata", self.inputFolder):
+                return(geoParquet.writeFootprintBatches((b.toFrame() for b in self.iterMetadata()), outFile))
+        allMetadata = self.getMetadata()
+        with runMetrics.measure("writeMetadata", self.inputFolder):
+            return(geoParquet.writeFootprints(allMetadata, outFile))
+
+    def iterMetadata(self):
+        ''' Tile metadata in batches of compact arrays (see metadataBatches.metadataBatch). When streaming (batchSize),
+            headers, footprints and dates are read one batch at a time, and the batches spooled to disk
+            (self.metadataSpool) once a pass completes; later calls read the spool rather than the tiles.
+            Otherwise the batches are slices of getMetadata
+        
+        RETURNS
+        generator of metadataBatches.metadataBatch - rasters without a CRS are skipped, as in getMetadata
+        '''
+        if not self.batchSize or hasattr(self, 'allMetadata'):
+            for batch in metadataBatches.frameBatches(self.getMetadata(), self.batchSize or metadataBatches.BATCH_SIZE):
+                yield(batch)
+            return
+        if hasattr(self, 'metadataSpool'):
+            for batch in self.metadataSpool:
+                yield(batch)
+            return
+        spool = metadataBatches.batchSpool()
+        for images, headers in self.iterHeaders():
+            footprints = self.readFootprints(images, headers)
+            tiles = [[x, h, footprint] for x, h, footprint in zip(images, headers, footprints) if h]
+            if len(tiles) == 0:
+                continue
+            dates = [self.getDate(x) for x, h, footprint in tiles]
+            if dates[0] == "YYYYMMDD" and hasattr(self, 'Date'):
+                dates = [self.Date] * len(dates)
+            batch = metadataBatches.metadataBatch([h['Bands'] for x, h, f in tiles], [h['Res'] for x, h, f in tiles],
+                                                  [f for x, h, f in tiles], [h['geohash'] for x, h, f in tiles],
+                                                  [h['columns'] for x, h, f in tiles], [h['rows'] for x, h, f in tiles],
+                                                  dates, [x for x, h, f in tiles])
+            spool.add(batch)
+            yield(batch)
+        #Only a complete pass is kept
+        self.metadataSpool = spool
+
+    def summarizeMetadata(self):
+        ''' Number of tiles, ranges of Res, Bands and Date and the union of the tile footprints, computed once in
+            a single pass over iterMetadata and kept; see metadataBatches.summarizeBatches
+        '''
+        try:
+            return(self.metadataSummary)
+        except:
+            with runMetrics.measure("summarizeMetadata", self.inputFolder):
+                summary = metadataBatches.summarizeBatches(self.iterMetadata(), self.unionGridSize)
+            if summary['tiles'] == 0:
                 raise(ValueError("Folder does not have any valid raster datasets"))
+            self.metadataSummary = summary
+            return(self.metadataSummary)
+
+    def getFootprintUnion(self):
+        ''' RETURNS [shapely geometry] - union of the footprints of every tile, computed once; see summarizeMetadata '''
+        return(self.summarizeMetadata()['union'])
         
     def generateFilename(self):
         ''' Generate a single filename based on input data       
@@ -232,12 +343,9 @@ class deliveredImageryFolder(object):
         try:
             return(self.fileName)
         except:
-            try:
-                allM = self.allMetadata
-            except:
-                allM = self.getMetadata()
+            allM = self.summarizeMetadata()
             self.identifyCountries()
-            u = allM.unary_union  
+            u = allM['union']
             try:            
                 gHash = geohash.encode(u.centroid.y,u.centroid.x)
             except:
@@ -247,18 +355,18 @@ class deliveredImageryFolder(object):
                 ISO3 = self.countryISO3,
                 gHash = gHash,
                 #res = ",".join([str(x) for x in np.unique([allM['Res'].min(), allM['Res'].max()])]),
-                res = str(allM['Res'].min()),
+                res = str(allM['Res'][0]),
                 #bands = ",".join([str(x) for x in np.unique([allM['Bands'].min(), allM['Bands'].max()])]),
-                bands = str(allM['Bands'].max()),
+                bands = str(allM['Bands'][1]),
                 #curDate = ",".join([str(x) for x in np.unique([allM['Date'].min(), allM['Date'].max()])])
-                curDate = str(allM['Date'].max())
+                curDate = str(allM['Date'][1])
             )
             self.fileName = outString
         return(self.fileName)
             
     
     def findImages(self, filetype="TIF"):
-        ''' Get list of imagery files in the input folder
+        ''' Get list of imagery files in the input folder, from the folder inventory
         
         Parameters:
             filetype (string) (options): filetype to look for
@@ -266,70 +374,73 @@ class deliveredImageryFolder(object):
         Returns:
             list of images
         '''
-        self.allImages = []
-        for root, dirs, files in os.walk(self.inputFolder):
-            for f in files:                
-                for filetype in allFileTypes:
-                    if f[-len(filetype):] == filetype:
-                        # BEN TODO: Should I check if this is an actual raster?
-                        self.allImages.append(os.path.join(root, f))
+        # BEN TODO: Should I check if this is an actual raster?
+        self.allImages = self.inventory.images()
                 
-    def generateThumbnails(self, filetype="TIF"):
-        ''' Generate thumbnails for all images in folder
+    def generateThumbnails(self, maxSize=1024, workers=4):
+        ''' Generate a single georeferenced thumbnail (self.thumbnail) from all images in folder; see thumbnails.renderThumbnail.
+            If the tiles cannot be rendered, the vendor's browse image is copied instead (see copyBrowseImage)
         
-        #TODO - needs more testing
-        for x in self.allImages:            
-            outFile = os.path.join(self.thumbnailFolder, os.path.basename(x).replace(filetype, "jpg"))
-            if not os.path.exists(outFile):
-                try:
-                    im = Image.open(x)
-                    im.thumbnail((round(im.size[0]/10), round(im.size[1]/10)), Image.ANTIALIAS)
-                    im.save(outFile, "JPEG")
-                except:
-                    logging.warning("Problem generating thumbnail for %s" % os.path.basename(x))
-        '''      
+        Parameters:
+            maxSize (int) (optional): size, in pixels, of the longest side of the thumbnail
+            workers (int) (optional): number of tiles rendered in parallel
+        '''
         try:
             if not os.path.exists(self.thumbnail):
-                for root, dirs, files in os.walk(self.inputFolder):
-                    for f in files:
-                        if self.vendor == "Maxar":
-                            #Look for a BROWSE.jpg
-                            if vendorInformation[self.vendor]['browseTag'] in f:
-                                shutil.copyfile(os.path.join(root, f), self.thumbnail)
-                            else:
-                                logging.info("could not find thumbnail for %s" % self.inputFolder)
+                if self.batchSize and not hasattr(self, 'allMetadata'):
+                    #Footprints of the metadata pass, rather than reading every header again
+                    tiles = [[x, f] for b in self.iterMetadata() for x, f in zip(b.file, b.geometries())]
+                else:
+                    tiles = [[x, h['geometry']] for x, h in zip(self.allImages, self.getHeaders()) if h]
+                with runMetrics.measure("generateThumbnails", self.inputFolder):
+                    runMetrics.countIO(opened=len(tiles) + 1)
+                    thumbnails.renderThumbnail(tiles, self.thumbnail, maxSize, workers, self.vendor)
         except:
-            logging.warning("Could not find thumbnail for %s" % self.inputFolder)
+            logging.warning("Could not create thumbnail for %s" % self.inputFolder)
+            self.copyBrowseImage()
+
+    def copyBrowseImage(self):
+        ''' Copy the browse image delivered by the vendor (i.e. - Maxar BROWSE.JPG, Airbus PREVIEW_*.JPG) to
+            self.thumbnail, for deliveries whose tiles cannot be rendered; it is not georeferenced and, for
+            deliveries of several products, only shows the first
+
+        RETURNS
+        [boolean] - True if a browse image was copied
+        '''
+        browse = sorted(x for x in self.inventory.files('browse') if x.upper().endswith(".JPG"))
+        if len(browse) == 0:
+            return(False)
+        try:
+            shutil.copyfile(browse[0], self.thumbnail)
+        except (IOError, OSError) as e:
+            logging.warning("Could not copy browse image %s: %s" % (browse[0], e))
+            return(False)
+        logging.info("Thumbnail of %s copied from its browse image %s" % (self.inputFolder, os.path.basename(browse[0])))
+        return(True)
     
     def getImageryExtents(self, inFolder):
         '''Get a list of input imagery tiles and generate extent dataframes
-        RETURNS [geopandas dataframe] - Each row contains file path and shape extent for every imagery tile
+        RETURNS [geopandas dataframe] - Each row contains file path, shape extent and resolution (native CRS 
+            units, read from the raster header) for every imagery tile
         '''
         try:
             return(self.imageryExtents)
         except:
+            headers = list(self.getHeaders())
+            #Headers from vendor metadata have no native resolution; those rasters are read (or found in the cache)
+            fromSidecar = [idx for idx, h in enumerate(headers) if h and h['nativeRes'] is None]
+            scanned = rasterHeaders.scanRasterHeaders([self.allImages[idx] for idx in fromSidecar], self.scanWorkers,
+                                                      self.scanExecutor, self.headerCache,
+                                                      [self.inventory.fileKey(self.allImages[idx]) for idx in fromSidecar])
+            for idx, h in zip(fromSidecar, scanned):
+                headers[idx] = h
             allExtents = []
-            crs = ''
-            for curF in self.allImages:
-                try:
-                    #Try to open the file as a rasterio object
-                    curRaster = rasterio.open(curF)
-                    if curRaster.crs:
-                        crs = curRaster.crs
-                        b = curRaster.bounds
-                        bbox = [[b.left, b.bottom],
-                                [b.left, b.top],
-                                [b.right, b.top],
-                                [b.right, b.bottom],
-                                [b.left, b.bottom]]
-                        allExtents.append([f, Polygon(bbox), curRaster.res[0]])                    
-                except Exception as e:
-                    logging.warning("Problem generating extent for %s" % os.path.basename(x))
+            for curF, h, footprint in zip(self.allImages, headers, self.getFootprints()):
+                if h:
+                    allExtents.append([os.path.basename(curF), footprint, h['nativeRes']])
                 
-            if crs != '':
-                curDf = gpd.GeoDataFrame(allExtents, crs=crs, columns=["fileName","geometry",'Resolution'])
-                if curDf.crs != {'init': 'epsg:4326'}:
-                    curDf = curDf.to_crs({'init': 'epsg:4326'})        
+            if len(allExtents) > 0:
+                curDf = gpd.GeoDataFrame(allExtents, crs=pyproj.CRS('epsg:4326'), columns=["fileName","geometry",'Resolution'])
                 curDf['zipFile'] = self.zipFile
                 curDf = curDf.set_geometry("geometry")
                 self.imageryExtents = curDf
@@ -337,6 +448,14 @@ class deliveredImageryFolder(object):
             else:
                 return -1           
     
+    def writeImageryExtents(self, outFile):
+        ''' Write the extent of every imagery tile to GeoParquet (.parquet) or csv; see geoParquet.writeFootprints
+        '''
+        curDf = self.getImageryExtents(self.inputFolder)
+        if not isinstance(curDf, gpd.GeoDataFrame):
+            raise(ValueError("No imagery extents to write for %s" % self.inputFolder))
+        return(geoParquet.writeFootprints(curDf, outFile))
+    
     def valid_metadata(self, metadata):
         ''' Determine if the metadata is sufficient for cataloging
         
@@ -352,17 +471,39 @@ class deliveredImageryFolder(object):
         
         
 class zipFileExtents(object):
-    def __init__(self, inputZip, sensor, sourceFolder):
+    def __init__(self, inputZip, sensor, sourceFolder, strictVerification=False, footprintMode='bounds', footprintWorkers=4,
+                 inArchive=False, scanWorkers=4, decimateWithoutOverviews=False):
         ''' Generate object for extracting imagery metadata
         INPUT
         inputZip [string] - path to imagery zipFile
         sensor [string] - sensor name
+        strictVerification [boolean] - source only exists if every member of the zipFile is extracted and complete,
+                                       otherwise more than half of the members need to be found
+        footprintMode [string] - one of footprintModes; 'valid' outlines the valid data of every tile in getImageryExtents
+        footprintWorkers [int] - number of tiles outlined at once when footprintMode is 'valid'
+        decimateWithoutOverviews [boolean] - outline tiles without overviews from their full resolution data, rather
+                                             than keeping their bounding box; see validFootprints.readMask
+        inArchive [boolean] - read the extents of the rasters inside the zipFile in place (see getArchiveExtents),
+                              rather than from the extracted sourceFolder
+        scanWorkers [int] - number of raster headers read at once from the archive when inArchive is True
         '''
+        if not footprintMode in footprintModes:
+            raise(ValueError("footprintMode must be one of %s" % ", ".join(footprintModes)))
+        self.footprintMode = footprintMode
+        self.footprintWorkers = footprintWorkers
+        self.decimateWithoutOverviews = decimateWithoutOverviews
+        self.inArchive = inArchive
+        self.scanWorkers = scanWorkers
         self.zipFile = inputZip        
         self.sensor = sensor
         self.sourceFolder = sourceFolder
+        self.strictVerification = strictVerification
+        self.verification = None
 
         
+        #Rasters read in place from the archive do not need an extracted source folder
+        if self.inArchive:
+            return
         ###TODO - should this check been done here???
         ### if not os.path.exists(xx.extentsFile):
         #Check if data has been extracted
@@ -376,36 +517,40 @@ class zipFileExtents(object):
         if not self.checkForSource():
             zFile = zipfile.ZipFile(self.zipFile)
             zFile.extractall(self.sourceFolder)
+            #The extracted folder has changed, verify again on the next check
+            self.verification = None
             return(2)
         else:
             return(1)
     
     def checkForSource(self):  
         ''' Determine that the VENDOR_DISTRIBUTION zipfiles have been properly extracted and processed to SOURCE
-                TODO: Integrate the use of an actual log as an input
-                    Begin by reading in the catalog, then reading in the ...
+            The sourceFolder is compared to the zipfile index once; the result is kept in self.verification
+            with the lists of found, missing and truncated members
         '''
-        self.sourceExists = False
-        self.getSourceNames()
-        
-        #Search the input sourceFolder for the files
-        for roots, dirs, files in os.walk(self.sourceFolder):
-            for name in files:
-                if name in self.fileNames.keys():
-                    self.fileNames[name] = True    
-        if len(self.fileNames.values()) > 0:
+        if self.verification is None:
+            self.getSourceNames()
+            self.verification = archiveIndex.verifyExtraction(self.archiveIndex, self.sourceFolder, ['.tif', '.tiff'])
+            for member in self.verification['found']:
+                self.fileNames[os.path.basename(member)] = True
+            if len(self.verification['missing']) + len(self.verification['truncated']) > 0:
+                logging.info("%s: %s members missing and %s truncated in %s" % (os.path.basename(self.zipFile), 
+                    len(self.verification['missing']), len(self.verification['truncated']), self.sourceFolder))
+        if self.strictVerification:
+            self.sourceExists = len(self.archiveIndex) > 0 and len(self.verification['found']) == len(self.archiveIndex)
+        elif len(self.fileNames.values()) > 0:
             self.sourceExists = (float(sum(self.fileNames.values())) / float(len(self.filePaths))) > 0.50
         else:
             self.sourceExists = False
         return self.sourceExists
     
     def getSourceNames(self):       
-        '''Get the filenames from the input zipFile'''
+        '''Get the filenames from the index of the input zipFile'''
         try:
             return(self.fileNames)
         except:
-            curZip = zipfile.ZipFile(self.zipFile)        
-            self.filePaths = curZip.namelist()        
+            self.archiveIndex = archiveIndex.readArchiveIndex(self.zipFile)
+            self.filePaths = list(self.archiveIndex.keys())
             self.fileNames = {}
             for f in self.filePaths:
                 self.fileNames[os.path.basename(f)] = False
@@ -418,38 +563,140 @@ class zipFileExtents(object):
         try:
             return(self.imageryExtents)
         except:
-            if self.checkForSource():
-                allExtents = []
-                crs = ''
-                for dir, subDirList, fileList in os.walk(inFolder):   
-                    for f in fileList:
-                        curF = os.path.join(dir, f)
-                        try:
-                            #Try to open the file as a rasterio object
-                            curRaster = rasterio.open(curF)
-                            if curRaster.crs:
-                                crs = curRaster.crs
-                                b = curRaster.bounds
-                                bbox = [[b.left, b.bottom],
-                                        [b.left, b.top],
-                                        [b.right, b.top],
-                                        [b.right, b.bottom],
-                                        [b.left, b.bottom]]
-                                allExtents.append([f, Polygon(bbox), curRaster.res[0]])
+            with runMetrics.measure("getImageryExtents", self.zipFile):
+                if self.inArchive:
+                    return(self.getArchiveExtents())
+                if self.checkForSource():
+                    allExtents = []
+                    rasterFiles = []
+                    crs = ''
+                    for dir, subDirList, fileList in os.walk(inFolder):   
+                        for f in fileList:
+                            curF = os.path.join(dir, f)
+                            try:
+                                #Try to open the file as a rasterio object
+                                curRaster = rasterio.open(curF)
+                                runMetrics.countIO(opened=1)
+                                if curRaster.crs:
+                                    crs = curRaster.crs
+                                    b = curRaster.bounds
+                                    bbox = [[b.left, b.bottom],
+                                            [b.left, b.top],
+                                            [b.right, b.top],
+                                            [b.right, b.bottom],
+                                            [b.left, b.bottom]]
+                                    allExtents.append([f, Polygon(bbox), curRaster.res[0]])
+                                    rasterFiles.append(curF)
                             
-                        except Exception as e:
-                            FUBAR = "DO Nothing"
+                            except Exception as e:
+                                FUBAR = "DO Nothing"
                     
-                if crs != '':
-                    curDf = gpd.GeoDataFrame(allExtents, crs=crs, columns=["fileName","geometry",'Resolution'])
-                    if curDf.crs != {'init': 'epsg:4326'}:
-                        curDf = curDf.to_crs({'init': 'epsg:4326'})        
-                    curDf['zipFile'] = self.zipFile
-                    curDf = curDf.set_geometry("geometry")
-                    self.imageryExtents = curDf
-                    return curDf
+                    if crs != '':
+                        curDf = gpd.GeoDataFrame(allExtents, crs=crs, columns=["fileName","geometry",'Resolution'])
+                        if curDf.crs != {'init': 'epsg:4326'}:
+                            curDf = curDf.to_crs({'init': 'epsg:4326'})        
+                        curDf = self.applyFootprints(curDf, rasterFiles)
+                        curDf['zipFile'] = self.zipFile
+                        curDf = curDf.set_geometry("geometry")
+                        self.imageryExtents = curDf
+                        return curDf
+                    else:
+                        return -1           
                 else:
-                    return -1           
-            else:
-                raise ValueError("Input imagery has not been unzipped")
-        
\ No newline at end of file
+                    raise ValueError("Input imagery has not been unzipped")
+    
+    def applyFootprints(self, curDf, rasterFiles):
+        ''' Replace the extents with valid data footprints when footprintMode is 'valid' '''
+        if self.footprintMode == 'valid':
+            valid = validFootprints.scanValidFootprints(rasterFiles, self.footprintWorkers,
+                                                        decimateWithoutOverviews=self.decimateWithoutOverviews)
+            curDf['geometry'] = [v if v is not None else g for v, g in zip(valid, curDf.geometry)]
+        return(curDf)
+    
+    def getArchiveExtents(self):
+        ''' Extents of the rasters inside the zipFile (zip or tar), opened in place through GDAL's /vsizip/ and
+            /vsitar/ file systems; only the raster headers are read and nothing is extracted to disk
+        RETURNS [geopandas dataframe] - the same columns as getImageryExtents; -1 if there are no georeferenced rasters
+        '''
+        self.getSourceNames()
+        rasters = archiveIndex.archiveRasters(self.zipFile, self.archiveIndex)
+        workers = max(1, min(self.scanWorkers, rasterHeaders.MAX_SCAN_WORKERS, len(rasters)))
+        runMetrics.countIO(opened=len(rasters))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            headers = rasterHeaders.projectHeaders(list(pool.map(readArchiveHeader, [x[1] for x in rasters])))
+        allExtents = []
+        rasterFiles = []
+        for (member, vsiPath), h in zip(rasters, headers):
+            if h:
+                allExtents.append([os.path.basename(member), h['geometry'], h['nativeRes']])
+                rasterFiles.append(vsiPath)
+        if len(allExtents) == 0:
+            return -1
+        curDf = gpd.GeoDataFrame(allExtents, crs=pyproj.CRS('epsg:4326'), columns=["fileName","geometry",'Resolution'])
+        curDf = self.applyFootprints(curDf, rasterFiles)
+        curDf['zipFile'] = self.zipFile
+        curDf = curDf.set_geometry("geometry")
+        self.imageryExtents = curDf
+        return curDf
+        
+    def writeImageryExtents(self, outFile):
+        ''' Write the extent of every imagery tile to GeoParquet (.parquet) or csv; see geoParquet.writeFootprints
+        '''
+        curDf = self.getImageryExtents(self.sourceFolder)
+        if not isinstance(curDf, gpd.GeoDataFrame):
+            raise(ValueError("No imagery extents to write for %s" % self.zipFile))
+        return(geoParquet.writeFootprints(curDf, outFile))
+
+def readArchiveHeader(vsiPath):
+    ''' rasterHeaders.readNativeHeader for a raster inside an archive; members that cannot be read as rasters return None '''
+    try:
+        return(rasterHeaders.readNativeHeader(vsiPath))
+    except Exception:
+        return(None)
+
+wgs84CRS = "CRS({'init': u'epsg:4326'})"
+
+def readExtents(extentsFile):
+    ''' Read an imagery extents file; GeoParquet geometries are read as geometries, and the CRS
+        of the file is used for tiles without a CRS column
+    '''
+    if not geoParquet.isParquet(extentsFile):
+        return(pd.read_csv(extentsFile))
+    curDf = geoParquet.readFootprints(extentsFile)
+    extents = pd.DataFrame(curDf).rename(columns={curDf.geometry.name:'geometry'})
+    if not 'CRS' in extents.columns:
+        extents['CRS'] = curDf.crs.to_string()
+    return(extents)
+
+def consolidateExtents(extentsFiles):
+    ''' Combine the imageryExtents.csv of every zipFile into a single WGS84 extent per zipFile
+        All files are read in one step, geometries are parsed and bounded as arrays and reprojected once per CRS
+        Tiles with geometry or CRS that cannot be read, or outside of -180,-90,180,90, are dropped
+    
+    Parameters:
+        extentsFiles (list of strings): imageryExtents.csv (or GeoParquet) files with fileName, geometry (WKT), CRS and zipFile columns
+    
+    RETURNS
+    [geopandas dataframe] - indexed on zipFile; geo_wgs84 is the union of the tiles, other columns come from the first tile
+    '''
+    final = pd.concat([readExtents(f) for f in extentsFiles], ignore_index=True)
+    #GeoParquet geometries are already read, only csv geometries are parsed
+    geoms = np.array(final['geometry'], dtype=object)
+    isText = ~shapely.is_geometry(geoms)
+    geoms[isText] = shapely.from_wkt(geoms[isText].astype(str), on_invalid='ignore')
+    final = final.drop(columns=['geometry'])
+    crsNames = final['CRS'].astype(str).str.replace("CRS({'init': u'", "", regex=False).str.replace("'})", "", regex=False)
+    wgs84 = np.full(len(final), None, dtype=object)
+    for curCrs, idx in crsNames.groupby(crsNames).indices.items():
+        try:
+            curG = gpd.GeoSeries(geoms[idx], crs=pyproj.CRS(curCrs))
+            wgs84[idx] = curG.to_crs('epsg:4326').to_numpy()
+        except Exception:
+            logging.info("Could not reproject %s tiles from %s" % (len(idx), curCrs))
+    final['CRS'] = wgs84CRS
+    final['geo_wgs84'] = wgs84
+    bounds = shapely.bounds(wgs84)
+    final['xmin'], final['ymin'], final['xmax'], final['ymax'] = bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3]
+    final = final[(final.xmin > -180) & (final.xmax < 180) & (final.ymin > -90) & (final.ymax < 90)]
+    finalZ = gpd.GeoDataFrame(final, crs='epsg:4326', geometry='geo_wgs84')
+    return(finalZ.dissolve(by="zipFile"))
@@ -8,105 +8,190 @@
 #           Begin by reading in the catalog, then reading in the 
 ###############################################################################
 
-import os, sys, csv, inspect, datetime, shutil, subprocess, time, glob
+import os, sys, csv, inspect, datetime, shutil, subprocess, time, glob, threading
 #import arcpy
 import zipfile, tarfile
+import archiveIndex, catalogIndex, statusStore, runMetrics, mosaicUpdates
+
+from multiprocessing.pool import ThreadPool
 
 '''prints the time along with the message'''
 def tPrint(s):
     print"%s\t%s" % (time.strftime("%H:%M:%S"), s)
 
+'''creates a folder, without failing if another thread created it first'''
+def makeFolder(folder):
+    try:
+        os.makedirs(folder)
+    except OSError:
+        if not os.path.isdir(folder):
+            raise
+
+'''writes an open file object (i.e. - an archive member) to disk'''
+def copyStream(src, outFile):
+    makeFolder(os.path.dirname(outFile))
+    with open(outFile, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+        size = dst.tell()
+    runMetrics.countIO(read=size, written=size, opened=1)
+
+'''writes a tiled GeoTIFF with overviews to Source (see tiledWriter.writeTiled); a module level function so
+   that it can be run in a separate process. tiledWriter (rasterio) is only imported once a raster is tiled'''
+def tileRaster(inPath, inFile, blockSize=256, compress=None, overviewLevels=None, cog=False):
+    import tiledWriter
+    if overviewLevels is None:
+        overviewLevels = tiledWriter.defaultOverviews
+    outPath = inPath.replace("Ingest", "Source")
+    rasterFile = os.path.join(inPath, inFile)
+    outRasterFile = os.path.join(outPath, inFile)
+    
+    #create output folder
+    makeFolder(outPath)
+
+    #An existing file is only skipped if it is completely tiled, an interrupted run is re-done
+    if not tiledWriter.isValidTiled(outRasterFile, blockSize, overviewLevels):
+        report = tiledWriter.writeTiled(rasterFile, outRasterFile, blockSize=blockSize, compress=compress,
+                                        overviewLevels=overviewLevels, cog=cog)
+        runMetrics.countIO(read=os.path.getsize(rasterFile), written=report['bytes'], opened=2)
+        tPrint("Tiled %s: %.1f MB written in %.1f seconds" % (inFile, report['bytes'] / 1048576.0, report['seconds']))
+        
+    return outRasterFile
+
 class imageryZip(object):  
     def getSourceNames(self):       
-        if not self.sourceExists:
-            #Check if the source files have been extracted and processed
-            curZip = zipfile.ZipFile(self.zipFile)
-            self.filePaths = curZip.namelist()
-        else:
-            self.filePaths = glob.glob("%s/*.*" % self.sourceFolder)
+        if not hasattr(self, 'archiveIndex'):
+            #Names, sizes and CRCs of the files in the delivered zip (or tar.gz)
+            self.archiveIndex = archiveIndex.readArchiveIndex(self.zipFile)
+        self.filePaths = self.archiveIndex.keys()
         self.fileNames = {}
         for f in self.filePaths:
             self.fileNames[os.path.basename(f)] = False
             
-    def checkForSource(self):  
+    def checkForSource(self, strict=False):  
         ''' Determine that the VENDOR_DISTRIBUTION zipfiles have been properly extracted and processed to SOURCE
-                TODO: Integrate the use of an actual log as an input
-                    Begin by reading in the catalog, then reading in the 
+            The source folder is compared to the zipfile index once and the result is kept in self.verification
+            (found, missing and truncated members); tiled TIFs only need to exist
+            
+            strict [boolean] - source only exists if every member is found complete, otherwise more than half is enough
         '''
-        self.getSourceNames()
-        
-        #Search the input sourceFolder for the files
-        for roots, dirs, files in os.walk(self.sourceFolder):
-            for name in files:
-                if name in self.fileNames.keys():
-                    self.fileNames[name] = True    
-        if len(self.fileNames.values()) > 0:
+        if getattr(self, 'verification', None) is None:
+            self.getSourceNames()
+            self.verification = archiveIndex.verifyExtraction(self.archiveIndex, self.sourceFolder, ['.tif', '.tiff'])
+            for member in self.verification['found']:
+                self.fileNames[os.path.basename(member)] = True
+        if strict:
+            self.sourceExists = len(self.filePaths) > 0 and len(self.verification['found']) == len(self.filePaths)
+        elif len(self.fileNames.values()) > 0:
             self.sourceExists = (float(sum(self.fileNames.values())) / float(len(self.filePaths))) > 0.50
         else:
             self.sourceExists = False
                     
     def checkForService(self):
         ''' Check if the source has been properly uploaded to the imagery catalogue
-        
+            The service catalogs are read once per run into the shared self.catalog, so this is a lookup
+            of the files in the zipfile against the catalogued file names
         '''
         self.serviceOID = ''
         self.sourceService = ''
         self.rgbOID = ''
         self.rgbServiceExists = False
-        if arcpy.Exists(self.gdbPath):
-            result = arcpy.GetCount_management(self.gdbPath)
-            result = int(result.getOutput(0))
-            if result > 0:
-                #Export the catalog for the current sensor
-                if not os.path.isfile(self.rasterCatalog): 
-                    arcpy.ExportRasterCatalogPaths_management(self.gdbPath, "ALL", self.rasterCatalog)
-                #Export the catalog for the D_RGB service as well
-                if not os.path.isfile(self.rgbCatalog):   
-                    arcpy.ExportMosaicDatasetPaths_management(self.rgbPath, self.rgbCatalog, export_mode="ALL", types_of_paths="RASTER;ITEM_CACHE")                                                                                  
-                    #arcpy.ExportMosaicDatasetPaths_management(in_mosaic_dataset="//ddhprdcifs/DDH-PRD/ddhfiles/internal/imagerysource/FGDB/ImageryServices.gdb/S_RGB", out_table="//ddhprdcifs/DDH-PRD/ddhfiles/internal/imagerysource/Logs/CatalogInventory/2017_09_25_RGB_catalog.dbf", where_clause="", export_mode="ALL", types_of_paths="RASTER;ITEM_CACHE")
-                self.serviceFiles = {}
-                #for catPath in [self.rasterCatalog, self.rgbCatalog]:
-                with arcpy.da.SearchCursor(self.rasterCatalog, ["SourceOID","Path"]) as searchCur:
-                    for row in searchCur:
-                        self.serviceFiles[os.path.basename(row[1])] = [row[0], "S_%s" % self.sensor]
-                with arcpy.da.SearchCursor(self.rgbCatalog, ["SourceOID","Path"]) as searchCur:
-                    for row in searchCur:
-                        self.serviceFiles[os.path.basename(row[1])] = [row[0], "S_RGB"]
-
-                #Check if the service has been created
-                self.serviceExists = False
-                if not hasattr(self, 'fileNames'):
-                    self.checkForSource()
-                for fileName, fileDetails in self.serviceFiles.iteritems():
-                    if fileName in self.fileNames:
-                        self.serviceOID = fileDetails[0]
-                        self.sourceService = fileDetails[1]
-                        self.serviceExists = True
-                        self.sourceExists = True    #There are odd situations where the source is not marked as true
-            else:
-                self.serviceExists = False
-        else:
-            self.serviceExists = False
+        self.serviceExists = False
+        if self.catalog is None:
+            self.catalog = catalogIndex.catalogIndex()
+        sensorService = "S_%s" % self.sensor
+        if self.catalog.loadCatalog(sensorService, self.gdbPath, self.rasterCatalog):
+            #Export the catalog for the S_RGB service as well
+            self.catalog.loadCatalog("S_RGB", self.rgbPath, self.rgbCatalog, mosaic=True)
+            if not hasattr(self, 'fileNames'):
+                self.checkForSource()
+            #Check if the service has been created
+            serviceFiles = self.catalog.findFiles(self.fileNames, [sensorService, "S_RGB"])
+            if len(serviceFiles) > 0:
+                self.serviceOID, self.sourceService = serviceFiles[sorted(serviceFiles.keys())[0]]
+                self.serviceExists = True
+                self.sourceExists = True    #There are odd situations where the source is not marked as true
             
         #Identify the path in the D_RGB service as well
-        if arcpy.Exists(self.drgbPath) and self.serviceExists:
-            if not os.path.isfile(self.drgbRasterCatalog):   
-                arcpy.ExportRasterCatalogPaths_management(self.drgbPath, "ALL", self.drgbRasterCatalog)
-                rgbFiles = self.serviceFiles
-                with arcpy.da.SearchCursor(self.drgbRasterCatalog, ["SourceOID","Path"]) as searchCur:
-                    for row in searchCur:
-                        rgbFiles[os.path.basename(row[1])] = [row[0], "D_RGB"]
-
-                #Check if the service has been created
-                self.serviceExists = False
-                for fileName, fileDetails in rgbFiles.iteritems():
-                    if fileName in self.fileNames:
-                        self.rgbOID = fileDetails[0]
-                        self.rgbServiceExists = True
-                        
-                
+        if self.serviceExists and self.catalog.loadCatalog("D_RGB", self.drgbPath, self.drgbRasterCatalog):
+            rgbFiles = self.catalog.findFiles(self.fileNames, ["D_RGB"])
+            if len(rgbFiles) > 0:
+                self.rgbOID = rgbFiles[sorted(rgbFiles.keys())[0]][0]
+                self.rgbServiceExists = True
             
-    def extractandTile(self):
+    def archiveMembers(self):
+        ''' Iterate over the files in the delivered zip or tar.gz, one at a time and without extracting the archive
+        
+        RETURNS
+        generator of [member path, open file object of the member]
+        '''
+        f = self.zipFile
+        runMetrics.countIO(opened=1)
+        if f[-3:] == "zip":
+            curZip = zipfile.ZipFile(f, 'r')
+            try:
+                for info in curZip.infolist():
+                    if not info.filename.endswith("/"):
+                        src = curZip.open(info)
+                        yield [info.filename, src]
+                        src.close()
+            finally:
+                curZip.close()
+        if f[-2:] == "gz":
+            #Stream mode, members have to be read in order
+            curTar = tarfile.open(f, 'r|gz')
+            try:
+                for info in curTar:
+                    if info.isfile():
+                        yield [info.name, curTar.extractfile(info)]
+            finally:
+                curTar.close()
+    
+    def extractandTilePipelined(self, workers=4):
+        ''' Stream members out of the archive; each TIF is handed to a pool of workers for tiling as soon as it
+            is extracted to Ingest (and removed once tiled), while other files are copied straight to Source.
+            At most 2 x workers TIFs are held in Ingest at any time
+        '''
+        pool = ThreadPool(workers)
+        slots = threading.BoundedSemaphore(workers * 2)
+        results = []
+        def tile(dirName, fileName):
+            try:
+                with runMetrics.measure("tile", os.path.join(dirName, fileName)):
+                    self.tileAndOverview(dirName, fileName, self.gdalRoot)
+            finally:
+                os.remove(os.path.join(dirName, fileName))
+                slots.release()
+        try:
+            for member, src in self.archiveMembers():
+                relPath = os.path.normpath(member).lstrip("/\\")
+                if relPath.startswith(".."):
+                    tPrint("Skipping %s, it is outside of the archive folder" % member)
+                    continue
+                dirName, fileName = os.path.split(os.path.join(self.ingestFolder, relPath))
+                if fileName[-4:].lower() in [".tif"]:
+                    slots.acquire()
+                    copyStream(src, os.path.join(dirName, fileName))
+                    results.append(pool.apply_async(tile, (dirName, fileName)))
+                else:
+                    copyStream(src, os.path.join(dirName.replace("Ingest", "Source"), fileName))
+        finally:
+            pool.close()
+            pool.join()
+        #Raise any errors from tiling
+        for result in results:
+            result.get()
+        shutil.rmtree(self.ingestFolder)
+        #The source folder has changed, verify it again on the next check
+        self.verification = None
+    
+    def extractandTile(self, pipelined=False, workers=4):
+        ''' Extract the delivered archive to Source; TIFs are tiled with overviews, other files are copied
+        
+        pipelined [boolean] - see extractandTilePipelined, otherwise the whole archive is extracted to Ingest first
+        workers [int] - number of TIFs tiled in parallel in pipelined mode
+        '''
+        if pipelined:
+            return(self.extractandTilePipelined(workers))
         f = self.zipFile
         ingestFolder = self.ingestFolder
         sourceFolder = self.sourceFolder
@@ -133,27 +218,37 @@ class imageryZip(object):
                 else:
                     shutil.copyfile(os.path.join(dirName, f), os.path.join(outputFolder, f))                            
         shutil.rmtree(ingestFolder)
+        #The source folder has changed, verify it again on the next check
+        self.verification = None
 
-    def tileAndOverview(self, inPath, inFile, gdalPath):
-        outPath = inPath.replace("Ingest", "Source")
-        rasterFile = os.path.join(inPath, inFile)
-        outRasterFile = os.path.join(outPath, inFile)
+    def extractToIngest(self):
+        ''' Extract the delivered archive without tiling; TIFs are written to Ingest, other files straight to Source
         
-        #create output folder
-        if not os.path.isdir(outPath):
-            os.makedirs(outPath)
-
-        #run gdal_translate to tile image properly
-        if not os.path.exists(outRasterFile):
-            processCall = '%s -of Gtiff -co "TILED=YES" -co "BLOCKXSIZE=256" -co "BLOCKYSIZE=256" "%s" "%s"'  % (os.path.join(gdalPath, "gdal_translate.exe"), rasterFile, outRasterFile)
-            subprocess.call(processCall)
-
-            #Calculate Overviews (Pyramids) on data in source folder
-            overviewCall = '"%s" -r average --config INTERLEAVE_OVERVIEW PIXEL --config PHOTOMETRIC_OVERVIEW YCBCR "%s" 2 4 8 16 32 64 128 256' \
-                % (os.path.join(gdalPath, "gdaladdo.exe"), outRasterFile)    
-            subprocess.call(overviewCall)
-            
-        return outRasterFile
+        RETURNS
+        [list of lists] - [Ingest folder, file name] of every TIF still to be tiled (see tileRaster)
+        '''
+        toTile = []
+        for member, src in self.archiveMembers():
+            relPath = os.path.normpath(member).lstrip("/\\")
+            if relPath.startswith(".."):
+                tPrint("Skipping %s, it is outside of the archive folder" % member)
+                continue
+            dirName, fileName = os.path.split(os.path.join(self.ingestFolder, relPath))
+            if fileName[-4:].lower() in [".tif"]:
+                copyStream(src, os.path.join(dirName, fileName))
+                toTile.append([dirName, fileName])
+            else:
+                copyStream(src, os.path.join(dirName.replace("Ingest", "Source"), fileName))
+        return(toTile)
+    
+    def tileAndOverview(self, inPath, inFile, gdalPath=None, blockSize=256, compress=None, 
+                        overviewLevels=None, cog=False):
+        ''' Write a tiled GeoTIFF with overviews to Source; see tileRaster
+        
+        gdalPath [string] - no longer used, tiling runs in-process through rasterio
+        overviewLevels [list of ints] - decimation factors of the overviews, tiledWriter.defaultOverviews if None
+        '''
+        return(tileRaster(inPath, inFile, blockSize, compress, overviewLevels, cog))
     
     def uploadSourceData(self, uMS="false", uPS="false", uPan="false"):
         '''
@@ -213,24 +308,25 @@ class imageryZip(object):
             raise e.message
             
     def checkStatus(self):
+        ''' Read the logged status of the zipfile from the status store, then check the source and service
+            for anything that is not complete
+        '''
         self.sourceExists = False
         self.serviceExists = False
         self.serviceOID = ''    
         self.sourceService = ''   
         self.rgbOID = ''
-        try:
-            with open(self.logFile,'r') as dest_f:
-                data_iter = csv.reader(dest_f)  
-                for data in data_iter:
-                    if data[1] == self.sensor and data[0].strip() == os.path.basename(self.zipFile):
-
-                        self.sourceExists = data[2].strip()
-                        self.serviceExists = data[4].strip()
-                        self.serviceOID = data[6].strip()  
-                        self.sourceService = data[7].strip() 
-                        self.rgbOID = data[8].strip()
-        except:
-            fubar="FUBAR" #Shouldn't I do something here?
+        if self.statusStore is None:
+            self.statusStore = statusStore.imageryStatusStore()
+            if os.path.exists(self.logFile):
+                self.statusStore.loadCSV(self.logFile)
+        status = self.statusStore.lookup(self.sensor, os.path.basename(self.zipFile))
+        if status is not None:
+            self.sourceExists = status['sourceExists']
+            self.serviceExists = status['serviceExists']
+            self.serviceOID = status['serviceOID']
+            self.sourceService = status['sourceService']
+            self.rgbOID = status['rgbOID']
             
         if not self.sourceExists:
             self.checkForSource()
@@ -249,17 +345,24 @@ class imageryZip(object):
             return(-1)
         
         if self.sourceService == "S_RGB":
-            doNothing = "For Now"
-            #Create a table view of the selected table, then select this specific row
-            arcpy.MakeTableView_management(self.rgbCatalog, "FUBAR", "OBJECTID = %s" % self.serviceOID)
-            arcpy.CalculateField_management("FUBAR", "SensorName", "%s" % self.sensor)
+            #Queued with the updates of every other zipfile in the run; applied now if there is no shared queue
+            updates = self.mosaicUpdates
+            if updates is None:
+                updates = mosaicUpdates.mosaicUpdateQueue(mosaicUpdates.arcpyMosaicBackend())
+            updates.setField(self.rgbPath, "SensorName", self.sensor, [int(self.serviceOID)])
+            if str(self.rgbOID).isdigit():
+                updates.synchronize(self.drgbPath, [int(self.rgbOID)])
+            if self.mosaicUpdates is None:
+                updates.apply()
         
         self.updateStatus()
 
     def updateStatus(self):
-        self.statusUpdate = ",".join([os.path.basename(self.zipFile), self.sensor, str(self.sourceExists), 
+        values = [os.path.basename(self.zipFile), self.sensor, str(self.sourceExists), 
             self.sourceFolder, str(self.serviceExists), str(self.rasterCatalog), str(self.serviceOID),
-            self.sourceService, str(self.rgbOID)])
+            self.sourceService, str(self.rgbOID)]
+        self.statusUpdate = ",".join(values)
+        self.statusStore.update(values)
     
     def __init__(self, zipLocation, sensor,     
                 basePath = "//ddhprdcifs/DDH-PRD/ddhfiles/internal/imagerysource", 
@@ -268,18 +371,23 @@ class imageryZip(object):
                 arcToolbox_HighRes = "I:/ddhfiles/internal/imagerysource/Scripts/HighResolution/Tools/HighResolution.pyt",
                 arcToolbox_orthos = "I:/ddhfiles/internal/imagerysource/Scripts/PreprocessedOrthos/Tools/Preprocess.pyt",
                 logFile = "I:/ddhfiles/internal/imagerysource/Logs/CURRENT_Imagery_Log.csv",
-                listOnly = False, verbose=True):
+                listOnly = False, verbose=True, catalog=None, statusStore=None, mosaicUpdates=None):
         self.arcToolbox_HighRes = arcToolbox_HighRes
         self.arcToolbox_orthos = arcToolbox_orthos
         self.gdalRoot = gdalRoot
         self.zipFile = zipLocation
         self.sensor = sensor
         self.logFile = logFile
+        #catalogIndex shared by all zipfiles in a run; created when first needed if not supplied
+        self.catalog = catalog
+        #imageryStatusStore shared by all zipfiles in a run; loaded from logFile if not supplied
+        self.statusStore = statusStore
+        #mosaicUpdateQueue shared by all zipfiles in a run and applied at its end; updates are applied at once if not supplied
+        self.mosaicUpdates = mosaicUpdates
         self.sourceFolder = "%s/Source/%s/%s" % (basePath, sensor, os.path.basename(self.zipFile).replace(".zip", ""))          
         self.ingestFolder = "%s/Ingest/%s/%s" % (basePath, sensor, os.path.basename(self.zipFile).replace(".zip", ""))          
         for f in [self.sourceFolder, self.ingestFolder]:
-            if not os.path.exists(f):
-                os.makedirs(f)
+            makeFolder(f)
         self.inputGDB = "%s/FGDB/Production/Imagery_Services_DEV.gdb" % basePath
         self.gdbPath = "%s/S_%s" % (self.inputGDB, sensor)    
         self.rgbPath = "%s/S_RGB" % (self.inputGDB)   
@@ -292,8 +400,16 @@ class imageryZip(object):
         self.updateStatus()
   
 class ImageryGDB(object):
-    def __init__(self, basePath = "//ddhprdcifs/DDH-PRD/ddhfiles/internal/imagerysource"):
+    def __init__(self, basePath = "//ddhprdcifs/DDH-PRD/ddhfiles/internal/imagerysource", updates=None):
+        ''' Parameters:
+                updates (mosaicUpdates.mosaicUpdateQueue) (optional): queue the field, stretch and synchronization
+                    updates are collected in until finalProcessing; defaults to a queue applied with arcpy
+        '''
         self.inputGDB = "%s/FGDB/ImageryServices.gdb" % basePath
+        self.drgbPath = "%s/D_RGB" % self.inputGDB
+        self.updates = updates
+        if self.updates is None:
+            self.updates = mosaicUpdates.mosaicUpdateQueue(mosaicUpdates.arcpyMosaicBackend())
         #Get a list of S_*** feature classes
         arcpy.env.workspace = self.inputGDB
         self.sourceDatasets = arcpy.ListDatasets("S_*")
@@ -306,44 +422,61 @@ class ImageryGDB(object):
             "S_WV03":"WorldView 3", "S_WV04":"WorldView 4"}
         
     def updateFields(self, changeFolders=[]):
+        ''' Queue the Sensor Name of every item of the services; applied by finalProcessing '''
         curFolders = self.sourceDatasets
         if len(changeFolders) > 0:
             curFolders = changeFolders
             
         for service in curFolders:
             satName = self.satelliteNames[service]  
-            try:
-                arcpy.CalculateField_management(service, "SensorName", satName)                
-                tPrint("Updated the Sensor Name in %s" % service)
-            except:
-                print ("Could not update Sensor Name for %s" % satName)
-                #arcpy.AddField_management(service, "SensorName", "TEXT", field_length=20)
-                #arcpy.CalculateField_management(service, "SensorName", satName)                
+            self.updates.setField(service, "SensorName", satName)
+            tPrint("Queued the Sensor Name of %s" % service)
     
     def applyStretch(self, changeFolders=[], 
-        template = r"\\ddhprdcifs\DDH-PRD\ddhfiles\internal\imagerysource\Scripts\ImageryObjects\Templates\mini_max_stretch_255Max.rft.xml"):
+        template = r"\\ddhprdcifs\DDH-PRD\ddhfiles\internal\imagerysource\Scripts\ImageryObjects\Templates\mini_max_stretch_255Max.rft.xml",
+        tempFolder = "//ddhprdcifs/DDH-PRD/ddhfiles/internal/imagerysource/Logs", workers=4):
+        ''' Stretch every item of the services by the statistics of its own raster; statistics are read from
+            the overviews of the rasters (see imageStatistics) and cached between runs. Items that render the
+            same stretch are queued together and edited with one EditRasterFunction by finalProcessing
+        '''
+        #rasterio is only needed once stretches are rendered
+        import imageStatistics
         curFolders = self.sourceDatasets
         if len(changeFolders) > 0:
             curFolders = changeFolders
-        
-        #Loop through the services
-        for service in curFolders:
-            # Loop through the rasters in the service
-            with arcpy.da.SearchCursor(service, ['OBJECTID']) as rCursor:
-                for row in rCursor:
-                    curLayer = "%s_%s" % (os.path.basename(service), row[0])
-                    arcpy.MakeRasterLayer_management(service, curLayer, "OBJECTID = %s" % row[0])
-                    ###BEN### - I need to apply the stretch function here to the specific row in the mosaic, rather than to the entire mosaic
-            '''
-            try:
-                arcpy.EditRasterFunction_management(service, "EDIT_MOSAIC_DATASET_ITEM", "INSERT", template)
-                tPrint("Updated the Stretch Function for %s" % service)
-            except:
-                print("Could not update Stretch Function in %s" % service)
-            '''                   
-    def finalProcessing(self):
+        backend = catalogIndex.arcpyCatalogBackend()
+        cache = imageStatistics.statisticsCache(os.path.join(tempFolder, "raster_statistics.sqlite"))
+        try:
+            #Loop through the services
+            for service in curFolders:
+                serviceName = os.path.basename(service)
+                catalogTable = "%s/%s_%s_stretch.dbf" % (tempFolder, datetime.date.today().strftime("%Y_%m_%d"), serviceName)
+                if not arcpy.Exists(catalogTable):
+                    backend.exportCatalog(service, catalogTable, mosaic=True)
+                #The raster of every item; item caches (CRF) are also listed in the catalog
+                items = {}
+                for oid, path in backend.readCatalog(catalogTable):
+                    if not oid in items and path[-4:].lower() != ".crf":
+                        items[oid] = path
+                stretchFolder = os.path.join(tempFolder, "Stretch_%s" % serviceName)
+                with runMetrics.measure("renderStretch", service):
+                    stretches = imageStatistics.renderItemStretches(sorted(items.items()), template, stretchFolder, workers, cache)
+                for stretchFile, oids in stretches:
+                    self.updates.setFunction(service, stretchFile, oids)
+                tPrint("Queued the Stretch Function of %s items in %s with %s templates" % (len(items), service, len(stretches)))
+        finally:
+            cache.close()
+
+    def finalProcessing(self, rgbOIDs=None):
+        ''' Apply the queued updates, then synchronize D_RGB
+
+        Parameters:
+            rgbOIDs (list of ints) (optional): D_RGB items to synchronize; every stale item if None
+        '''
         #Synchronize D_RGB
-        arcpy.SynchronizeMosaicDataset_management(in_mosaic_dataset="//ddhprdcifs/DDH-PRD/ddhfiles/internal/imagerysource/FGDB/ImageryServices.gdb/D_RGB", where_clause="", new_items="UPDATE_WITH_NEW_ITEMS", sync_only_stale="SYNC_STALE", update_cellsize_ranges="UPDATE_CELL_SIZES", update_boundary="UPDATE_BOUNDARY", update_overviews="NO_OVERVIEWS", build_pyramids="NO_PYRAMIDS", calculate_statistics="NO_STATISTICS", build_thumbnails="NO_THUMBNAILS", build_item_cache="NO_ITEM_CACHE", rebuild_raster="REBUILD_RASTER", update_fields="UPDATE_FIELDS", fields_to_update="AcquisitionDate;Best;CenterX;CenterY;CloudCover;Dataset_ID;GroupName;LeafStatus;Metadata_URL;OffNadir;ProductName;Raster;SatAzimuth;SatElevation;SensorName;Shape;Source;SunAzimuth;SunElevation;Tag;Year;Zip_Path;ZOrder", existing_items="UPDATE_EXISTING_ITEMS", broken_items="REMOVE_BROKEN_ITEMS", skip_existing_items="SKIP_EXISTING_ITEMS", refresh_aggregate_info="REFRESH_INFO")        
+        self.updates.synchronize(self.drgbPath, rgbOIDs)
+        operations, failed = self.updates.apply()
+        tPrint("Applied %s mosaic updates, %s failed" % (operations, failed))
         #Calculate Statistics
         
         #Update Overviews
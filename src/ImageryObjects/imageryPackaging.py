@@ -0,0 +1,172 @@
+###############################################################################
+# Imagery Packaging
+# Purpose: write delivered imagery into a single zipfile; worker threads check
+#   the format of every member and deflate those that benefit from compression
+#   in parallel, ahead of the single thread writing the archive; already
+#   compressed imagery is stored as is, streamed from the source by the writer
+###############################################################################
+
+import os, time, zlib, shutil, logging, tempfile, collections
+import rasterio
+
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZipFile, ZipInfo, ZIP_STORED, ZIP_DEFLATED
+
+try:
+    from . import runMetrics
+except ImportError:
+    import runMetrics
+
+CHUNK_SIZE = 1024 * 1024
+# Deflated members are kept in memory up to this size, then spooled to local temp disk
+SPOOL_SIZE = 16 * 1024 * 1024
+# Formats that are already compressed; deflating them again costs time and saves nothing
+storedExtensions = ['.jp2', '.jpg', '.jpeg', '.png', '.zip', '.gz', '.tgz', '.rar', '.7z', '.ecw', '.sid']
+tiffExtensions = ['.tif', '.tiff']
+
+def chooseCompression(inFile):
+    ''' Select the zip compression for a file based on its format
+
+    RETURNS
+    [int] - zipfile.ZIP_STORED for compressed imagery (JP2, JPG, compressed TIFs), otherwise zipfile.ZIP_DEFLATED
+    '''
+    ext = os.path.splitext(inFile)[1].lower()
+    if ext in storedExtensions:
+        return(ZIP_STORED)
+    if ext in tiffExtensions:
+        try:
+            with rasterio.open(inFile) as curRaster:
+                if curRaster.compression:
+                    return(ZIP_STORED)
+        except:
+            logging.warning("Could not read compression of %s" % inFile)
+    return(ZIP_DEFLATED)
+
+def prepareMember(inFile, compressLevel=6):
+    ''' Pick the compression of a file and, if it is to be deflated, deflate it into a local spool (raw deflate,
+        as stored in a zipfile), ahead of the writer. zlib releases the GIL, so members deflate in parallel
+
+    RETURNS
+    [list] - [compression (see chooseCompression), spool of the deflated data positioned at 0 (None for stored
+        members), CRC-32 and size of the uncompressed data]
+    '''
+    compression = chooseCompression(inFile)
+    if compression == ZIP_STORED:
+        return([compression, None, None, None])
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        deflater = zlib.compressobj(compressLevel, zlib.DEFLATED, -15)
+        crc = 0
+        fileSize = 0
+        with open(inFile, 'rb') as src:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                crc = zlib.crc32(chunk, crc)
+                fileSize += len(chunk)
+                spool.write(deflater.compress(chunk))
+        spool.write(deflater.flush())
+        spool.seek(0)
+    except:
+        spool.close()
+        raise
+    return([compression, spool, crc, fileSize])
+
+def writeMember(zf, zinfo, src):
+    ''' Write a stored member to an open zipfile from a file object, through ZipFile.open '''
+    with zf.open(zinfo, 'w') as dest:
+        shutil.copyfileobj(src, dest, CHUNK_SIZE)
+
+def writeDeflatedMember(zf, zinfo, spool, crc, fileSize):
+    ''' Write a member that is already deflated (see prepareMember) to an open zipfile. zipfile has no public
+        way to add compressed data, so this does what ZipFile.open(zinfo, 'w') does around its compressor:
+        the local header (ZipInfo.FileHeader, with the CRC and sizes known up front, so no data descriptor),
+        the data, then the member is listed for the central directory that ZipFile.close writes at start_dir.
+        Only the non underscore attributes fp, filelist, NameToInfo and start_dir are used
+    '''
+    spool.seek(0, 2)
+    zinfo.compress_type = ZIP_DEFLATED
+    zinfo.CRC = crc
+    zinfo.file_size = fileSize
+    zinfo.compress_size = spool.tell()
+    spool.seek(0)
+    zinfo.header_offset = zf.fp.tell()
+    zf.fp.write(zinfo.FileHeader())
+    shutil.copyfileobj(spool, zf.fp, CHUNK_SIZE)
+    zf.filelist.append(zinfo)
+    zf.NameToInfo[zinfo.filename] = zinfo
+    zf.start_dir = zf.fp.tell()
+
+def packageFiles(allFiles, zipFile, workers=4, compressLevel=6, progressInterval=60):
+    ''' Write a list of files to a zipfile. The archive is written to a temporary file next to
+        zipFile and renamed once complete, so a partially written zipfile never exists at zipFile.
+        Worker threads pick the compression of every member and deflate members into local spools,
+        a bounded number of members ahead of the single thread writing the archive.
+
+        Throughput: deflating, the costly step, runs on every worker, so packaging scales with workers
+        until the writer's disk or the source share is the limit. The price is one extra local write and
+        read of the deflated (not the source) bytes of every deflated member, and local temp space (or
+        memory, up to SPOOL_SIZE each) for up to 2 x workers deflated members at once. Stored members are
+        streamed from the source by the writer, with no copy
+
+    Parameters:
+        allFiles (list of strings): files to add; archive names follow ZipFile.write
+        zipFile (string): output zipfile
+        workers (int): number of threads deflating members
+        compressLevel (int): zlib compression level for deflated members
+        progressInterval (int): seconds between progress messages in the log
+
+    RETURNS
+    [dictionary] - metrics of the packaging: members, stored, deflated, bytesIn, bytesOut, seconds, MBps
+    '''
+    tempZip = "%s.partial" % zipFile
+    metrics = {'members':0, 'stored':0, 'deflated':0, 'bytesIn':0, 'bytesOut':0}
+    start = time.time()
+    lastProgress = start
+    # Only a bounded number of members are prepared ahead of the writer
+    window = max(1, workers) * 2
+    toPrepare = collections.deque(range(len(allFiles)))
+    futures = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool, ZipFile(tempZip, 'w', allowZip64=True) as zf:
+            def fill():
+                while toPrepare and len(futures) < window:
+                    idx = toPrepare.popleft()
+                    futures[idx] = pool.submit(prepareMember, allFiles[idx], compressLevel)
+            fill()
+            for idx, f in enumerate(allFiles):
+                compression, spool, crc, fileSize = futures.pop(idx).result()
+                fill()
+                zinfo = ZipInfo.from_file(f)
+                zinfo.compress_type = compression
+                if spool is None:
+                    with open(f, 'rb') as src:
+                        writeMember(zf, zinfo, src)
+                    metrics['stored'] += 1
+                else:
+                    with spool:
+                        writeDeflatedMember(zf, zinfo, spool, crc, fileSize)
+                    metrics['deflated'] += 1
+                metrics['members'] += 1
+                metrics['bytesIn'] += zinfo.file_size
+                metrics['bytesOut'] += zinfo.compress_size
+                if time.time() - lastProgress > progressInterval:
+                    lastProgress = time.time()
+                    logging.info("Zipped %s of %s files into %s (%.1f MB/s)" % (metrics['members'], len(allFiles),
+                                 zipFile, metrics['bytesIn'] / 1048576.0 / (lastProgress - start)))
+        os.replace(tempZip, zipFile)
+    except:
+        #Members prepared ahead of the writer are dropped, with their spools
+        for f in futures.values():
+            if not f.cancel() and f.done() and f.exception() is None:
+                spool = f.result()[1]
+                if spool is not None:
+                    spool.close()
+        if os.path.exists(tempZip):
+            os.remove(tempZip)
+        raise
+    metrics['seconds'] = time.time() - start
+    runMetrics.countIO(read=metrics['bytesIn'], written=os.path.getsize(zipFile), opened=metrics['members'] + 1)
+    metrics['MBps'] = metrics['bytesIn'] / 1048576.0 / max(metrics['seconds'], 1e-6)
+    logging.info("Zipped %s files (%s stored, %s deflated) into %s: %.1f MB in, %.1f MB out, %.1f MB/s" % (
+                 metrics['members'], metrics['stored'], metrics['deflated'], zipFile,
+                 metrics['bytesIn'] / 1048576.0, metrics['bytesOut'] / 1048576.0, metrics['MBps']))
+    return(metrics)
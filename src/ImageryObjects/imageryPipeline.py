@@ -0,0 +1,315 @@
+###############################################################################
+# Imagery Pipeline
+# Purpose: process delivered zipfiles as a pipeline of stages, each with its
+#   own bounded pool: status checks, extraction and verification of the source
+#   on threads (network bound), tiling on processes (CPU bound) and uploads to
+#   the imagery services one at a time. Zipfiles move to the next stage as soon
+#   as they finish a stage
+# NOTE: keep compatible with Python 2.7 (ArcGIS)
+###############################################################################
+
+import os, sys, time, shutil, threading, traceback, collections
+import imageryObject, runMetrics
+
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+tPrint = imageryObject.tPrint
+
+def callStage(func, args, stage=None, item=None):
+    ''' Run a stage task, returning errors rather than raising them so they reach the pipeline
+        from both thread and process pools
+
+    Parameters:
+        stage, item (strings) (optional): measure the task as this stage and item (see runMetrics.stageMeasure);
+            passed only while the main process is recording, as process pool workers do not share its
+            recording state on every platform. The record is returned rather than written by the worker
+
+    RETURNS
+    [list] - [succeeded, result or error message, seconds, runMetrics record (None if not measured)]
+    '''
+    start = time.time()
+    if stage is not None:
+        measured = runMetrics.stageMeasure(stage, item, log=False)
+    else:
+        measured = runMetrics.notMeasured()
+    try:
+        with measured:
+            outcome = [True, func(*args)]
+    except Exception:
+        outcome = [False, traceback.format_exc()]
+    return(outcome + [time.time() - start, measured.record])
+
+class pipelineStage(object):
+    def __init__(self, name, pool, workers):
+        ''' A pool of workers for one stage, with counts of tasks waiting, finished and failed '''
+        self.name = name
+        self.pool = pool
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+        self.busySeconds = 0.0
+        #Tasks not yet finished, in submission order: task number: [callback, time it reached a worker]
+        self.pending = collections.OrderedDict()
+        self.taskCount = 0
+
+    def submit(self, func, args, onDone, onFailure, item=None):
+        ''' Queue func(*args) on the stage; onDone(succeeded, result) is called on completion and
+            onFailure(error message) if onDone itself fails. When runMetrics is recording, the task is
+            recorded as this stage for item
+        '''
+        with self.lock:
+            self.submitted += 1
+            self.taskCount += 1
+            task = self.taskCount
+        def finished(outcome):
+            succeeded, result, seconds, record = outcome
+            with self.lock:
+                #A task that has already timed out (see expire) is only finished once
+                if self.pending.pop(task, None) is None:
+                    return
+            runMetrics.write(record)
+            with self.lock:
+                self.completed += 1
+                self.busySeconds += seconds
+                if not succeeded:
+                    self.failed += 1
+            try:
+                onDone(succeeded, result)
+            except Exception:
+                onFailure(traceback.format_exc())
+        with self.lock:
+            self.pending[task] = [finished, None]
+        measureArgs = (self.name, item) if runMetrics.enabled else ()
+        callbacks = {'callback':finished}
+        if sys.version_info[0] >= 3:
+            #Errors raised outside callStage, i.e. - arguments or results that cannot be pickled
+            callbacks['error_callback'] = lambda e: finished([False, "%s: %s" % (type(e).__name__, e), 0.0, None])
+        self.pool.apply_async(callStage, (func, args) + measureArgs, **callbacks)
+
+    def expire(self, timeout):
+        ''' Fail the tasks that have been with a worker for more than timeout seconds, i.e. - when a pool
+            process died and the task will never return. Pools run tasks in submission order, so a task is
+            taken to reach a worker once fewer tasks than workers were submitted before it and are pending
+
+        RETURNS
+        [int] - number of tasks that timed out
+        '''
+        now = time.time()
+        expired = []
+        with self.lock:
+            for task, entry in list(self.pending.items())[:self.workers]:
+                if entry[1] is None:
+                    entry[1] = now
+                elif now - entry[1] > timeout:
+                    expired.append(entry[0])
+        for finished in expired:
+            finished([False, "No result after %.0f seconds, the worker is presumed lost" % timeout, timeout, None])
+        with self.lock:
+            self.expired += len(expired)
+        return(len(expired))
+
+    def shutdown(self):
+        ''' Close the pool and wait for its workers; a pool with lost tasks is not waited for, as it never finishes '''
+        if self.expired == 0:
+            self.pool.close()
+            self.pool.join()
+        elif isinstance(self.pool, ThreadPool):
+            #Worker threads are daemons and cannot be stopped; they are left behind
+            self.pool.close()
+        else:
+            self.pool.terminate()
+
+    def report(self, elapsed):
+        with self.lock:
+            return("%s: %s queued, %s done (%s failed), %.1f per minute, %.0f%% busy" % (self.name,
+                   self.submitted - self.completed, self.completed, self.failed,
+                   self.completed * 60.0 / max(elapsed, 1e-6),
+                   100.0 * self.busySeconds / max(elapsed * self.workers, 1e-6)))
+
+def openZip(inputZip, sensor, zipArgs):
+    return(imageryObject.imageryZip(inputZip, sensor, **zipArgs))
+
+class imageryPipeline(object):
+    def __init__(self, statusWorkers=4, extractWorkers=2, tileWorkers=4, verifyWorkers=2, maxIngest=4,
+                 performUpload=False, reportInterval=60, taskTimeout=4 * 3600, **zipArgs):
+        ''' Stage separated processing of delivered zipfiles
+
+        Parameters:
+            statusWorkers (int): threads opening zipfiles and checking their status
+            extractWorkers (int): threads extracting archives
+            tileWorkers (int): processes tiling TIFs
+            verifyWorkers (int): threads verifying the source folder of every zipfile against its archive
+            maxIngest (int): most zipfiles extracted to Ingest and waiting to be tiled at once, bounds local disk use
+            performUpload (boolean): upload zipfiles that are not in the imagery services (one at a time)
+            reportInterval (int): seconds between stage reports in the log
+            taskTimeout (int): seconds a task may spend with a worker before it is failed, so a pool
+                process that dies does not stop the run; see pipelineStage.expire
+            zipArgs: passed on to imageryObject.imageryZip, i.e. - catalog and statusStore
+        '''
+        self.zipArgs = zipArgs
+        self.performUpload = performUpload
+        self.reportInterval = reportInterval
+        self.taskTimeout = taskTimeout
+        #Zipfiles only reach the extract stage once they hold an Ingest slot; the others wait in ingestQueue
+        self.ingestLock = threading.Lock()
+        self.ingestFree = maxIngest
+        self.ingestQueue = collections.deque()
+        self.ingesting = set()
+        #The process pool is started before any threads
+        tilePool = Pool(tileWorkers)
+        self.stages = [pipelineStage("status", ThreadPool(statusWorkers), statusWorkers),
+                       pipelineStage("extract", ThreadPool(extractWorkers), extractWorkers),
+                       pipelineStage("tile", tilePool, tileWorkers),
+                       pipelineStage("verify", ThreadPool(verifyWorkers), verifyWorkers),
+                       pipelineStage("upload", ThreadPool(1), 1)]
+        self.stage = dict((s.name, s) for s in self.stages)
+        self.finished = threading.Condition()
+        self.remaining = 0
+        self.results = []
+
+    def run(self, allFiles):
+        ''' Process every zipfile and wait for all of them to finish
+
+        Parameters:
+            allFiles (list of lists): [zipfile path, sensor]
+
+        RETURNS
+        [list of strings] - statusUpdate of every zipfile, in the order they finished
+        '''
+        start = time.time()
+        self.remaining = len(allFiles)
+        for inputZip, sensor in allFiles:
+            self.stage['status'].submit(openZip, (inputZip, sensor, self.zipArgs),
+                                        lambda ok, result, z=inputZip: self.onStatus(ok, result, z),
+                                        lambda error, z=inputZip: self.finish(None, z, error), inputZip)
+        lastReport = start
+        try:
+            while True:
+                with self.finished:
+                    if self.remaining == 0:
+                        break
+                    self.finished.wait(min(self.reportInterval, max(self.taskTimeout / 10.0, 1)))
+                if time.time() - lastReport >= self.reportInterval:
+                    lastReport = time.time()
+                    self.report(lastReport - start)
+                #Outside the condition, expired tasks call back into finish
+                for s in self.stages:
+                    if s.expire(self.taskTimeout) > 0:
+                        tPrint("%s: tasks timed out after %s seconds" % (s.name, self.taskTimeout))
+        finally:
+            for s in self.stages:
+                s.shutdown()
+        self.report(time.time() - start)
+        return(self.results)
+
+    def report(self, elapsed):
+        for s in self.stages:
+            tPrint(s.report(elapsed))
+
+    def finish(self, xx, inputZip, error=None):
+        ''' Record the final status of a zipfile and release the wait in run '''
+        if error is not None:
+            tPrint("Error processing %s:\n%s" % (inputZip, error))
+        if xx is not None:
+            try:
+                xx.updateStatus()
+                self.results.append(xx.statusUpdate)
+                tPrint(xx.statusUpdate)
+            except Exception:
+                tPrint("Could not update the status of %s:\n%s" % (inputZip, traceback.format_exc()))
+        with self.finished:
+            self.remaining -= 1
+            self.finished.notify()
+
+    def failed(self, xx):
+        return(lambda error: self.finish(xx, xx.zipFile, error))
+
+    def onStatus(self, ok, xx, inputZip):
+        if not ok:
+            return(self.finish(None, inputZip, xx))
+        tPrint(xx.statusUpdate)
+        if xx.sourceExists == False:
+            self.queueExtract(xx)
+        else:
+            self.onSource(xx)
+
+    def queueExtract(self, xx):
+        ''' Extract the zipfile once an Ingest slot is free; waiting zipfiles are not in the extract stage,
+            so the stage's taskTimeout only covers the extraction itself
+        '''
+        with self.ingestLock:
+            if self.ingestFree == 0:
+                self.ingestQueue.append(xx)
+                return
+            self.ingestFree -= 1
+        self.submitExtract(xx)
+
+    def submitExtract(self, xx):
+        with self.ingestLock:
+            self.ingesting.add(xx.zipFile)
+        self.stage['extract'].submit(xx.extractToIngest, (), lambda ok, result: self.onExtracted(ok, result, xx),
+                                     lambda error: self.releaseIngest(xx, error), xx.zipFile)
+
+    def releaseIngest(self, xx, error=None):
+        ''' Remove the Ingest folder of the zipfile and give its slot to the next waiting zipfile; safe to call
+            more than once. With an error, the zipfile is also finished
+        '''
+        with self.ingestLock:
+            held = xx.zipFile in self.ingesting
+            self.ingesting.discard(xx.zipFile)
+            nextZip = None
+            if held:
+                if len(self.ingestQueue) > 0:
+                    nextZip = self.ingestQueue.popleft()
+                else:
+                    self.ingestFree += 1
+        if held:
+            shutil.rmtree(xx.ingestFolder, ignore_errors=True)
+        if nextZip is not None:
+            self.submitExtract(nextZip)
+        if error is not None:
+            self.finish(xx, xx.zipFile, error)
+
+    def onExtracted(self, ok, toTile, xx):
+        if not ok:
+            return(self.releaseIngest(xx, toTile))
+        if len(toTile) == 0:
+            return(self.onTiled(xx, []))
+        state = {'remaining':len(toTile), 'errors':[]}
+        lock = threading.Lock()
+        def tiled(ok, result):
+            with lock:
+                state['remaining'] -= 1
+                if not ok:
+                    state['errors'].append(result)
+                done = state['remaining'] == 0
+            if done:
+                self.onTiled(xx, state['errors'])
+        for dirName, fileName in toTile:
+            self.stage['tile'].submit(imageryObject.tileRaster, (dirName, fileName), tiled,
+                                      lambda error: self.releaseIngest(xx, error), os.path.join(dirName, fileName))
+
+    def onTiled(self, xx, errors):
+        self.releaseIngest(xx)
+        #The source folder has changed, verify it again
+        xx.verification = None
+        if len(errors) > 0:
+            return(self.finish(xx, xx.zipFile, "\n".join(errors)))
+        self.onSource(xx)
+
+    def onSource(self, xx):
+        self.stage['verify'].submit(xx.checkForSource, (), lambda ok, result: self.onVerified(ok, result, xx),
+                                    self.failed(xx), xx.zipFile)
+
+    def onVerified(self, ok, result, xx):
+        if not ok:
+            return(self.finish(xx, xx.zipFile, result))
+        if xx.serviceExists == False and self.performUpload:
+            self.stage['upload'].submit(xx.uploadSourceData, (), lambda ok, result: self.finish(xx, xx.zipFile, None if ok else result),
+                                        self.failed(xx), xx.zipFile)
+        else:
+            self.finish(xx, xx.zipFile)
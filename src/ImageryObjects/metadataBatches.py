@@ -0,0 +1,157 @@
+###############################################################################
+# Tile Metadata Batches
+# Purpose: hold the tile metadata of very large folders in fixed size batches
+#   of columnar arrays, with footprints kept as coordinate arrays rather than
+#   geometry objects, and summarise a stream of batches in a single pass: the
+#   footprint union is built incrementally, one batch at a time, so memory
+#   stays flat however many tiles a folder has. A stream read once can be
+#   spooled to disk and read again without reading the tiles again
+###############################################################################
+
+import pickle, tempfile
+
+import numpy as np
+import geopandas as gpd
+import pandas as pd
+import pyproj, shapely
+
+# Tiles per batch when streaming tile metadata
+BATCH_SIZE = 2048
+metadataColumns = ["Bands", "Res", "geometry", "geohash", "columns", "rows", "Date", "file"]
+
+class metadataBatch(object):
+    def __init__(self, bands, res, footprints, geohashes, columns, rows, dates, files):
+        ''' Tile metadata of a batch of tiles, one array per column of deliveredImageryFolder.getMetadata
+
+        Parameters:
+            footprints (list of shapely geometries): WGS84 footprints; stored as shapely ragged coordinate arrays
+                when the batch has a single geometry type, otherwise as WKB
+            columns, rows (lists of ints): tile dimensions; None (unknown) is stored as -1
+        '''
+        self.bands = np.asarray(bands, dtype='int16')
+        self.res = np.asarray(res, dtype='float64')
+        self.geohash = np.asarray(geohashes, dtype=str)
+        self.columns = np.array([-1 if x is None else x for x in columns], dtype='int32')
+        self.rows = np.array([-1 if x is None else x for x in rows], dtype='int32')
+        self.date = np.asarray(dates, dtype=str)
+        self.file = np.asarray(files, dtype=str)
+        footprints = np.asarray(footprints, dtype=object)
+        self.ragged = None
+        self.wkb = None
+        if len(np.unique(shapely.get_type_id(footprints))) == 1:
+            self.ragged = shapely.to_ragged_array(footprints)
+        else:
+            self.wkb = shapely.to_wkb(footprints)
+
+    @classmethod
+    def fromFrame(cls, frame):
+        ''' Batch from (a slice of) a getMetadata GeoDataFrame '''
+        dims = [[None if pd.isnull(x) else int(x) for x in frame[c]] for c in ['columns', 'rows']]
+        return(cls(frame['Bands'].values, frame['Res'].values, frame.geometry.values, frame['geohash'].values,
+                   dims[0], dims[1], frame['Date'].astype(str).values, frame['file'].values))
+
+    def __len__(self):
+        return(len(self.file))
+
+    def geometries(self):
+        ''' RETURNS [numpy array] - shapely footprints of the batch '''
+        if self.ragged is not None:
+            return(shapely.from_ragged_array(*self.ragged))
+        return(shapely.from_wkb(self.wkb))
+
+    def toFrame(self):
+        ''' RETURNS [geopandas dataframe] - the batch with the columns and CRS of getMetadata; unknown dimensions are null '''
+        frame = pd.DataFrame({'Bands':self.bands, 'Res':self.res, 'geometry':self.geometries(), 'geohash':self.geohash,
+                              'columns':pd.array(np.where(self.columns < 0, None, self.columns), dtype='Int32'),
+                              'rows':pd.array(np.where(self.rows < 0, None, self.rows), dtype='Int32'),
+                              'Date':self.date, 'file':self.file}, columns=metadataColumns)
+        return(gpd.GeoDataFrame(frame, geometry="geometry", crs=pyproj.CRS('epsg:4326')))
+
+class batchSpool(object):
+    def __init__(self):
+        ''' metadataBatches written to a temporary file as they arrive and read back in the same order, so a
+            stream of batches can be read any number of times holding a single batch at a time. The file is
+            removed when the spool is closed or garbage collected
+        '''
+        self.spool = tempfile.TemporaryFile()
+        self.offsets = []
+
+    def add(self, batch):
+        self.spool.seek(0, 2)
+        self.offsets.append(self.spool.tell())
+        pickle.dump(batch, self.spool, pickle.HIGHEST_PROTOCOL)
+
+    def __len__(self):
+        return(len(self.offsets))
+
+    def __iter__(self):
+        #Seek before every batch, so readers can be interleaved
+        for offset in list(self.offsets):
+            self.spool.seek(offset)
+            yield(pickle.load(self.spool))
+
+    def close(self):
+        self.spool.close()
+
+def frameBatches(frame, batchSize=BATCH_SIZE):
+    ''' Split a getMetadata GeoDataFrame into metadataBatches '''
+    for start in range(0, len(frame), batchSize):
+        yield(metadataBatch.fromFrame(frame.iloc[start:start + batchSize]))
+
+class footprintUnion(object):
+    def __init__(self, gridSize=None):
+        ''' Union of footprints that arrive in batches. Each batch is unioned on its own (a cascaded union),
+            then partial unions covering the same number of batches are merged in pairs, as in binary
+            counting, so only about log2(batches) partial unions are held at any time
+
+        Parameters:
+            gridSize (float) (optional): precision grid, in degrees, the union is snapped to; snapping removes
+                the slivers between adjacent tiles and speeds up the union. None keeps full precision
+        '''
+        self.gridSize = gridSize
+        self.partials = []
+
+    def add(self, geometries):
+        geometries = [g for g in geometries if g is not None]
+        if len(geometries) == 0:
+            return
+        merged = shapely.union_all(geometries, grid_size=self.gridSize)
+        level = 0
+        while len(self.partials) > 0 and self.partials[-1][0] == level:
+            merged = shapely.union(self.partials.pop()[1], merged, grid_size=self.gridSize)
+            level += 1
+        self.partials.append([level, merged])
+
+    def result(self):
+        ''' RETURNS [shapely geometry] - union of every footprint added, None if nothing was added '''
+        if len(self.partials) == 0:
+            return(None)
+        if len(self.partials) > 1:
+            self.partials = [[self.partials[-1][0], shapely.union_all([x[1] for x in self.partials], grid_size=self.gridSize)]]
+        return(self.partials[0][1])
+
+def summarizeBatches(batches, gridSize=None):
+    ''' Summarise a stream of metadataBatches in one pass, holding a single batch at a time
+
+    RETURNS
+    [dictionary] - tiles; min and max of Res, Bands and Date (as 2 item lists); undated (tiles with the
+        YYYYMMDD placeholder date); union (footprintUnion of every tile, None if there are no tiles)
+    '''
+    summary = {'tiles':0, 'undated':0, 'Res':None, 'Bands':None, 'Date':None}
+    union = footprintUnion(gridSize)
+    def extend(key, values):
+        low, high = min(values), max(values)
+        if summary[key] is not None:
+            low, high = min(low, summary[key][0]), max(high, summary[key][1])
+        summary[key] = [low, high]
+    for batch in batches:
+        if len(batch) == 0:
+            continue
+        summary['tiles'] += len(batch)
+        summary['undated'] += int(np.sum(batch.date == "YYYYMMDD"))
+        extend('Res', batch.res)
+        extend('Bands', batch.bands)
+        extend('Date', batch.date)
+        union.add(batch.geometries())
+    summary['union'] = union.result()
+    return(summary)
@@ -0,0 +1,282 @@
+###############################################################################
+# Mosaic Updates
+# Purpose: collect the field values (i.e. - SensorName), raster functions
+#   (i.e. - stretches) and synchronizations of mosaic dataset items asked for
+#   during a run, and apply them at the end with as few bulk operations per
+#   service as possible: one per distinct value, on every item it applies to.
+#   Updates are applied through a backend: arcpy for the production
+#   geodatabase, or a local SQLite mosaic catalog that records every call, so
+#   the batching can be checked without ArcGIS
+# NOTE: imported by imageryObject, keep compatible with Python 2.7 (ArcGIS)
+###############################################################################
+
+import sqlite3, logging, threading
+
+# Most items named in the where clause of a single operation
+MAX_WHERE_ITEMS = 1000
+# Name of the function in the stretch templates (see imageStatistics.renderStretch)
+STRETCH_FUNCTION = "Stretch Function"
+
+def whereClause(oids, field="OBJECTID"):
+    ''' RETURNS [string] - where clause selecting the items, every item if oids is None '''
+    if oids is None:
+        return("")
+    return("%s IN (%s)" % (field, ",".join(str(x) for x in oids)))
+
+class arcpyMosaicBackend(object):
+    ''' Update mosaic datasets with arcpy; every operation works on a layer of the selected items '''
+    def __init__(self):
+        import arcpy
+        self.arcpy = arcpy
+        self.calls = {}
+
+    def _count(self, operation):
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+
+    def calculateField(self, service, field, value, oids=None):
+        self._count('calculateField')
+        layer = "%s_update" % service.replace("\\", "/").split("/")[-1]
+        self.arcpy.MakeMosaicLayer_management(service, layer, whereClause(oids))
+        try:
+            expression = str(value) if isinstance(value, (int, float)) else '"%s"' % str(value).replace('"', '\\"')
+            self.arcpy.CalculateField_management(layer, field, expression, "PYTHON_9.3")
+        finally:
+            self.arcpy.Delete_management(layer)
+
+    def editFunction(self, service, template, oids=None, functionName=STRETCH_FUNCTION):
+        ''' Remove the function named functionName from the items, if they have one, and insert the template,
+            so that editing the items again replaces their function rather than stacking another on it
+        '''
+        self._count('editFunction')
+        layer = "%s_update" % service.replace("\\", "/").split("/")[-1]
+        self.arcpy.MakeMosaicLayer_management(service, layer, whereClause(oids))
+        try:
+            try:
+                self.arcpy.EditRasterFunction_management(layer, "EDIT_MOSAIC_DATASET_ITEM", "REMOVE", "", functionName)
+            except self.arcpy.ExecuteError:
+                logging.info("No %s to remove in %s: %s" % (functionName, service, self.arcpy.GetMessages(2)))
+            self.arcpy.EditRasterFunction_management(layer, "EDIT_MOSAIC_DATASET_ITEM", "INSERT", template)
+        finally:
+            self.arcpy.Delete_management(layer)
+
+    def synchronize(self, service, oids=None):
+        self._count('synchronize')
+        self.arcpy.SynchronizeMosaicDataset_management(in_mosaic_dataset=service, where_clause=whereClause(oids),
+            new_items="UPDATE_WITH_NEW_ITEMS", sync_only_stale="SYNC_STALE", update_cellsize_ranges="UPDATE_CELL_SIZES",
+            update_boundary="UPDATE_BOUNDARY", update_overviews="NO_OVERVIEWS", build_pyramids="NO_PYRAMIDS",
+            calculate_statistics="NO_STATISTICS", build_thumbnails="NO_THUMBNAILS", build_item_cache="NO_ITEM_CACHE",
+            rebuild_raster="REBUILD_RASTER", update_fields="UPDATE_FIELDS",
+            fields_to_update="AcquisitionDate;Best;CenterX;CenterY;CloudCover;Dataset_ID;GroupName;LeafStatus;Metadata_URL;OffNadir;ProductName;Raster;SatAzimuth;SatElevation;SensorName;Shape;Source;SunAzimuth;SunElevation;Tag;Year;Zip_Path;ZOrder",
+            existing_items="UPDATE_EXISTING_ITEMS", broken_items="REMOVE_BROKEN_ITEMS", skip_existing_items="SKIP_EXISTING_ITEMS",
+            refresh_aggregate_info="REFRESH_INFO")
+
+class localMosaicBackend(object):
+    def __init__(self, catalogFile=":memory:"):
+        ''' Stand-in for the mosaic datasets: items, their field values, raster functions and synchronizations
+            are kept in SQLite, and every operation is counted in self.calls
+
+        Parameters:
+            catalogFile (string) (optional): path to SQLite database; defaults to an in memory catalog
+        '''
+        self.catalogFile = catalogFile
+        self.calls = {}
+        self.connection = sqlite3.connect(catalogFile, check_same_thread=False)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS items (service TEXT, oid INTEGER, PRIMARY KEY (service, oid));
+            CREATE TABLE IF NOT EXISTS fieldValues (service TEXT, oid INTEGER, field TEXT, value TEXT,
+                PRIMARY KEY (service, oid, field));
+            CREATE TABLE IF NOT EXISTS functions (service TEXT, oid INTEGER, function TEXT, template TEXT,
+                PRIMARY KEY (service, oid, function));
+            CREATE TABLE IF NOT EXISTS synchronized (service TEXT, oid INTEGER, count INTEGER,
+                PRIMARY KEY (service, oid));''')
+        self.connection.commit()
+
+    def _count(self, operation):
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+
+    def addItems(self, service, oids):
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO items VALUES (?,?)", [(service, x) for x in oids])
+
+    def _items(self, service, oids):
+        ''' RETURNS [list of ints] - the items of the service selected by oids, every item if oids is None '''
+        rows = self.connection.execute("SELECT oid FROM items WHERE service = ? ORDER BY oid", (service,)).fetchall()
+        existing = [x[0] for x in rows]
+        if oids is None:
+            return(existing)
+        existing = set(existing)
+        return([x for x in oids if x in existing])
+
+    def calculateField(self, service, field, value, oids=None):
+        self._count('calculateField')
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO fieldValues VALUES (?,?,?,?)",
+                                        [(service, x, field, value) for x in self._items(service, oids)])
+
+    def editFunction(self, service, template, oids=None, functionName=STRETCH_FUNCTION):
+        self._count('editFunction')
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO functions VALUES (?,?,?,?)",
+                                        [(service, x, functionName, template) for x in self._items(service, oids)])
+
+    def synchronize(self, service, oids=None):
+        self._count('synchronize')
+        with self.connection:
+            for x in self._items(service, oids):
+                self.connection.execute("INSERT OR IGNORE INTO synchronized VALUES (?,?,0)", (service, x))
+                self.connection.execute("UPDATE synchronized SET count = count + 1 WHERE service = ? AND oid = ?", (service, x))
+
+    def fieldValue(self, service, oid, field):
+        row = self.connection.execute("SELECT value FROM fieldValues WHERE service = ? AND oid = ? AND field = ?",
+                                      (service, oid, field)).fetchone()
+        return(None if row is None else row[0])
+
+    def itemFunctions(self, service, oid):
+        ''' RETURNS [list of strings] - templates of the functions of the item, in the order they were last edited '''
+        return([x[0] for x in self.connection.execute("SELECT template FROM functions WHERE service = ? AND oid = ? ORDER BY rowid",
+                                                      (service, oid))])
+
+    def synchronizedCount(self, service, oid):
+        row = self.connection.execute("SELECT count FROM synchronized WHERE service = ? AND oid = ?", (service, oid)).fetchone()
+        return(0 if row is None else row[0])
+
+    def close(self):
+        self.connection.close()
+
+class _pendingValues(object):
+    ''' Value asked for every item of a service, and values asked for single items since; the last value
+        asked for an item wins
+    '''
+    def __init__(self):
+        self.allItems = None
+        self.hasAll = False
+        self.byItem = {}
+
+    def set(self, value, oids=None):
+        if oids is None:
+            self.allItems = value
+            self.hasAll = True
+            self.byItem = {}
+        else:
+            for oid in oids:
+                self.byItem[oid] = value
+
+    def batches(self, maxItems):
+        ''' RETURNS [list of lists] - [value, oids (None for every item)] of every operation needed, the value
+            for every item first, then one operation per distinct value (split at maxItems items)
+        '''
+        operations = []
+        if self.hasAll:
+            operations.append([self.allItems, None])
+        byValue = {}
+        for oid in sorted(self.byItem):
+            value = self.byItem[oid]
+            if self.hasAll and value == self.allItems:
+                continue
+            byValue.setdefault(value, []).append(oid)
+        for value in sorted(byValue, key=lambda x: byValue[x][0]):
+            oids = byValue[value]
+            for start in range(0, len(oids), maxItems):
+                operations.append([value, oids[start:start + maxItems]])
+        return(operations)
+
+class mosaicUpdateQueue(object):
+    def __init__(self, backend, maxItems=MAX_WHERE_ITEMS):
+        ''' Updates of mosaic dataset items collected during a run and applied together by apply.
+            Safe to share between threads
+
+        Parameters:
+            backend (arcpyMosaicBackend or localMosaicBackend): applies the updates
+            maxItems (int): most items named in a single operation
+        '''
+        self.backend = backend
+        self.maxItems = maxItems
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        ''' Drop every pending update '''
+        self.services = []
+        self.fields = {}
+        self.functions = {}
+        self.syncs = {}
+
+    def _service(self, service):
+        if not service in self.services:
+            self.services.append(service)
+
+    def setField(self, service, field, value, oids=None):
+        ''' Set a field of the items (every item of the service if oids is None) '''
+        with self.lock:
+            self._service(service)
+            self.fields.setdefault((service, field), _pendingValues()).set(value, oids)
+
+    def setFunction(self, service, template, oids=None, functionName=STRETCH_FUNCTION):
+        ''' Set a raster function template (i.e. - a rendered stretch) on the items, replacing the function
+            named functionName if they have one; see setField
+        '''
+        with self.lock:
+            self._service(service)
+            self.functions.setdefault((service, functionName), _pendingValues()).set(template, oids)
+
+    def synchronize(self, service, oids=None):
+        ''' Synchronize the items (every stale item of the service if oids is None) once the other updates are applied '''
+        with self.lock:
+            self._service(service)
+            if oids is None:
+                self.syncs[service] = None
+            elif self.syncs.get(service, []) is not None:
+                self.syncs[service] = sorted(set(self.syncs.get(service, [])) | set(oids))
+
+    def _operations(self):
+        operations = []
+        for service in self.services:
+            for (curService, field), values in sorted(self.fields.items()):
+                if curService == service:
+                    operations.extend([['calculateField', service, field, v, o] for v, o in values.batches(self.maxItems)])
+            for (curService, functionName), values in sorted(self.functions.items()):
+                if curService == service:
+                    operations.extend([['editFunction', service, functionName, v, o] for v, o in values.batches(self.maxItems)])
+        #Synchronize after every service is updated, derived mosaics pick up the changes of their sources
+        for service in self.services:
+            if not service in self.syncs:
+                continue
+            oids = self.syncs[service]
+            if oids is None:
+                operations.append(['synchronize', service, None, None, None])
+            for start in range(0, len(oids or []), self.maxItems):
+                operations.append(['synchronize', service, None, None, oids[start:start + self.maxItems]])
+        return(operations)
+
+    def pending(self):
+        ''' RETURNS [list of lists] - [operation, service, field (the function name for functions, None for
+            synchronizations), value, oids] of every operation apply would issue, in the order they would be issued
+        '''
+        with self.lock:
+            return(self._operations())
+
+    def apply(self):
+        ''' Apply every pending update and empty the queue; an operation that fails is logged and the others
+            still applied
+
+        RETURNS
+        [list of ints] - number of operations issued and number that failed
+        '''
+        with self.lock:
+            operations = self._operations()
+            self.clear()
+        failed = 0
+        for operation, service, field, value, oids in operations:
+            try:
+                if operation == 'calculateField':
+                    self.backend.calculateField(service, field, value, oids)
+                elif operation == 'editFunction':
+                    self.backend.editFunction(service, value, oids, field)
+                else:
+                    self.backend.synchronize(service, oids)
+            except Exception as e:
+                failed += 1
+                logging.warning("Could not %s %s of %s items in %s: %s" % (operation, field or value or "",
+                                "all" if oids is None else len(oids), service, e))
+        logging.info("Mosaic updates: %s operations, %s failed" % (len(operations), failed))
+        return([len(operations), failed])
@@ -0,0 +1,30 @@
+###############################################################################
+# Overview Reading
+# Purpose: pick the internal overview of a raster to sample it from, and the
+#   shape of a decimated read, so that statistics and masks are read from
+#   overviews rather than the full resolution pixels
+# NOTE: imported by imageStatistics, keep compatible with Python 2.7 (ArcGIS)
+###############################################################################
+
+def chooseOverview(curRaster, maxSize):
+    ''' Pick the smallest overview that is still at least maxSize pixels on its longest side
+
+    RETURNS
+    [int] - overview level to open (0 is the first overview), None if the raster has no overviews
+    '''
+    factors = curRaster.overviews(1)
+    if len(factors) == 0:
+        return(None)
+    longest = max(curRaster.width, curRaster.height)
+    level = 0
+    for idx, factor in enumerate(factors):
+        if longest / float(factor) >= maxSize:
+            level = idx
+    return(level)
+
+def sampleShape(curRaster, maxSize):
+    ''' RETURNS [tuple] - (rows, columns) of a read of the open raster (or overview) decimated to at most
+        maxSize pixels on its longest side
+    '''
+    scale = max(1.0, max(curRaster.width, curRaster.height) / float(maxSize))
+    return((max(1, int(round(curRaster.height / scale))), max(1, int(round(curRaster.width / scale)))))
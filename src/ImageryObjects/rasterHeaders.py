@@ -0,0 +1,144 @@
+###############################################################################
+# Raster Header Scanning
+# Purpose: read the header information (bands, resolution, extent) of imagery
+#   tiles without reading pixels; tiles can be scanned in a thread or process
+#   pool to hide the latency of network shares, and are reprojected to WGS84 in
+#   batches grouped by CRS
+###############################################################################
+
+import rasterio, pyproj, geohash, shapely
+
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+from rasterio.crs import CRS
+
+try:
+    from . import runMetrics
+except ImportError:
+    import runMetrics
+
+# Upper bound on the size of the header scanning pool, regardless of what is requested
+MAX_SCAN_WORKERS = 32
+scanExecutors = {
+    'thread':ThreadPoolExecutor,
+    'process':ProcessPoolExecutor
+}
+
+def readNativeHeader(inFile):
+    ''' Read the header of a single raster in its own coordinate system; the dataset is closed before returning
+
+    Parameters:
+        inFile (string): path to raster file
+
+    RETURNS
+    [dictionary] - Bands, columns, rows (shape[0], shape[1]), bounds, nativeRes and crs of the tile; None if raster has no CRS
+    '''
+    with rasterio.open(inFile) as curRaster:
+        if not curRaster.crs:
+            return(None)
+        return({'Bands':curRaster.count, 'columns':curRaster.shape[0], 'rows':curRaster.shape[1],
+                'bounds':tuple(curRaster.bounds), 'nativeRes':curRaster.res[0], 'crs':str(curRaster.crs)})
+
+@lru_cache(maxsize=None)
+def getTransformer(crs):
+    ''' Transformer from the input CRS to WGS84 (lon/lat order); built once per CRS for the session
+    '''
+    return(pyproj.Transformer.from_crs(pyproj.CRS(crs), pyproj.CRS('epsg:4326'), always_xy=True))
+
+@lru_cache(maxsize=None)
+def getEPSG(crs):
+    return(CRS.from_user_input(crs).to_epsg())
+
+def degreesToMeters(res):
+    ''' Convert an array of resolutions in degrees to meters, measured at the equator in web mercator
+    '''
+    project = pyproj.Transformer.from_crs(pyproj.CRS('epsg:4326'), pyproj.CRS('epsg:3857'))
+    x, y = project.transform(np.zeros(len(res)), res)
+    x0, y0 = project.transform(0, 0)
+    return(np.hypot(np.asarray(x) - x0, np.asarray(y) - y0))
+
+def projectHeaders(nativeHeaders):
+    ''' Convert native headers into tile metadata in WGS84. Tiles are grouped by CRS and the corners 
+        of every tile in a group are reprojected in a single array transformation
+
+    Parameters:
+        nativeHeaders (list of dictionaries): results of readNativeHeader
+
+    RETURNS
+    [list of dictionaries] - Bands, Res (meters), geometry (WGS84 extent), geohash, columns, rows, nativeRes 
+        and crs for each input; None where the input is None
+    '''
+    headers = [None] * len(nativeHeaders)
+    groups = {}
+    for idx, h in enumerate(nativeHeaders):
+        if h:
+            groups.setdefault(h['crs'], []).append(idx)
+    for crs, idxs in groups.items():
+        bounds = np.array([nativeHeaders[idx]['bounds'] for idx in idxs], dtype=float)
+        #Corners follow the vertex order of shapely.geometry.box
+        xs = bounds[:, [2, 2, 0, 0, 2]]
+        ys = bounds[:, [1, 3, 3, 1, 1]]
+        lon, lat = getTransformer(crs).transform(xs.ravel(), ys.ravel())
+        coords = np.stack([np.asarray(lon).reshape(xs.shape), np.asarray(lat).reshape(ys.shape)], axis=-1)
+        extents = shapely.polygons(coords)
+        centroids = shapely.centroid(extents)
+        cX = shapely.get_x(centroids)
+        cY = shapely.get_y(centroids)
+        res = np.array([nativeHeaders[idx]['nativeRes'] for idx in idxs], dtype=float)
+        #Need to transform resolution to a meters measure
+        if getEPSG(crs) == 4326:
+            res = degreesToMeters(res)
+        for i, idx in enumerate(idxs):
+            h = nativeHeaders[idx]
+            headers[idx] = {'Bands':h['Bands'], 'Res':round(float(res[i]), 3),
+                            'geometry':extents[i], 'geohash':geohash.encode(cY[i], cX[i]),
+                            'columns':h['columns'], 'rows':h['rows'],
+                            'nativeRes':h['nativeRes'], 'crs':crs}
+    return(headers)
+
+def readRasterHeader(inFile):
+    ''' Read the tile metadata for a single raster
+
+    RETURNS
+    [dictionary] - see projectHeaders; None if raster has no CRS
+    '''
+    return(projectHeaders([readNativeHeader(inFile)])[0])
+
+def scanRasterHeaders(allImages, workers=1, executor="thread", cache=None, fileKeys=None):
+    ''' Read the headers of a list of rasters, optionally in parallel
+
+    Parameters:
+        allImages (list of strings): rasters to scan
+        workers (int): number of parallel workers; 1 scans sequentially. Capped at MAX_SCAN_WORKERS
+        executor (string): pool to use when workers > 1, one of scanExecutors ('thread' or 'process')
+        cache (headerCache.rasterHeaderCache) (optional): persistent cache; only rasters missing from
+            the cache, or changed since they were cached, are opened
+        fileKeys (list of tuples) (optional): size and modification time of every input, see headerCache.rasterHeaderCache.lookup
+
+    RETURNS
+    [list] - tile metadata (see projectHeaders) for every input, in the same order as allImages
+    '''
+    if not executor in scanExecutors:
+        raise(ValueError("executor must be one of %s" % ", ".join(scanExecutors.keys())))
+    if cache is None:
+        runMetrics.countIO(opened=len(allImages))
+        return(projectHeaders(_scan(allImages, workers, executor)))
+    headers, fileKeys, missing = cache.lookup(allImages, fileKeys)
+    runMetrics.countIO(opened=len(missing))
+    scanned = projectHeaders(_scan([allImages[idx] for idx in missing], workers, executor))
+    for idx, header in zip(missing, scanned):
+        headers[idx] = header
+    cache.store([(allImages[idx], fileKeys[idx], headers[idx]) for idx in missing])
+    return(headers)
+
+def _scan(allImages, workers, executor):
+    workers = max(1, min(int(workers), MAX_SCAN_WORKERS, len(allImages)))
+    if workers == 1:
+        return([readNativeHeader(x) for x in allImages])
+    chunksize = 1
+    if executor == "process":
+        chunksize = max(1, len(allImages) // (workers * 4))
+    with scanExecutors[executor](max_workers=workers) as pool:
+        return(list(pool.map(readNativeHeader, allImages, chunksize=chunksize)))
@@ -0,0 +1,160 @@
+###############################################################################
+# Run Metrics
+# Purpose: record the wall time, CPU time, bytes read and written and files
+#   opened by each stage of a run, for every zipfile, folder or file it
+#   processes, as JSON lines in a metrics file, and summarise them per stage
+#   at the end of the run. Nothing is recorded until a run calls start; until
+#   then measure returns a shared do-nothing context, so countIO finds no stage
+#   to count into. Pool workers are passed the stage to measure explicitly
+# NOTE: imported by imageryObject, keep compatible with Python 2.7 (ArcGIS)
+###############################################################################
+
+import os, json, time, threading
+
+enabled = False
+_log = None
+# Counters of the stages open on each thread, innermost last
+_local = threading.local()
+
+if hasattr(time, 'thread_time'):
+    cpuTime = time.thread_time
+else:
+    def cpuTime():
+        ''' CPU seconds of the process; threads cannot be told apart before Python 3.7 '''
+        times = os.times()
+        return(times[0] + times[1])
+
+class metricsLog(object):
+    def __init__(self, metricsFile=None):
+        ''' Destination of the records of a run, with running totals for every stage
+
+        Parameters:
+            metricsFile (string) (optional): JSON lines file the records are appended to; totals only if None
+        '''
+        self.metricsFile = metricsFile
+        self.run = time.strftime("%Y%m%dT%H%M%S")
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.out = open(metricsFile, 'a') if metricsFile else None
+
+    def write(self, record):
+        record['run'] = self.run
+        with self.lock:
+            total = self.totals.setdefault(record['stage'], {'count':0, 'failed':0, 'wall':0.0, 'cpu':0.0,
+                                                             'bytesRead':0, 'bytesWritten':0, 'filesOpened':0})
+            total['count'] += 1
+            if not record['ok']:
+                total['failed'] += 1
+            for key in ['wall', 'cpu', 'bytesRead', 'bytesWritten', 'filesOpened']:
+                total[key] += record[key]
+            if self.out is not None:
+                self.out.write(json.dumps(record, sort_keys=True) + "\n")
+                self.out.flush()
+
+    def summary(self):
+        ''' RETURNS [list of strings] - table of the totals of every stage, slowest first '''
+        lines = ["%-24s %7s %6s %10s %10s %10s %10s %8s" % ("stage", "count", "failed", "wall (s)", "cpu (s)",
+                 "read (MB)", "write (MB)", "opened")]
+        for stage, t in sorted(self.totals.items(), key=lambda x: -x[1]['wall']):
+            lines.append("%-24s %7s %6s %10.1f %10.1f %10.1f %10.1f %8s" % (stage, t['count'], t['failed'], t['wall'],
+                         t['cpu'], t['bytesRead'] / 1048576.0, t['bytesWritten'] / 1048576.0, t['filesOpened']))
+        lines.append("Run %s: %.1f seconds; nested stages are also counted in the stages around them" % (self.run,
+                     time.time() - self.started))
+        return(lines)
+
+    def close(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+
+class stageMeasure(object):
+    def __init__(self, stage, item=None, log=True):
+        ''' Context recording one stage for one item (i.e. - zipfile, folder or file)
+
+        Parameters:
+            stage (string): name of the stage
+            item (string) (optional): what the stage is processing
+            log (boolean): write the record to the run's metricsLog on exit; otherwise it is only
+                kept in self.record (i.e. - to be returned from a pool worker)
+        '''
+        self.stage = stage
+        self.item = item
+        self.log = log
+        self.record = None
+
+    def __enter__(self):
+        self.counts = [0, 0, 0]
+        if not hasattr(_local, 'stack'):
+            _local.stack = []
+        _local.stack.append(self.counts)
+        self.start = time.time()
+        self.cpuStart = cpuTime()
+        return(self)
+
+    def __exit__(self, excType, excValue, tb):
+        self.record = {'stage':self.stage, 'item':self.item, 'start':self.start,
+                       'wall':time.time() - self.start, 'cpu':cpuTime() - self.cpuStart,
+                       'bytesRead':self.counts[0], 'bytesWritten':self.counts[1], 'filesOpened':self.counts[2],
+                       'ok':excType is None, 'pid':os.getpid()}
+        #Stages on a thread are nested, the innermost closes first
+        _local.stack.pop()
+        if self.log:
+            write(self.record)
+        return(False)
+
+class notMeasured(object):
+    ''' Stands in for stageMeasure while recording is off '''
+    record = None
+    def __enter__(self):
+        return(self)
+    def __exit__(self, excType, excValue, tb):
+        return(False)
+
+_notMeasured = notMeasured()
+
+def measure(stage, item=None, log=True):
+    ''' Measure a stage: with runMetrics.measure("extract", zipFile): ...; see stageMeasure
+
+    RETURNS
+    [stageMeasure] - or a shared context that does nothing when recording is off
+    '''
+    if not enabled:
+        return(_notMeasured)
+    return(stageMeasure(stage, item, log))
+
+def countIO(read=0, written=0, opened=0):
+    ''' Add bytes read and written, and files opened, to every stage open on the calling thread.
+        Work done in pool threads is counted by the caller once the pool returns
+    '''
+    for counts in getattr(_local, 'stack', []):
+        counts[0] += read
+        counts[1] += written
+        counts[2] += opened
+
+def write(record):
+    ''' Add a record (i.e. - returned by a pool worker) to the run's metricsLog '''
+    if _log is not None and record is not None:
+        _log.write(record)
+
+def start(metricsFile=None):
+    ''' Start recording; records are appended to metricsFile (JSON lines) if given '''
+    global enabled, _log
+    stop()
+    _log = metricsLog(metricsFile)
+    enabled = True
+
+def stop():
+    ''' Stop recording
+
+    RETURNS
+    [list of strings] - summary table of the run (see metricsLog.summary), empty if nothing was recorded
+    '''
+    global enabled, _log
+    enabled = False
+    if _log is None:
+        return([])
+    lines = _log.summary()
+    _log.close()
+    _log = None
+    return(lines)
@@ -0,0 +1,103 @@
+###############################################################################
+# Imagery Status Store
+# Purpose: indexed store of the processing status of every delivered zipfile,
+#   keyed on sensor and zipfile name; replaces scanning CURRENT_Imagery_Log.csv
+#   for every zipfile and can still export that csv
+# NOTE: imported by imageryObject, keep compatible with Python 2.7 (ArcGIS)
+###############################################################################
+
+import csv, sqlite3, datetime, threading
+
+# Column order of the imagery log csv, the same as imageryZip.statusUpdate
+statusFields = ['zipFile', 'sensor', 'sourceExists', 'sourceFolder', 'serviceExists', 'rasterCatalog',
+                'serviceOID', 'sourceService', 'rgbOID']
+booleanFields = ['sourceExists', 'serviceExists']
+logHeader = "Sensor,ZipFile,SourceExists,SourceLocation,ServiceExists,ServiceSource,ServiceSourceOID,SourceService"
+
+class imageryStatusStore(object):
+    def __init__(self, storeFile=":memory:"):
+        ''' Status of delivered zipfiles in a SQLite table with (sensor, zipFile) as primary key.
+            Safe to share between threads
+
+        Parameters:
+            storeFile (string) (optional): path to SQLite database; defaults to an in memory store
+        '''
+        self.storeFile = storeFile
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(storeFile, check_same_thread=False)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS status (%s, updated TEXT,
+            PRIMARY KEY (sensor, zipFile))''' % ", ".join("%s TEXT" % f for f in statusFields))
+        self.connection.commit()
+
+    def loadCSV(self, logFile):
+        ''' Bulk load an imagery log csv in a single transaction; later rows replace earlier ones
+            for the same zipfile
+
+        RETURNS
+        [list of ints] - number of rows loaded and number of rows skipped as incomplete
+        '''
+        rows = []
+        skipped = 0
+        with open(logFile, 'r') as src:
+            for data in csv.reader(src):
+                if len(data) < len(statusFields) or data[1].strip() == "ZipFile":
+                    skipped += 1
+                    continue
+                rows.append([x.strip() for x in data[:len(statusFields)]] + [None])
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO status VALUES (%s)" % ",".join(["?"] * (len(statusFields) + 1)), rows)
+        return([len(rows), skipped])
+
+    def count(self):
+        with self.lock:
+            return(self.connection.execute("SELECT COUNT(*) FROM status").fetchone()[0])
+
+    def lookup(self, sensor, zipFile):
+        ''' RETURNS [dictionary] - status of the zipfile (booleans for sourceExists and serviceExists),
+                                   None if it is not in the store
+        '''
+        with self.lock:
+            row = self.connection.execute("SELECT %s FROM status WHERE sensor = ? AND zipFile = ?" % ",".join(statusFields),
+                                          (sensor, zipFile)).fetchone()
+        if row is None:
+            return(None)
+        status = dict(zip(statusFields, row))
+        for f in booleanFields:
+            status[f] = status[f] == "True"
+        return(status)
+
+    def update(self, values):
+        ''' Write the status of a single zipfile, committed immediately
+
+        Parameters:
+            values (list): values of statusFields, in order
+        '''
+        row = [str(x) for x in values] + [datetime.datetime.now().isoformat()]
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO status VALUES (%s)" % ",".join(["?"] * len(row)), row)
+
+    def exportCSV(self, outFile, since=None):
+        ''' Write the store in the imagery log csv format read by checkStatus and downstream consumers
+
+        Parameters:
+            outFile (string): output csv
+            since (string) (optional): only export zipfiles updated after this ISO timestamp, i.e. - the start of a run
+
+        RETURNS
+        [int] - number of rows written
+        '''
+        query = "SELECT %s FROM status" % ",".join(statusFields)
+        params = ()
+        if since is not None:
+            query += " WHERE updated >= ?"
+            params = (since,)
+        with self.lock:
+            rows = self.connection.execute(query + " ORDER BY sensor, zipFile", params).fetchall()
+        with open(outFile, 'w') as out:
+            out.write("%s\n" % logHeader)
+            for row in rows:
+                out.write("%s\n" % ",".join(row))
+        return(len(rows))
+
+    def close(self):
+        self.connection.close()
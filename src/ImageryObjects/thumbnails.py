@@ -0,0 +1,154 @@
+###############################################################################
+# Imagery Thumbnails
+# Purpose: render a single georeferenced preview of all tiles in a delivery.
+#   Tiles are read at reduced resolution (so internal overviews are used) and
+#   composited onto a WGS84 canvas of bounded size. Red, green and blue are
+#   picked by the band order of the vendor, or else the colour interpretation
+###############################################################################
+
+import math, logging, collections
+import rasterio
+
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from rasterio.crs import CRS
+from rasterio.enums import ColorInterp, Resampling
+from rasterio.transform import Affine, from_origin
+from rasterio.warp import reproject
+from rasterio.windows import from_bounds
+
+# Red, green and blue bands by band count for vendors (see vendorMetadata.identifyVendor) whose multispectral
+# bands are not in RGB order: Maxar delivers BGRN and 8 band (coastal, blue, green, yellow, red, ...) products.
+# GDAL labels any 4 band 8 bit GeoTIFF red, green, blue, alpha, so the vendor order is checked first
+vendorBands = {
+    'MAXAR':{4:[3, 2, 1], 8:[5, 3, 2]},
+    'gbdx_clip':{4:[3, 2, 1], 8:[5, 3, 2]}
+}
+
+def rgbBands(curRaster, vendor=None):
+    ''' RETURNS [list of ints] - bands of an open raster to render as red, green and blue: by the vendor's band
+        order, else the bands interpreted as red, green and blue, else the first three (the first band for
+        rasters with fewer than three bands)
+    '''
+    bands = vendorBands.get(vendor, {}).get(curRaster.count)
+    if bands is not None:
+        return(bands)
+    interp = list(curRaster.colorinterp)
+    rgb = [ColorInterp.red, ColorInterp.green, ColorInterp.blue]
+    if all(x in interp for x in rgb):
+        return([interp.index(x) + 1 for x in rgb])
+    return([1, 2, 3] if curRaster.count >= 3 else [1, 1, 1])
+
+def renderTile(inFile, extent, canvasTransform, canvasShape, vendor=None):
+    ''' Read a tile at the resolution of the canvas and reproject it onto the canvas grid
+
+    Parameters:
+        inFile (string): path to raster
+        extent (shapely polygon): WGS84 extent of the tile
+        canvasTransform (affine): transform of the output canvas
+        canvasShape (tuple): (rows, columns) of the output canvas
+        vendor (string) (optional): vendor of the tile, for its band order; see rgbBands
+
+    RETURNS
+    [list] - [row offset, column offset, data (3 x rows x columns float32), valid mask], or None if the tile is off the canvas
+    '''
+    win = from_bounds(*extent.bounds, transform=canvasTransform).round_offsets().round_lengths()
+    row0 = max(int(win.row_off), 0)
+    col0 = max(int(win.col_off), 0)
+    row1 = min(int(win.row_off + win.height) + 1, canvasShape[0])
+    col1 = min(int(win.col_off + win.width) + 1, canvasShape[1])
+    if row1 <= row0 or col1 <= col0:
+        return(None)
+    dstTransform = canvasTransform * Affine.translation(col0, row0)
+    dstShape = (row1 - row0, col1 - col0)
+    with rasterio.open(inFile) as curRaster:
+        # Never read more than twice the pixels the tile covers on the canvas
+        outRows = max(1, min(curRaster.height, 2 * dstShape[0]))
+        outCols = max(1, min(curRaster.width, 2 * dstShape[1]))
+        bands = rgbBands(curRaster, vendor)
+        data = curRaster.read(bands, out_shape=(3, outRows, outCols), resampling=Resampling.nearest).astype('float32')
+        mask = curRaster.dataset_mask(out_shape=(outRows, outCols), resampling=Resampling.nearest)
+        srcTransform = curRaster.transform * Affine.scale(curRaster.width / float(outCols),
+                                                          curRaster.height / float(outRows))
+        srcCrs = curRaster.crs
+    out = np.zeros((3,) + dstShape, dtype='float32')
+    outMask = np.zeros(dstShape, dtype='uint8')
+    reproject(data, out, src_transform=srcTransform, src_crs=srcCrs,
+              dst_transform=dstTransform, dst_crs=CRS.from_epsg(4326), resampling=Resampling.nearest)
+    reproject(mask, outMask, src_transform=srcTransform, src_crs=srcCrs,
+              dst_transform=dstTransform, dst_crs=CRS.from_epsg(4326), resampling=Resampling.nearest)
+    return([row0, col0, out, outMask > 0])
+
+def stretch(canvas, valid, percentiles=(2, 98)):
+    ''' Percentile stretch of each band of the canvas to 8-bit
+    '''
+    out = np.zeros(canvas.shape, dtype='uint8')
+    if not valid.any():
+        return(out)
+    for b in range(canvas.shape[0]):
+        low, high = np.percentile(canvas[b][valid], percentiles)
+        if high <= low:
+            high = low + 1
+        out[b] = (np.clip((canvas[b] - low) / (high - low), 0, 1) * 255).astype('uint8')
+        out[b][~valid] = 0
+    return(out)
+
+def renderThumbnail(tiles, outFile, maxSize=1024, workers=4, vendor=None):
+    ''' Composite a set of tiles into a single georeferenced JPG preview (with world file)
+
+    Memory use is bounded by the canvas (maxSize x maxSize) and the number of workers,
+    not by the size of the source imagery
+
+    Parameters:
+        tiles (list of lists): [file, WGS84 extent] for every tile, i.e. - from rasterHeaders.scanRasterHeaders
+        outFile (string): output JPG
+        maxSize (int): size, in pixels, of the longest side of the thumbnail
+        workers (int): number of tiles rendered in parallel
+        vendor (string) (optional): vendor of the delivery, for its band order; see rgbBands
+
+    RETURNS
+    [string] - outFile
+    '''
+    if len(tiles) == 0:
+        raise(ValueError("No georeferenced tiles to render"))
+    minx = min(t[1].bounds[0] for t in tiles)
+    miny = min(t[1].bounds[1] for t in tiles)
+    maxx = max(t[1].bounds[2] for t in tiles)
+    maxy = max(t[1].bounds[3] for t in tiles)
+    res = max(maxx - minx, maxy - miny) / float(maxSize)
+    canvasShape = (max(1, int(math.ceil((maxy - miny) / res))), max(1, int(math.ceil((maxx - minx) / res))))
+    canvasTransform = from_origin(minx, maxy, res, res)
+    canvas = np.zeros((3,) + canvasShape, dtype='float32')
+    valid = np.zeros(canvasShape, dtype=bool)
+
+    def render(tile):
+        try:
+            return(renderTile(tile[0], tile[1], canvasTransform, canvasShape, vendor))
+        except Exception as e:
+            logging.warning("Could not render %s in thumbnail: %s" % (tile[0], e))
+            return(None)
+
+    def composite(result):
+        if result is None:
+            return
+        row0, col0, data, mask = result
+        rows, cols = mask.shape
+        canvas[:, row0:row0 + rows, col0:col0 + cols][:, mask] = data[:, mask]
+        valid[row0:row0 + rows, col0:col0 + cols] |= mask
+
+    # Only a bounded number of rendered tiles wait to be composited
+    window = max(1, workers) * 2
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for tile in tiles:
+            pending.append(pool.submit(render, tile))
+            if len(pending) >= window:
+                composite(pending.popleft().result())
+        while pending:
+            composite(pending.popleft().result())
+
+    with rasterio.open(outFile, 'w', driver='JPEG', width=canvasShape[1], height=canvasShape[0], count=3,
+                       dtype='uint8', crs=CRS.from_epsg(4326), transform=canvasTransform, WORLDFILE='YES') as out:
+        out.write(stretch(canvas, valid))
+    return(outFile)
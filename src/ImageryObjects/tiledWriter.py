@@ -0,0 +1,109 @@
+###############################################################################
+# Tiled GeoTIFF Writer
+# Purpose: write tiled (optionally cloud optimized) GeoTIFFs with overviews
+#   in-process through rasterio, replacing calls to gdal_translate and
+#   gdaladdo executables
+# NOTE: imported by imageryObject, keep compatible with Python 2.7 (ArcGIS)
+###############################################################################
+
+import os, time, logging
+import rasterio
+
+from rasterio.enums import Resampling
+from rasterio.shutil import copy as rasterioCopy
+from rasterio.windows import Window
+
+defaultOverviews = [2, 4, 8, 16, 32, 64, 128, 256]
+
+def replaceFile(tempFile, outFile):
+    ''' Move a finished temporary file into place (os.replace is not available in Python 2) '''
+    if os.path.exists(outFile):
+        os.remove(outFile)
+    os.rename(tempFile, outFile)
+
+def usableOverviews(width, height, overviewLevels):
+    ''' Overview levels that still produce at least one pixel '''
+    return([x for x in overviewLevels if width // x > 0 and height // x > 0])
+
+def isValidTiled(inFile, blockSize=256, overviewLevels=defaultOverviews):
+    ''' Check that a raster is a complete tiled GeoTIFF, rather than just an existing file
+
+    RETURNS
+    [boolean] - True if the file opens, is tiled with the block size, has the expected overviews
+                and its last block can be read
+    '''
+    if not os.path.exists(inFile):
+        return(False)
+    try:
+        with rasterio.open(inFile) as curRaster:
+            if curRaster.block_shapes[0] != (blockSize, blockSize):
+                return(False)
+            expected = usableOverviews(curRaster.width, curRaster.height, overviewLevels)
+            if len(curRaster.overviews(1)) < len(expected):
+                return(False)
+            colOff = ((curRaster.width - 1) // blockSize) * blockSize
+            rowOff = ((curRaster.height - 1) // blockSize) * blockSize
+            curRaster.read(1, window=Window(colOff, rowOff, curRaster.width - colOff, curRaster.height - rowOff))
+        return(True)
+    except Exception:
+        return(False)
+
+def writeTiled(inFile, outFile, blockSize=256, compress=None, overviewLevels=defaultOverviews, resampling='average',
+               cog=False, numThreads='ALL_CPUS'):
+    ''' Write a tiled GeoTIFF with internal overviews. The output is written to a temporary file and
+        moved to outFile when complete, so an interrupted write never leaves a file at outFile; the temporary
+        file is removed if the write fails. The raster is copied with GDAL CreateCopy, as gdal_translate did, so
+        its tags, band descriptions, GCPs, RPCs, colour tables and masks are kept
+
+    Parameters:
+        inFile (string): raster to convert
+        outFile (string): output GeoTIFF
+        blockSize (int): size of the internal tiles
+        compress (string): GeoTIFF compression (i.e. - 'JPEG', 'DEFLATE', 'LZW'), None for uncompressed
+        overviewLevels (list of ints): decimation factors of the overviews
+        resampling (string): overview resampling method
+        cog (boolean): reorganise the output as a cloud optimized GeoTIFF (overviews before imagery)
+        numThreads (string or int): threads used by GDAL for compression and overview building
+
+    RETURNS
+    [dictionary] - file, bytes written and seconds taken
+    '''
+    start = time.time()
+    tempFile = "%s.partial.tif" % outFile
+    cogFile = "%s.cog.tif" % tempFile
+    try:
+        with rasterio.Env(GDAL_NUM_THREADS=str(numThreads)):
+            with rasterio.open(inFile) as src:
+                ycbcr = (compress or '').upper() == 'JPEG' and src.count == 3 and src.dtypes[0] == 'uint8'
+                levels = usableOverviews(src.width, src.height, overviewLevels)
+            #GDAL CreateCopy carries over the tags, band descriptions, GCPs, RPCs, colour tables and masks
+            options = {'TILED':'YES', 'BLOCKXSIZE':blockSize, 'BLOCKYSIZE':blockSize, 'BIGTIFF':'IF_SAFER',
+                       'NUM_THREADS':str(numThreads), 'INTERLEAVE':'PIXEL'}
+            if compress:
+                options['COMPRESS'] = compress
+            if ycbcr:
+                options['PHOTOMETRIC'] = 'YCBCR'
+            rasterioCopy(inFile, tempFile, driver='GTiff', **options)
+            if len(levels) > 0:
+                overviewConfig = {'INTERLEAVE_OVERVIEW':'PIXEL'}
+                if compress:
+                    overviewConfig['COMPRESS_OVERVIEW'] = compress
+                if ycbcr:
+                    overviewConfig['PHOTOMETRIC_OVERVIEW'] = 'YCBCR'
+                with rasterio.Env(**overviewConfig):
+                    with rasterio.open(tempFile, 'r+') as dst:
+                        dst.build_overviews(levels, Resampling[resampling])
+            if cog:
+                options['COPY_SRC_OVERVIEWS'] = 'YES'
+                rasterioCopy(tempFile, cogFile, driver='GTiff', **options)
+                os.remove(tempFile)
+                tempFile = cogFile
+        replaceFile(tempFile, outFile)
+    finally:
+        #A write that fails leaves no temporary files behind
+        for leftover in [tempFile, cogFile]:
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    report = {'file':outFile, 'bytes':os.path.getsize(outFile), 'seconds':time.time() - start}
+    logging.info("Tiled %s: %.1f MB in %.1f seconds" % (outFile, report['bytes'] / 1048576.0, report['seconds']))
+    return(report)
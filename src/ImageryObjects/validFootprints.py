@@ -0,0 +1,138 @@
+###############################################################################
+# Valid Data Footprints
+# Purpose: outline the pixels of a tile that hold data, rather than its
+#   bounding box, so that nodata collars of rotated or clipped strips are not
+#   counted as coverage. The dataset mask is read from an overview (never the
+#   full resolution pixels), polygonized, simplified and projected to WGS84
+###############################################################################
+
+import time, logging
+import rasterio, shapely
+
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from rasterio import features
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+
+try:
+    from . import rasterHeaders, runMetrics, overviewReading
+except ImportError:
+    import rasterHeaders, runMetrics, overviewReading
+
+# Longest side, in pixels, of the mask that is polygonized for each tile
+MAX_MASK_SIZE = 1024
+
+def readMask(inFile, maxSize=MAX_MASK_SIZE, decimateWithoutOverviews=False):
+    ''' Read the dataset mask of a raster at reduced resolution
+
+    Parameters:
+        inFile (string): path to raster
+        maxSize (int): longest side of the returned mask
+        decimateWithoutOverviews (boolean): for rasters without overviews, read a decimated mask from
+            the full resolution data; otherwise no mask is read for them
+
+    RETURNS
+    [list] - [mask (uint8, 0 is nodata), transform of the mask, crs, overview level], None if the raster
+        has no CRS; mask and transform are None if it has no overviews and decimateWithoutOverviews is False
+    '''
+    with rasterio.open(inFile) as curRaster:
+        if not curRaster.crs:
+            return(None)
+        level = overviewReading.chooseOverview(curRaster, maxSize)
+        crs = str(curRaster.crs)
+    if level is None and not decimateWithoutOverviews:
+        return([None, None, crs, None])
+    openArgs = {} if level is None else {'overview_level':level}
+    with rasterio.open(inFile, **openArgs) as curRaster:
+        outRows, outCols = overviewReading.sampleShape(curRaster, maxSize)
+        mask = curRaster.dataset_mask(out_shape=(outRows, outCols), resampling=Resampling.nearest)
+        maskTransform = curRaster.transform * Affine.scale(curRaster.width / float(outCols), curRaster.height / float(outRows))
+    return([mask, maskTransform, crs, level])
+
+def polygonizeMask(mask, maskTransform, crs, simplify=1.5):
+    ''' Outline the valid pixels of a mask in WGS84
+
+    Parameters:
+        mask (numpy array): dataset mask, 0 is nodata
+        maskTransform (affine): transform of the mask
+        crs (string): coordinate system of the mask
+        simplify (float): simplification tolerance, in mask pixels
+
+    RETURNS
+    [shapely geometry] - valid data footprint, None if there is no valid data
+    '''
+    valid = (mask > 0).astype('uint8')
+    parts = [shapely.geometry.shape(geom) for geom, value in features.shapes(valid, mask=valid, transform=maskTransform)]
+    if len(parts) == 0:
+        return(None)
+    footprint = shapely.union_all(parts)
+    footprint = footprint.simplify(simplify * abs(maskTransform.a), preserve_topology=True)
+    transformer = rasterHeaders.getTransformer(crs)
+    def toWGS84(coords):
+        lon, lat = transformer.transform(coords[:, 0], coords[:, 1])
+        return(np.column_stack([lon, lat]))
+    footprint = shapely.transform(footprint, toWGS84)
+    if not footprint.is_valid:
+        footprint = shapely.make_valid(footprint)
+    return(footprint)
+
+def readValidFootprint(inFile, maxSize=MAX_MASK_SIZE, simplify=1.5, decimateWithoutOverviews=False):
+    ''' Valid data footprint of a single raster; see readMask and polygonizeMask
+
+    RETURNS
+    [list] - [WGS84 footprint (None if it could not be read), seconds taken, overview level read,
+        True if the raster was not outlined because it has no overviews]
+    '''
+    start = time.time()
+    footprint = None
+    level = None
+    withoutOverviews = False
+    try:
+        masked = readMask(inFile, maxSize, decimateWithoutOverviews)
+        if masked is not None:
+            mask, maskTransform, crs, level = masked
+            if mask is None:
+                withoutOverviews = True
+            else:
+                footprint = polygonizeMask(mask, maskTransform, crs, simplify)
+    except Exception as e:
+        logging.warning("Could not read valid data footprint of %s: %s" % (inFile, e))
+    return([footprint, time.time() - start, level, withoutOverviews])
+
+def scanValidFootprints(allImages, workers=4, maxSize=MAX_MASK_SIZE, simplify=1.5, decimateWithoutOverviews=False):
+    ''' Valid data footprints of a list of rasters, read in parallel; the time taken by every tile is logged
+
+    Parameters:
+        allImages (list of strings): rasters to outline
+        workers (int): number of tiles read at once; capped at rasterHeaders.MAX_SCAN_WORKERS
+        maxSize, simplify, decimateWithoutOverviews: see readValidFootprint
+
+    RETURNS
+    [list] - WGS84 footprint of every input, in the same order as allImages; None where no footprint
+        could be read (no CRS, no overviews, or no valid data), in which case callers keep the bounding box
+    '''
+    workers = max(1, min(int(workers), rasterHeaders.MAX_SCAN_WORKERS, len(allImages)))
+    #Every raster is opened twice, for its overviews and for its mask
+    runMetrics.countIO(opened=2 * len(allImages))
+    readOne = lambda inFile: readValidFootprint(inFile, maxSize, simplify, decimateWithoutOverviews)
+    if workers == 1:
+        results = [readOne(x) for x in allImages]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(readOne, allImages))
+    for inFile, (footprint, seconds, level, withoutOverviews) in zip(allImages, results):
+        logging.info("Valid data footprint %s: %.2fs, overview %s%s" % (inFile, seconds, level,
+                     "" if footprint is not None else ", bounding box kept (no overviews)" if withoutOverviews else ", bounding box kept"))
+    if len(results) > 0:
+        seconds = [x[1] for x in results]
+        outlined = sum(1 for x in results if x[0] is not None)
+        withoutOverviews = sum(1 for x in results if x[3])
+        logging.info("Valid data footprints: %s tiles, %s outlined, %s kept their bounding box (%s without overviews), "
+                     "%.2fs mean, %.2fs max per tile" % (len(results), outlined, len(results) - outlined, withoutOverviews,
+                     np.mean(seconds), np.max(seconds)))
+        if withoutOverviews > 0:
+            logging.warning("Valid data footprints: %s of %s tiles have no overviews and kept their bounding box; "
+                            "set decimateWithoutOverviews to outline them from the full resolution data" % (withoutOverviews, len(results)))
+    return([x[0] for x in results])
@@ -0,0 +1,441 @@
+###############################################################################
+# Vendor Metadata
+# Purpose: a registry of parsers for the metadata delivered with imagery
+#   (Maxar XML/IMD, Airbus and SPOT DIMAP, Blacksky, SIIS). Sidecar files are
+#   streamed (iterparse for XML, line by line for IMD) and only the fields we
+#   catalogue are kept: id, acquisition time, cloud cover, off nadir and sun
+#   angles, resolution, band count and footprint. Parsed files are cached for
+#   the session, keyed on their size and modification time
+###############################################################################
+
+import os, re, json, glob, fnmatch, logging, geohash
+
+import xml.etree.ElementTree as ET
+
+from datetime import datetime
+from functools import lru_cache
+from shapely.geometry import Polygon
+
+try:
+    from . import runMetrics
+except ImportError:
+    import runMetrics
+
+# Fields read from every sidecar; missing fields are None
+recordFields = ['id', 'datetime', 'Date', 'cloudCover', 'offNadir', 'sunAzimuth', 'sunElevation',
+                'Res', 'Bands', 'columns', 'rows', 'footprint']
+numericFields = ['cloudCover', 'offNadir', 'sunAzimuth', 'sunElevation', 'Res']
+integerFields = ['Bands', 'columns', 'rows']
+cornerFields = ['ULLON', 'ULLAT', 'URLON', 'URLAT', 'LRLON', 'LRLAT', 'LLLON', 'LLLAT']
+
+def localName(tag):
+    ''' Element name without its namespace '''
+    return(tag.rsplit('}', 1)[-1])
+
+def xmlElements(xmlFile):
+    ''' Stream the elements of an XML file
+
+    RETURNS
+    [generator] - (path, text) of every element as it closes; path is the '/' separated element names
+        from the root, i.e. - isd/IMD/IMAGE/CATID
+    '''
+    path = []
+    for event, elem in ET.iterparse(xmlFile, events=('start', 'end')):
+        if event == 'start':
+            path.append(localName(elem.tag))
+            continue
+        yield(["/".join(path), (elem.text or '').strip()])
+        path.pop()
+        elem.clear()
+
+def imdElements(imdFile):
+    ''' Stream the key = value; lines of a Maxar IMD (or TIL) file, in the same form as xmlElements
+
+    RETURNS
+    [generator] - (path, value) of every key; BEGIN_GROUP / END_GROUP blocks are path components
+    '''
+    path = []
+    with open(imdFile, 'r') as inF:
+        for line in inF:
+            if not "=" in line:
+                continue
+            key, value = [x.strip() for x in line.split("=", 1)]
+            value = value.rstrip(";").strip().strip('"')
+            if key == "BEGIN_GROUP":
+                path.append(value)
+            elif key == "END_GROUP":
+                if path:
+                    path.pop()
+            else:
+                yield(["/".join(path + [key]), value])
+
+def matches(path, pattern):
+    ''' Case insensitive match of the end of an element path against a pattern, i.e. - IMAGE*/CATID '''
+    return(fnmatch.fnmatchcase(path, pattern) or fnmatch.fnmatchcase(path, "*/" + pattern))
+
+def collectFields(elements, single, repeated=None):
+    ''' Keep the text of the elements we need, stopping as soon as every field is found
+
+    Parameters:
+        elements (generator): (path, text) pairs, see xmlElements and imdElements
+        single (dictionary): field name: list of path patterns, in order of preference; the first match is kept
+        repeated (dictionary) (optional): field name: list of path patterns; every match is kept
+
+    RETURNS
+    [dictionary] - text of every single field found, list of texts for every repeated field
+    '''
+    single = dict((k, [p.lower() for p in v]) for k, v in single.items())
+    repeated = dict((k, [p.lower() for p in v]) for k, v in (repeated or {}).items())
+    found = {}
+    rank = {}
+    lists = dict((k, []) for k in repeated)
+    for path, text in elements:
+        path = path.lower()
+        for field, patterns in single.items():
+            if rank.get(field) == 0:
+                continue
+            for idx, pattern in enumerate(patterns):
+                if idx < rank.get(field, len(patterns)) and matches(path, pattern):
+                    found[field] = text
+                    rank[field] = idx
+                    break
+        for field, patterns in repeated.items():
+            if any(matches(path, pattern) for pattern in patterns):
+                lists[field].append(text)
+        #Only the repeated fields need the whole file
+        if len(repeated) == 0 and len(rank) == len(single) and all(x == 0 for x in rank.values()):
+            break
+    found.update(lists)
+    return(found)
+
+def toDate(value):
+    ''' RETURNS [string] - YYYYMMDD from an ISO date or time, None if it cannot be read '''
+    digits = re.sub("[^0-9]", "", str(value or ''))
+    if len(digits) >= 8:
+        return(digits[:8])
+    return(None)
+
+def cornerPolygon(values):
+    ''' Polygon from UL, UR, LR, LL longitude and latitude values (cornerFields order) '''
+    try:
+        c = [float(x) for x in values]
+    except (TypeError, ValueError):
+        return(None)
+    return(Polygon([(c[0], c[1]), (c[2], c[3]), (c[4], c[5]), (c[6], c[7])]))
+
+def vertexPolygon(lons, lats):
+    ''' Polygon from lists of vertex longitudes and latitudes '''
+    try:
+        coords = [(float(x), float(y)) for x, y in zip(lons, lats)]
+    except (TypeError, ValueError):
+        return(None)
+    if len(coords) < 3:
+        return(None)
+    return(Polygon(coords))
+
+def buildRecord(raw):
+    ''' Convert collected text fields to a metadata record with recordFields '''
+    record = dict((f, raw.get(f)) for f in recordFields)
+    for f in numericFields:
+        try:
+            record[f] = float(record[f])
+        except (TypeError, ValueError):
+            record[f] = None
+    for f in integerFields:
+        try:
+            record[f] = int(float(record[f]))
+        except (TypeError, ValueError):
+            record[f] = None
+    record['Date'] = toDate(record['datetime'])
+    return(record)
+
+@lru_cache(maxsize=1024)
+def folderSidecars(folder, pattern):
+    ''' Sidecars matching a pattern in a folder; listed once per folder for the session '''
+    return(sorted(glob.glob(os.path.join(folder, pattern))))
+
+class metadataParser(object):
+    def __init__(self, vendor, readFile, sidecarExtensions, folderPatterns=(), sniff=None, dateFromName=None):
+        ''' How to find, read and interpret the metadata of one vendor
+
+        Parameters:
+            vendor (string): vendor name, as returned by identifyVendor
+            readFile (function): sidecar file -> record (see buildRecord); may add a 'tiles' dictionary of
+                tile file name: footprint when the sidecar describes several tiles
+            sidecarExtensions (list of strings): extensions of a sidecar with the same name as the raster
+            folderPatterns (list of strings) (optional): glob patterns of sidecars describing every raster in a folder
+            sniff (function) (optional): file name -> True if the file identifies a delivery from this vendor
+            dateFromName (function) (optional): file name -> YYYYMMDD, for rasters without a sidecar date
+        '''
+        self.vendor = vendor
+        self.readFile = readFile
+        self.sidecarExtensions = sidecarExtensions
+        self.folderPatterns = folderPatterns
+        self.sniff = sniff
+        self.dateFromName = dateFromName
+
+    def findSidecar(self, rasterFile, inventory=None):
+        ''' Find the sidecar of a raster, in the folder inventory if one is given, otherwise on disk
+
+        RETURNS
+        [list] - [sidecar path, True if it describes only this raster], [None, False] if there is none
+        '''
+        exists = os.path.exists if inventory is None else inventory.contains
+        stem = os.path.splitext(rasterFile)[0]
+        for ext in self.sidecarExtensions:
+            for candidate in [stem + ext, stem + ext.lower()]:
+                if exists(candidate):
+                    return([candidate, True])
+        for pattern in self.folderPatterns:
+            if inventory is None:
+                found = folderSidecars(os.path.dirname(rasterFile), pattern)
+            else:
+                found = inventory.match(os.path.dirname(rasterFile), pattern)
+            if len(found) > 0:
+                return([found[0], False])
+        return([None, False])
+
+# Ordered registry of vendor parsers; identifyVendor tries them in this order
+vendorParsers = {}
+
+def registerParser(parser):
+    vendorParsers[parser.vendor] = parser
+    return(parser)
+
+def getParser(vendor):
+    return(vendorParsers.get(vendor))
+
+@lru_cache(maxsize=4096)
+def _readCached(vendor, sidecar, size, mtime):
+    runMetrics.countIO(read=size, opened=1)
+    return(vendorParsers[vendor].readFile(sidecar))
+
+def readVendorMetadata(vendor, sidecar, fileKey=None):
+    ''' Parse a sidecar with the parser of a vendor; repeated reads of an unchanged file come from the cache
+
+    Parameters:
+        fileKey (tuple) (optional): (size, modification time in nanoseconds) of the sidecar if already known,
+            i.e. - from folderInventory.fileKey
+
+    RETURNS
+    [dictionary] - record with recordFields (shared with the cache, do not modify)
+    '''
+    if fileKey is None:
+        fileStat = os.stat(sidecar)
+        fileKey = (fileStat.st_size, fileStat.st_mtime_ns)
+    return(_readCached(vendor, sidecar, fileKey[0], fileKey[1]))
+
+def rasterMetadata(rasterFile, vendor, inventory=None):
+    ''' Vendor metadata of a single raster from its sidecar; sidecars are looked up in the folderInventory if given
+
+    RETURNS
+    [list] - [record, True if the footprint in the record is the footprint of this raster], [None, False]
+        if the vendor has no parser, the raster has no sidecar or the sidecar cannot be read
+    '''
+    parser = getParser(vendor)
+    if parser is None:
+        return([None, False])
+    sidecar, ownSidecar = parser.findSidecar(rasterFile, inventory)
+    if sidecar is None:
+        return([None, False])
+    try:
+        record = readVendorMetadata(vendor, sidecar, None if inventory is None else inventory.fileKey(sidecar))
+    except Exception as e:
+        logging.warning("Could not read %s metadata %s: %s" % (vendor, sidecar, e))
+        return([None, False])
+    tileFootprint = record.get('tiles', {}).get(os.path.basename(rasterFile).upper())
+    if tileFootprint is not None:
+        #The dimensions in the sidecar are those of the whole product
+        record = dict(record, footprint=tileFootprint, columns=None, rows=None)
+        return([record, True])
+    return([record, ownSidecar])
+
+def identifyVendor(fileNames):
+    ''' Vendor of a delivery from the names of the files in its folder
+
+    RETURNS
+    [string] - vendor name, None if no parser recognises the files
+    '''
+    if "gbdx_clip_log.txt" in fileNames:
+        return("gbdx_clip")
+    for f in fileNames:
+        for parser in vendorParsers.values():
+            if parser.sniff is not None and parser.sniff(f):
+                return(parser.vendor)
+    return(None)
+
+def imageDate(rasterFile, vendor, inventory=None):
+    ''' Acquisition date of a raster, from its sidecar or else from its file name
+
+    RETURNS
+    [string] - YYYYMMDD, "YYYYMMDD" if it cannot be determined
+    '''
+    record, ownFootprint = rasterMetadata(rasterFile, vendor, inventory)
+    if record is not None and record['Date'] is not None:
+        return(record['Date'])
+    parser = getParser(vendor)
+    if parser is not None and parser.dateFromName is not None:
+        try:
+            cDate = parser.dateFromName(os.path.basename(rasterFile))
+            if cDate is not None:
+                return(cDate)
+        except Exception:
+            logging.warning("Could not determine date for %s" % rasterFile)
+    return("YYYYMMDD")
+
+def sidecarHeaders(allImages, vendor, inventory=None):
+    ''' Tile metadata, in the form of rasterHeaders.projectHeaders, for the rasters with a sidecar of their own
+        (i.e. - a per scene XML) giving their footprint, resolution, band count and dimensions; these rasters
+        do not need to be opened. Sidecars describing a whole folder or product, including the TIL tiles
+        of a Maxar product which do not give the tile dimensions, are never used in place of the raster header
+
+    RETURNS
+    [list] - header for every input, None where the raster has to be read; nativeRes and crs are None, as
+        the native coordinate system is not known and the sidecar resolution is in meters
+    '''
+    headers = []
+    for rasterFile in allImages:
+        record, ownFootprint = rasterMetadata(rasterFile, vendor, inventory)
+        if (record is None or not ownFootprint or
+                any(record[f] is None for f in ['footprint', 'Res', 'Bands', 'columns', 'rows'])):
+            headers.append(None)
+            continue
+        centroid = record['footprint'].centroid
+        headers.append({'Bands':record['Bands'], 'Res':round(record['Res'], 3), 'geometry':record['footprint'],
+                        'geohash':geohash.encode(centroid.y, centroid.x), 'columns':record['columns'],
+                        'rows':record['rows'], 'nativeRes':None, 'crs':None})
+    return(headers)
+
+### Maxar: product XML (isd) or IMD, with per tile footprints from the TIL section
+maxarFields = {
+    'id':['IMAGE*/CATID'],
+    'datetime':['IMAGE*/FIRSTLINETIME', 'IMAGE*/TLCTIME'],
+    'cloudCover':['IMAGE*/CLOUDCOVER'],
+    'offNadir':['IMAGE*/MEANOFFNADIRVIEWANGLE', 'IMAGE*/OFFNADIRVIEWANGLE'],
+    'sunAzimuth':['IMAGE*/MEANSUNAZ', 'IMAGE*/SUNAZ'],
+    'sunElevation':['IMAGE*/MEANSUNEL', 'IMAGE*/SUNEL'],
+    #The collected GSD is not the pixel size of the product, so it is never used as the resolution
+    'Res':['MAP_PROJECTED_PRODUCT/PRODUCTGSD', 'PRODUCTGSD', 'IMAGE*/MEANPRODUCTGSD'],
+    'columns':['NUMCOLUMNS'],
+    'rows':['NUMROWS'],
+}
+for corner in cornerFields:
+    maxarFields[corner] = ['BAND_*/%s' % corner]
+maxarTiles = {'tileFile':['TILE*/FILENAME']}
+for corner in cornerFields:
+    maxarTiles['tile' + corner] = ['TILE*/%s' % corner]
+maxarTiles['bandCorners'] = ['BAND_*/ULLON']
+
+def readMaxar(sidecar):
+    elements = imdElements(sidecar) if sidecar.upper().endswith(".IMD") else xmlElements(sidecar)
+    raw = collectFields(elements, maxarFields, maxarTiles)
+    record = buildRecord(raw)
+    record['Bands'] = len(raw['bandCorners']) if len(raw['bandCorners']) > 0 else None
+    record['footprint'] = cornerPolygon([raw.get(c) for c in cornerFields])
+    tiles = {}
+    for idx, tileFile in enumerate(raw['tileFile']):
+        footprint = cornerPolygon([(raw['tile' + c][idx:idx + 1] or [None])[0] for c in cornerFields])
+        if footprint is not None:
+            tiles[os.path.basename(tileFile).upper()] = footprint
+    record['tiles'] = tiles
+    return(record)
+
+def maxarDate(fileName):
+    ''' i.e. - 16JUN11081936-M2AS-... '''
+    return(datetime.strptime("20%s" % fileName[:7], "%Y%b%d").strftime("%Y%m%d"))
+
+registerParser(metadataParser("MAXAR", readMaxar, ['.XML', '.IMD'], ['*.XML', '*.IMD'],
+                              sniff=lambda f: f[-10:] == "BROWSE.JPG", dateFromName=maxarDate))
+registerParser(metadataParser("gbdx_clip", readMaxar, ['.XML', '.IMD'], ['*.XML']))
+
+### Airbus (Pleiades) and SPOT: DIMAP v2, and DIMAP v1 for older SPOT products
+dimapFields = {
+    'id':['Dataset_Identification/DATASET_NAME', 'Source_Identification/SOURCE_ID', 'DATASET_NAME'],
+    'date':['IMAGING_DATE'],
+    'time':['IMAGING_TIME'],
+    'cloudCover':['CLOUD_COVERAGE', 'CLOUD_COVER'],
+    'offNadir':['Acquisition_Angles/VIEWING_ANGLE', 'Acquisition_Angles/INCIDENCE_ANGLE', 'VIEWING_ANGLE', 'INCIDENCE_ANGLE'],
+    'sunAzimuth':['SUN_AZIMUTH'],
+    'sunElevation':['SUN_ELEVATION'],
+    'Res':['RESAMPLING_SPACING'],
+    'columns':['Raster_Dimensions/NCOLS'],
+    'rows':['Raster_Dimensions/NROWS'],
+    'Bands':['Raster_Dimensions/NBANDS'],
+}
+dimapVertices = {
+    'lon':['Dataset_Extent/Vertex/LON', 'Dataset_Frame/Vertex/FRAME_LON'],
+    'lat':['Dataset_Extent/Vertex/LAT', 'Dataset_Frame/Vertex/FRAME_LAT'],
+}
+
+def readDIMAP(sidecar):
+    raw = collectFields(xmlElements(sidecar), dimapFields, dimapVertices)
+    raw['datetime'] = "%sT%s" % (raw.get('date', ''), raw.get('time', '')) if raw.get('date') else None
+    record = buildRecord(raw)
+    record['footprint'] = vertexPolygon(raw['lon'], raw['lat'])
+    return(record)
+
+registerParser(metadataParser("Airbus", readDIMAP, [], ['DIM_*.XML'],
+                              sniff=lambda f: ("PHR1A" in f) or ("PHR1B" in f),
+                              dateFromName=lambda f: f.split("_")[3][:8]))
+
+### SIIS (KOMPSAT): per scene auxiliary XML
+siisFields = {
+    'id':['SceneID', 'Scene_ID', 'ImageID'],
+    'datetime':['ImagingCenterTime/UTC', 'ImagingStartTime/UTC', 'ImagingTime/UTC', 'SceneCenterTime'],
+    'cloudCover':['CloudCover/Average', 'CloudCover', 'Cloud_Cover'],
+    'offNadir':['Angle/Incidence', 'IncidenceAngle', 'Incidence_Angle', 'OffNadirAngle'],
+    'sunAzimuth':['SunAngle/Azimuth', 'SunAzimuth', 'Sun_Azimuth'],
+    'sunElevation':['SunAngle/Elevation', 'SunElevation', 'Sun_Elevation'],
+    'Res':['GroundSampleDistance', 'GSD', 'ResolutionMeter'],
+    'columns':['ImageSize/Width', 'NumColumns'],
+    'rows':['ImageSize/Height', 'NumRows'],
+    'Bands':['NumBands', 'BandCount'],
+}
+siisVertices = {
+    'lon':['ImagingCoordinates/*/Longitude', 'Corner*/Longitude'],
+    'lat':['ImagingCoordinates/*/Latitude', 'Corner*/Latitude'],
+}
+
+def readSIIS(sidecar):
+    raw = collectFields(xmlElements(sidecar), siisFields, siisVertices)
+    record = buildRecord(raw)
+    record['footprint'] = vertexPolygon(raw['lon'], raw['lat'])
+    return(record)
+
+registerParser(metadataParser("SIIS", readSIIS, ['_Aux.xml', '.xml'], ['*_Aux.xml'],
+                              sniff=lambda f: f[:2] == "K5", dateFromName=lambda f: f.split("_")[1][:8]))
+
+registerParser(metadataParser("SPOT", readDIMAP, [], ['DIM_*.XML', 'METADATA.DIM'],
+                              sniff=lambda f: "SPOT" in f, dateFromName=lambda f: f.split("_")[3][:8]))
+
+### Blacksky: per image JSON; small enough to read whole
+blackskyKeys = {
+    'id':['id', 'imageId'],
+    'datetime':['acquisitionDate', 'acquired', 'datetime'],
+    'cloudCover':['cloudCoverPercent', 'cloudCover'],
+    'offNadir':['offNadirAngle', 'offNadir'],
+    'sunAzimuth':['sunAzimuth'],
+    'sunElevation':['sunElevation'],
+    'Res':['gsd'],
+    'Bands':['bandCount', 'numBands'],
+}
+
+def readBlacksky(sidecar):
+    with open(sidecar) as inJ:
+        meta = json.load(inJ)
+    props = meta.get('properties', meta)
+    raw = {}
+    for field, keys in blackskyKeys.items():
+        for key in keys:
+            if props.get(key) is not None:
+                raw[field] = props[key]
+                break
+    record = buildRecord(raw)
+    geometry = meta.get('geometry')
+    if geometry and geometry.get('type') == 'Polygon':
+        ring = geometry['coordinates'][0]
+        record['footprint'] = vertexPolygon([x[0] for x in ring], [x[1] for x in ring])
+    return(record)
+
+registerParser(metadataParser("Blacksky", readBlacksky, ['_metadata.json', '.json'], [],
+                              sniff=lambda f: f[:3] == "BSG", dateFromName=lambda f: f.split("-")[2][:8]))
@@ -0,0 +1,4 @@
+import os, sys
+
+# The package lives in src/, as in benchmarks/runBenchmarks.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
@@ -0,0 +1,85 @@
+import os, struct, threading
+
+from ImageryObjects import catalogIndex
+
+def writeDBF(outFile, fields, records, deleted=()):
+    ''' Write a dBase III table; fields are [name, type (C or N), length], records lists of values '''
+    recordLength = 1 + sum(f[2] for f in fields)
+    headerLength = 32 + 32 * len(fields) + 1
+    with open(outFile, 'wb') as out:
+        out.write(struct.pack('<B3BIHH20x', 3, 124, 1, 1, len(records), headerLength, recordLength))
+        for name, fieldType, length in fields:
+            out.write(struct.pack('<11sc4xBB14x', name.encode('ascii'), fieldType.encode('ascii'), length, 0))
+        out.write(b'\r')
+        for idx, record in enumerate(records):
+            out.write(b'*' if idx in deleted else b' ')
+            for (name, fieldType, length), value in zip(fields, record):
+                text = str(value)
+                out.write((text.rjust(length) if fieldType == 'N' else text.ljust(length)).encode('latin-1'))
+        out.write(b'\x1a')
+
+catalogFields = [['SourceOID', 'N', 10], ['Path', 'C', 80], ['Res', 'N', 8]]
+
+def test_readDBF(tmp_path):
+    dbf = str(tmp_path / "S_WV02_catalog.dbf")
+    writeDBF(dbf, catalogFields, [[1, "//server/Source/WV02/a/tile_1.TIF", "0.5"],
+                                  [2, "//server/Source/WV02/a/tile_2.TIF", "0.5"],
+                                  [3, "//server/Source/WV02/b/tile_3.TIF", ""]], deleted=[1])
+    assert catalogIndex.readDBF(dbf) == [[1, "//server/Source/WV02/a/tile_1.TIF"], [3, "//server/Source/WV02/b/tile_3.TIF"]]
+    assert catalogIndex.readDBF(dbf, ["res", "SOURCEOID"]) == [[0.5, 1], ['', 3]]
+
+def test_readCSV(tmp_path):
+    csvFile = tmp_path / "S_RGB_catalog.csv"
+    csvFile.write_text("SourceOID,Path,Extra\n7,//server/Source/RGB/x.tif,a\n8,//server/Source/RGB/9.tif,b\n")
+    assert catalogIndex.readCSV(str(csvFile)) == [[7, "//server/Source/RGB/x.tif"], [8, "//server/Source/RGB/9.tif"]]
+
+class countingBackend(catalogIndex.localCatalogBackend):
+    ''' Local backend that counts the catalogs it reads '''
+    def __init__(self):
+        self.reads = 0
+        self.lock = threading.Lock()
+
+    def readCatalog(self, catalogTable):
+        with self.lock:
+            self.reads += 1
+        return(catalogIndex.localCatalogBackend.readCatalog(self, catalogTable))
+
+def test_loadCatalog_once_under_concurrent_calls(tmp_path):
+    dbf = str(tmp_path / "S_WV02_catalog.dbf")
+    writeDBF(dbf, catalogFields, [[x, "//server/Source/WV02/tile_%s.TIF" % x, "0.5"] for x in range(1, 501)])
+    backend = countingBackend()
+    index = catalogIndex.catalogIndex(backend)
+    start = threading.Barrier(8)
+    results = []
+    def load():
+        start.wait()
+        results.append(index.loadCatalog("S_WV02", "//gdb/S_WV02", dbf))
+    threads = [threading.Thread(target=load) for x in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [True] * 8
+    assert backend.reads == 1
+    assert len(index.catalogs["S_WV02"]) == 500
+
+def test_loadCatalog_without_catalog(tmp_path):
+    index = catalogIndex.catalogIndex(catalogIndex.localCatalogBackend())
+    missing = str(tmp_path / "missing.dbf")
+    assert index.loadCatalog("S_WV03", "//gdb/S_WV03", missing) is False
+    assert index.findFiles(["tile_1.TIF"], ["S_WV03"]) == {}
+    assert not os.path.exists(missing)
+
+def test_findFiles(tmp_path):
+    index = catalogIndex.catalogIndex(catalogIndex.localCatalogBackend())
+    wv02 = tmp_path / "S_WV02_catalog.csv"
+    wv02.write_text("SourceOID,Path\n1,//server/Source/WV02/a/tile_1.TIF\n2,//server/Source/WV02/a/tile_2.TIF\n")
+    rgb = tmp_path / "S_RGB_catalog.csv"
+    rgb.write_text("SourceOID,Path\n11,//server/Source/RGB/tile_2.TIF\n12,//server/Source/RGB/other.TIF\n")
+    assert index.loadCatalog("S_WV02", "//gdb/S_WV02", str(wv02))
+    assert index.loadCatalog("S_RGB", "//gdb/S_RGB", str(rgb), mosaic=True)
+    found = index.findFiles(["tile_1.TIF", "tile_2.TIF", "tile_3.TIF"], ["S_WV02", "S_RGB"])
+    #A file in more than one service is returned for the later service
+    assert found == {"tile_1.TIF":[1, "S_WV02"], "tile_2.TIF":[11, "S_RGB"]}
+    assert index.findFiles(["tile_2.TIF"], ["S_RGB", "S_WV02"]) == {"tile_2.TIF":[2, "S_WV02"]}
+    assert index.findFiles(["tile_1.TIF"], ["S_NOT_LOADED"]) == {}
@@ -0,0 +1,50 @@
+import json, os, sqlite3
+
+import geopandas as gpd
+from shapely.geometry import box
+
+from ImageryObjects import catalogQuery, geoParquet
+
+def writeDelivery(folder, name, extent=(30, 10, 31, 11)):
+    jsonFile = os.path.join(folder, "%s.json" % name)
+    with open(jsonFile, 'w') as out:
+        json.dump({"iso3":"KEN", "location":"%s.zip" % name, "resolution":"0.5", "nBands":"4", "vendor":"MAXAR",
+                   "capture_date":"20160611", "ImageExtent":box(*extent).wkt}, out)
+    return(jsonFile)
+
+def writeTiles(jsonFile, nTiles):
+    tiles = gpd.GeoDataFrame({'file':["tile_%s.TIF" % x for x in range(nTiles)], 'Res':[0.5] * nTiles,
+                              'Bands':[4] * nTiles, 'Date':["20160611"] * nTiles, 'geohash':["s00000000"] * nTiles},
+                             geometry=[box(30 + x * 0.1, 10, 30.1 + x * 0.1, 10.1) for x in range(nTiles)], crs='epsg:4326')
+    geoParquet.writeFootprints(tiles, catalogQuery.tilesFile(jsonFile))
+
+def test_tiles_written_after_the_json_are_indexed(tmp_path):
+    folder = str(tmp_path)
+    jsonFile = writeDelivery(folder, "KEN_a")
+    catalog = catalogQuery.imageryCatalog(str(tmp_path / "index.sqlite"))
+    assert catalog.update(folder)['added'] == 1
+    assert len(catalog.query(level='tiles')) == 0
+    writeTiles(jsonFile, 3)
+    assert catalog.update(folder) == {'added':0, 'updated':1, 'removed':0, 'unchanged':0}
+    assert len(catalog.query(level='tiles')) == 3
+    writeTiles(jsonFile, 5)
+    assert catalog.update(folder)['updated'] == 1
+    assert len(catalog.query(level='tiles', aoi=box(30, 10, 31, 11))) == 5
+    assert catalog.update(folder)['unchanged'] == 1
+    os.remove(catalogQuery.tilesFile(jsonFile))
+    assert catalog.update(folder)['updated'] == 1
+    assert len(catalog.query(level='tiles')) == 0
+    catalog.close()
+
+def test_index_without_tiles_key_is_read_again(tmp_path):
+    folder = str(tmp_path)
+    writeTiles(writeDelivery(folder, "KEN_b"), 2)
+    indexFile = str(tmp_path / "index.sqlite")
+    old = sqlite3.connect(indexFile)
+    old.execute("CREATE TABLE sources (jsonFile TEXT PRIMARY KEY, size INTEGER, mtime INTEGER)")
+    old.commit()
+    old.close()
+    catalog = catalogQuery.imageryCatalog(indexFile)
+    assert catalog.update(folder)['added'] == 1
+    assert len(catalog.query(level='tiles')) == 2
+    catalog.close()
@@ -0,0 +1,41 @@
+import os, zipfile
+
+import pytest
+
+from ImageryObjects import imageryPackaging
+
+def makeFiles(folder):
+    files = {"tile_1.TIF.aux.xml":b"<PAMDataset>" * 5000, "BROWSE.JPG":b"\xff\xd8" + os.urandom(5000),
+             "notes.txt":b"", "big.dat":bytes(range(256)) * 100000}
+    paths = []
+    for name, data in sorted(files.items()):
+        path = os.path.join(folder, name)
+        with open(path, 'wb') as out:
+            out.write(data)
+        paths.append(path)
+    return(paths)
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_packageFiles(tmp_path, workers, monkeypatch):
+    #Spool the larger members to disk
+    monkeypatch.setattr(imageryPackaging, "SPOOL_SIZE", 1024)
+    paths = makeFiles(str(tmp_path))
+    zipFile = str(tmp_path / "out.zip")
+    metrics = imageryPackaging.packageFiles(paths, zipFile, workers)
+    assert [metrics['members'], metrics['stored'], metrics['deflated']] == [4, 1, 3]
+    with zipfile.ZipFile(zipFile) as zf:
+        assert zf.testzip() is None
+        for path in paths:
+            info = zf.getinfo(zipfile.ZipInfo.from_file(path).filename)
+            expected = zipfile.ZIP_STORED if path.endswith(".JPG") else zipfile.ZIP_DEFLATED
+            assert info.compress_type == expected
+            with open(path, 'rb') as src:
+                assert zf.read(info) == src.read()
+    assert not os.path.exists(zipFile + ".partial")
+
+def test_failed_packaging_leaves_no_zipfile(tmp_path):
+    paths = makeFiles(str(tmp_path)) + [str(tmp_path / "missing.txt")]
+    zipFile = str(tmp_path / "out.zip")
+    with pytest.raises((IOError, OSError)):
+        imageryPackaging.packageFiles(paths, zipFile, 2)
+    assert not os.path.exists(zipFile) and not os.path.exists(zipFile + ".partial")
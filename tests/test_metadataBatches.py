@@ -0,0 +1,38 @@
+from shapely.geometry import box, Point
+
+from ImageryObjects import metadataBatches
+
+def makeBatch(start, footprints):
+    n = len(footprints)
+    return(metadataBatches.metadataBatch([4] * n, [0.5] * n, footprints, ["s00000000"] * n, [64] * n,
+                                         [None] * n, ["20200101"] * n, ["tile_%s.TIF" % (start + x) for x in range(n)]))
+
+def test_batchSpool_reads_batches_again():
+    spool = metadataBatches.batchSpool()
+    spool.add(makeBatch(0, [box(0, 0, 1, 1), box(1, 0, 2, 1)]))
+    #Mixed geometry types are kept as WKB
+    spool.add(makeBatch(2, [box(2, 0, 3, 1), Point(5, 5)]))
+    assert len(spool) == 2
+    for x in range(2):
+        batches = list(spool)
+        assert [list(b.file) for b in batches] == [["tile_0.TIF", "tile_1.TIF"], ["tile_2.TIF", "tile_3.TIF"]]
+        assert batches[1].geometries()[1].equals(Point(5, 5))
+        assert list(batches[0].rows) == [-1, -1]
+    spool.close()
+
+def test_batchSpool_interleaved_readers():
+    spool = metadataBatches.batchSpool()
+    for x in range(3):
+        spool.add(makeBatch(x, [box(x, 0, x + 1, 1)]))
+    first, second = iter(spool), iter(spool)
+    assert next(first).file[0] == "tile_0.TIF"
+    assert [b.file[0] for b in second] == ["tile_0.TIF", "tile_1.TIF", "tile_2.TIF"]
+    assert [b.file[0] for b in first] == ["tile_1.TIF", "tile_2.TIF"]
+
+def test_summarizeBatches_from_spool():
+    spool = metadataBatches.batchSpool()
+    spool.add(makeBatch(0, [box(0, 0, 1, 1)]))
+    spool.add(makeBatch(1, [box(1, 0, 2, 1)]))
+    summary = metadataBatches.summarizeBatches(spool)
+    assert summary['tiles'] == 2
+    assert summary['union'].equals(box(0, 0, 2, 1))
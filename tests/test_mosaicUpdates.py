@@ -0,0 +1,109 @@
+from ImageryObjects import mosaicUpdates
+
+def makeQueue(items=None, backend=None, **kwargs):
+    backend = backend or mosaicUpdates.localMosaicBackend()
+    for service, oids in (items or {}).items():
+        backend.addItems(service, oids)
+    return([mosaicUpdates.mosaicUpdateQueue(backend, **kwargs), backend])
+
+def test_last_value_wins():
+    queue, backend = makeQueue({'S_RGB':range(1, 6)})
+    queue.setField('S_RGB', 'SensorName', 'WV02', [1, 2, 3])
+    queue.setField('S_RGB', 'SensorName', 'GE01', [2])
+    queue.setField('S_RGB', 'SensorName', 'WV03', [3])
+    queue.apply()
+    assert [backend.fieldValue('S_RGB', x, 'SensorName') for x in range(1, 6)] == ['WV02', 'GE01', 'WV03', None, None]
+    assert backend.calls == {'calculateField':3}
+
+def test_value_for_every_item_replaces_earlier_item_values():
+    queue, backend = makeQueue({'S_WV02':range(1, 4)})
+    queue.setField('S_WV02', 'SensorName', 'old', [1])
+    queue.setField('S_WV02', 'SensorName', 'WorldView 2')
+    queue.setField('S_WV02', 'SensorName', 'other', [3])
+    assert [x[3:] for x in queue.pending()] == [['WorldView 2', None], ['other', [3]]]
+    queue.apply()
+    assert [backend.fieldValue('S_WV02', x, 'SensorName') for x in range(1, 4)] == ['WorldView 2', 'WorldView 2', 'other']
+
+def test_batches_split_at_max_where_items():
+    nItems = 2 * mosaicUpdates.MAX_WHERE_ITEMS + 1
+    queue, backend = makeQueue({'S_RGB':range(1, nItems + 1)})
+    for oid in range(1, nItems + 1):
+        queue.setField('S_RGB', 'SensorName', 'WV02', [oid])
+    sizes = [len(x[4]) for x in queue.pending()]
+    assert sizes == [mosaicUpdates.MAX_WHERE_ITEMS, mosaicUpdates.MAX_WHERE_ITEMS, 1]
+    queue.apply()
+    assert backend.calls == {'calculateField':3}
+    assert backend.fieldValue('S_RGB', nItems, 'SensorName') == 'WV02'
+
+def test_max_items_of_the_queue():
+    queue, backend = makeQueue({'D_RGB':range(1, 11)}, maxItems=4)
+    queue.synchronize('D_RGB', range(1, 11))
+    assert queue.apply() == [3, 0]
+    assert backend.calls == {'synchronize':3}
+
+def test_sync_all_overrides_item_syncs():
+    queue, backend = makeQueue({'D_RGB':range(1, 6)})
+    queue.synchronize('D_RGB', [1, 2])
+    queue.synchronize('D_RGB')
+    queue.synchronize('D_RGB', [3])
+    assert queue.pending() == [['synchronize', 'D_RGB', None, None, None]]
+    queue.apply()
+    assert [backend.synchronizedCount('D_RGB', x) for x in range(1, 6)] == [1] * 5
+    assert backend.calls == {'synchronize':1}
+
+def test_item_syncs_are_merged():
+    queue, backend = makeQueue({'D_RGB':range(1, 6)})
+    queue.synchronize('D_RGB', [4, 2])
+    queue.synchronize('D_RGB', [2, 5])
+    queue.apply()
+    assert [backend.synchronizedCount('D_RGB', x) for x in range(1, 6)] == [0, 1, 0, 1, 1]
+    assert backend.calls == {'synchronize':1}
+
+def test_calls_per_operation():
+    queue, backend = makeQueue({'S_WV02':range(1, 6), 'D_RGB':range(1, 3)})
+    queue.setField('S_WV02', 'SensorName', 'WorldView 2')
+    queue.setField('S_WV02', 'LeafStatus', 'On', [1, 2])
+    queue.setFunction('S_WV02', 'stretch_0.rft.xml', [1, 2, 3])
+    queue.setFunction('S_WV02', 'stretch_1.rft.xml', [4])
+    queue.setFunction('S_WV02', 'stretch_0.rft.xml', [5])
+    queue.synchronize('D_RGB')
+    operations = queue.pending()
+    assert [x[0] for x in operations] == ['calculateField', 'calculateField', 'editFunction', 'editFunction', 'synchronize']
+    assert queue.apply() == [5, 0]
+    assert backend.calls == {'calculateField':2, 'editFunction':2, 'synchronize':1}
+    assert backend.itemFunctions('S_WV02', 5) == ['stretch_0.rft.xml']
+    assert queue.pending() == []
+    assert queue.apply() == [0, 0]
+
+def test_function_is_replaced_on_every_apply():
+    queue, backend = makeQueue({'S_WV02':range(1, 4)})
+    queue.setFunction('S_WV02', 'stretch_0.rft.xml')
+    queue.apply()
+    queue.setFunction('S_WV02', 'stretch_1.rft.xml', [2])
+    queue.setFunction('S_WV02', 'mask.rft.xml', [3], functionName='Mask Function')
+    assert [x[2] for x in queue.pending()] == ['Mask Function', 'Stretch Function']
+    queue.apply()
+    assert [backend.itemFunctions('S_WV02', x) for x in range(1, 4)] == [['stretch_0.rft.xml'], ['stretch_1.rft.xml'],
+                                                                         ['stretch_0.rft.xml', 'mask.rft.xml']]
+
+class failingBackend(mosaicUpdates.localMosaicBackend):
+    ''' Local backend whose field updates fail on one service '''
+    def calculateField(self, service, field, value, oids=None):
+        if service == 'S_BROKEN':
+            self._count('calculateField')
+            raise(IOError("cannot update %s" % service))
+        mosaicUpdates.localMosaicBackend.calculateField(self, service, field, value, oids)
+
+def test_failed_operation_does_not_stop_apply():
+    queue, backend = makeQueue({'S_BROKEN':[1], 'S_WV02':[1], 'D_RGB':[1]}, backend=failingBackend())
+    queue.setField('S_BROKEN', 'SensorName', 'x')
+    queue.setField('S_WV02', 'SensorName', 'WorldView 2')
+    queue.synchronize('D_RGB')
+    assert queue.apply() == [3, 1]
+    assert backend.calls == {'calculateField':2, 'synchronize':1}
+    assert backend.fieldValue('S_WV02', 1, 'SensorName') == 'WorldView 2'
+    assert backend.synchronizedCount('D_RGB', 1) == 1
+
+def test_where_clause():
+    assert mosaicUpdates.whereClause(None) == ""
+    assert mosaicUpdates.whereClause([3, 1]) == "OBJECTID IN (3,1)"
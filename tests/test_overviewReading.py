@@ -0,0 +1,28 @@
+import numpy as np
+import rasterio
+
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from ImageryObjects import overviewReading
+
+def makeRaster(outFile, width, height, overviews=()):
+    with rasterio.open(outFile, 'w', driver='GTiff', width=width, height=height, count=1, dtype='uint8',
+                       crs='epsg:4326', transform=from_origin(0, 1, 0.001, 0.001), tiled=True) as dst:
+        dst.write(np.ones((1, height, width), dtype='uint8'))
+        if len(overviews) > 0:
+            dst.build_overviews(list(overviews), Resampling.nearest)
+    return(outFile)
+
+def test_chooseOverview(tmp_path):
+    inFile = makeRaster(str(tmp_path / "ovr.tif"), 4096, 2048, [2, 4, 8, 16])
+    with rasterio.open(inFile) as curRaster:
+        assert overviewReading.chooseOverview(curRaster, 1024) == 1
+        assert overviewReading.chooseOverview(curRaster, 300) == 2
+        #Every overview is smaller than asked for, the largest is used
+        assert overviewReading.chooseOverview(curRaster, 8192) == 0
+
+def test_chooseOverview_without_overviews(tmp_path):
+    with rasterio.open(makeRaster(str(tmp_path / "plain.tif"), 512, 256)) as curRaster:
+        assert overviewReading.chooseOverview(curRaster, 128) is None
+        assert overviewReading.sampleShape(curRaster, 128) == (64, 128)
+        assert overviewReading.sampleShape(curRaster, 1024) == (256, 512)
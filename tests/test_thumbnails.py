@@ -0,0 +1,41 @@
+import numpy as np
+import rasterio
+
+from rasterio.enums import ColorInterp
+from rasterio.transform import from_origin
+from shapely.geometry import box
+from ImageryObjects import thumbnails
+
+def makeTile(outFile, values, colorinterp=None):
+    ''' 16 x 16 tile in EPSG:4326 over (0, 0, 1, 1) with a constant value per band '''
+    data = np.array([np.full((16, 16), v, dtype='uint8') for v in values])
+    with rasterio.open(outFile, 'w', driver='GTiff', width=16, height=16, count=len(values), dtype='uint8',
+                       crs='epsg:4326', transform=from_origin(0, 1, 1 / 16.0, 1 / 16.0)) as dst:
+        dst.write(data)
+        if colorinterp is not None:
+            dst.colorinterp = colorinterp
+    return(outFile)
+
+def test_rgbBands(tmp_path):
+    bgrn = makeTile(str(tmp_path / "bgrn.tif"), [10, 20, 30, 40])
+    with rasterio.open(bgrn) as curRaster:
+        #GDAL reads 4 band 8 bit GeoTIFFs as RGBA, the vendor order comes first
+        assert thumbnails.rgbBands(curRaster) == [1, 2, 3]
+        assert thumbnails.rgbBands(curRaster, 'MAXAR') == [3, 2, 1]
+    bgr = makeTile(str(tmp_path / "bgr.tif"), [10, 20, 30], [ColorInterp.blue, ColorInterp.green, ColorInterp.red])
+    with rasterio.open(bgr) as curRaster:
+        assert thumbnails.rgbBands(curRaster, 'Airbus') == [3, 2, 1]
+    with rasterio.open(makeTile(str(tmp_path / "pan.tif"), [10])) as curRaster:
+        assert thumbnails.rgbBands(curRaster, 'MAXAR') == [1, 1, 1]
+
+def test_renderThumbnail_maxar_band_order(tmp_path):
+    tile = makeTile(str(tmp_path / "bgrn.tif"), [10, 20, 200, 40])
+    #Only the red band (third in BGRN) varies, every other band stretches to a constant
+    with rasterio.open(tile, 'r+') as dst:
+        dst.write(np.tile(np.arange(16, dtype='uint8') * 10, (16, 1)), 3)
+    outFile = thumbnails.renderThumbnail([[tile, box(0, 0, 1, 1)]], str(tmp_path / "thumb.jpg"), maxSize=16,
+                                         workers=1, vendor='MAXAR')
+    with rasterio.open(outFile) as thumb:
+        spread = [thumb.read(b).astype(float).std() for b in [1, 2, 3]]
+    assert spread[0] > 50
+    assert spread[1] < 5 and spread[2] < 5
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+
+from rasterio.control import GroundControlPoint
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+from ImageryObjects import tiledWriter
+
+def makeRaster(outFile, size=300):
+    with rasterio.open(outFile, 'w', driver='GTiff', width=size, height=size, count=3, dtype='uint8',
+                       crs='epsg:4326', transform=from_origin(0, 1, 1.0 / size, 1.0 / size)) as dst:
+        dst.write(np.arange(3 * size * size, dtype='uint32').reshape(3, size, size).astype('uint8'))
+    return(outFile)
+
+@pytest.mark.parametrize("cog", [False, True])
+def test_writeTiled(tmp_path, cog):
+    inFile = makeRaster(str(tmp_path / "in.tif"))
+    outFile = str(tmp_path / "out.tif")
+    report = tiledWriter.writeTiled(inFile, outFile, blockSize=128, cog=cog)
+    assert report['bytes'] == os.path.getsize(outFile)
+    assert tiledWriter.isValidTiled(outFile, 128)
+    with rasterio.open(inFile) as src, rasterio.open(outFile) as out:
+        assert out.crs == src.crs and out.transform == src.transform
+        assert (out.read() == src.read()).all()
+    assert sorted(os.listdir(str(tmp_path))) == ["in.tif", "out.tif"]
+
+@pytest.mark.parametrize("cog", [False, True])
+def test_failed_write_removes_partial_files(tmp_path, cog):
+    inFile = makeRaster(str(tmp_path / "in.tif"))
+    with pytest.raises(KeyError):
+        tiledWriter.writeTiled(inFile, str(tmp_path / "out.tif"), resampling="unknown", cog=cog)
+    assert sorted(os.listdir(str(tmp_path))) == ["in.tif"]
+
+@pytest.mark.parametrize("cog", [False, True])
+def test_writeTiled_keeps_metadata_and_gcps(tmp_path, cog):
+    inFile = str(tmp_path / "gcps.tif")
+    gcps = [GroundControlPoint(row, col, 30.0 + col / 1000.0, 10.0 - row / 1000.0)
+            for row, col in [(0, 0), (0, 299), (299, 0), (299, 299)]]
+    with rasterio.open(inFile, 'w', driver='GTiff', width=300, height=300, count=3, dtype='uint8') as dst:
+        dst.write(np.ones((3, 300, 300), dtype='uint8'))
+        dst.gcps = (gcps, CRS.from_epsg(4326))
+        dst.update_tags(ACQ="2016-06-11")
+        dst.update_tags(1, WAVELENGTH="blue")
+        dst.set_band_description(1, "Blue")
+    outFile = str(tmp_path / "out.tif")
+    tiledWriter.writeTiled(inFile, outFile, blockSize=128, cog=cog)
+    with rasterio.open(outFile) as out:
+        outGcps, gcpCrs = out.gcps
+        assert len(outGcps) == 4
+        assert gcpCrs == CRS.from_epsg(4326)
+        assert out.tags()['ACQ'] == "2016-06-11"
+        assert out.tags(1)['WAVELENGTH'] == "blue"
+        assert out.descriptions[0] == "Blue"
+        assert out.block_shapes[0] == (128, 128)
+        assert len(out.overviews(1)) > 0
@@ -0,0 +1,33 @@
+import logging
+
+import numpy as np
+import rasterio
+
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from shapely.geometry import box
+from ImageryObjects import validFootprints
+
+def makeCollared(outFile, overviews=()):
+    ''' 200 x 200 tile over (30, 9, 31, 10) with data in its left half only '''
+    data = np.zeros((1, 200, 200), dtype='uint8')
+    data[:, :, :100] = 50
+    with rasterio.open(outFile, 'w', driver='GTiff', width=200, height=200, count=1, dtype='uint8', nodata=0,
+                       crs='epsg:4326', transform=from_origin(30, 10, 1 / 200.0, 1 / 200.0), tiled=True) as dst:
+        dst.write(data)
+        if len(overviews) > 0:
+            dst.build_overviews(list(overviews), Resampling.nearest)
+    return(outFile)
+
+def test_outlined_from_overviews(tmp_path):
+    footprint = validFootprints.scanValidFootprints([makeCollared(str(tmp_path / "ovr.tif"), [2, 4])], 1, maxSize=64)[0]
+    assert footprint.symmetric_difference(box(30, 9, 30.5, 10)).area < 0.01
+
+def test_without_overviews_keeps_bounds_unless_decimated(tmp_path, caplog):
+    inFile = makeCollared(str(tmp_path / "raw.tif"))
+    with caplog.at_level(logging.INFO):
+        assert validFootprints.scanValidFootprints([inFile], 1, maxSize=64) == [None]
+    assert "1 kept their bounding box (1 without overviews)" in caplog.text
+    assert any(r.levelno == logging.WARNING and "decimateWithoutOverviews" in r.getMessage() for r in caplog.records)
+    footprint = validFootprints.scanValidFootprints([inFile], 1, maxSize=64, decimateWithoutOverviews=True)[0]
+    assert footprint.symmetric_difference(box(30, 9, 30.5, 10)).area < 0.01